@@ -0,0 +1,55 @@
+import importlib
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.append(str(Path(__file__).parents[1]))
+from benchmarks.synthetic_datasets import GENERATORS
+from conversion_helpers import source_column_types
+from csv_recordings import read_csv
+
+DELIMITERS = {
+    "who_is_alyx": ",",
+    "moore_cross_domain23": ",",
+    "liebers_lab_study21": ",",
+    "liebers_hand22": "\t",
+    "vr_net": ",",
+}
+
+
+def _column_types(module):
+    # the poses of vr_net are parsed from strings, so it declares its column types itself
+    if hasattr(module, "column_types"):
+        return module.column_types
+    return source_column_types(module.column_mapping)
+
+
+def _measure(read, recording_files):
+    start = time.perf_counter()
+    for recording_file in recording_files:
+        read(recording_file)
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    num_frames = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+
+    with tempfile.TemporaryDirectory() as tmp_path:
+        for dataset_name, delimiter in DELIMITERS.items():
+            module = importlib.import_module(f"{dataset_name}.convert")
+            dataset_path = Path(tmp_path) / dataset_name
+            GENERATORS[dataset_name](dataset_path, num_frames=num_frames)
+            recording_files = module._recording_files(dataset_path)
+            size_mb = sum(recording_file.stat().st_size for recording_file in recording_files) / 2**20
+
+            pandas_s = _measure(lambda path: pd.read_csv(path, sep=delimiter, low_memory=False), recording_files)
+            column_types = _column_types(module)
+            reader_s = _measure(lambda path: read_csv(path, column_types, delimiter), recording_files)
+
+            print(f"{dataset_name}: {len(recording_files)} files, {size_mb:.0f} MiB")
+            print(f"  pd.read_csv: {pandas_s:.3f}s, {size_mb / pandas_s:.0f} MiB/s")
+            print(f"  read_csv:    {reader_s:.3f}s, {size_mb / reader_s:.0f} MiB/s")
+            print(f"  speedup:     {pandas_s / reader_s:.1f}x")
@@ -0,0 +1,35 @@
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parents[1]))
+from benchmarks.transform_plan import synthetic_recording
+from csv_recordings import write_csv
+
+
+def _measure(write, file_path, repeat=3):
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        write(file_path)
+        durations.append(time.perf_counter() - start)
+    return min(durations)
+
+
+if __name__ == "__main__":
+    num_frames = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+
+    recording = synthetic_recording(num_frames, euler=False).assign(user=7, session="2022-01-01")
+    with tempfile.TemporaryDirectory() as tmp_path:
+        pandas_path, writer_path = Path(tmp_path) / "pandas.csv", Path(tmp_path) / "writer.csv"
+        pandas_s = _measure(lambda path: recording.round(3).to_csv(path, index=False), pandas_path)
+        writer_s = _measure(lambda path: write_csv(recording, path), writer_path)
+        if pandas_path.read_bytes() != writer_path.read_bytes():
+            raise Exception("the CSV writer does not match pandas, aborting")
+        size_mb = writer_path.stat().st_size / 2**20
+
+    print(f"{num_frames} frames, {recording.shape[1]} columns, {size_mb:.0f} MiB of CSV")
+    print(f"  round + to_csv: {pandas_s:.3f}s, {size_mb / pandas_s:.0f} MiB/s")
+    print(f"  write_csv:      {writer_s:.3f}s, {size_mb / writer_s:.0f} MiB/s")
+    print(f"  speedup:        {pandas_s / writer_s:.1f}x")
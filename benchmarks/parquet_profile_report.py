@@ -0,0 +1,119 @@
+import argparse
+import json
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+sys.path.append(str(Path(__file__).parents[1]))
+from npy_recordings import load_npy_recording
+from parquet_profiles import PROFILES, write_table
+
+# Arrow's defaults, as written without a profile
+DEFAULT_PROFILE = "default"
+
+
+def _recording_files(converted_path):
+    # the recordings of `format="csv"`, "parquet", "parquet_dataset" or "npy"
+    return sorted(
+        file_path
+        for suffix in ["csv", "parquet", "npy"]
+        for file_path in Path(converted_path).rglob(f"*.{suffix}")
+        if not file_path.name.startswith((".", "_"))
+    )
+
+
+def _load_recording(file_path):
+    if file_path.suffix == ".npy":
+        recording, metadata = load_npy_recording(file_path)
+        return recording.assign(**metadata)
+    if file_path.suffix == ".csv":
+        return pd.read_csv(file_path)
+    return pd.read_parquet(file_path)
+
+
+def _write(table, file_path, profile):
+    if profile == DEFAULT_PROFILE:
+        pq.write_table(table, file_path)
+    else:
+        write_table(table, file_path, profile)
+
+
+def _best_of(fn, repeat):
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        durations.append(time.perf_counter() - start)
+    return min(durations)
+
+
+def profile_report(tables, profiles, work_path, repeat=3):
+    """Writes and reads `tables` with each of `profiles` and returns their file size and the throughput of writing
+    and reading them, in MiB of uncompressed (in-memory) data per second."""
+    data_mb = sum(table.nbytes for table in tables) / 2**20
+    results = []
+    for profile in profiles:
+        file_paths = [Path(work_path) / f"{profile}-{i}.parquet" for i in range(len(tables))]
+
+        def write():
+            for table, file_path in zip(tables, file_paths):
+                _write(table, file_path, profile)
+
+        def read():
+            for file_path in file_paths:
+                pq.read_table(file_path).to_pandas()
+
+        write_s = _best_of(write, repeat)
+        # the files were just written, so they are read from the page cache, i.e. this measures decoding
+        read_s = _best_of(read, repeat)
+        file_mb = sum(file_path.stat().st_size for file_path in file_paths) / 2**20
+        results.append(
+            {
+                "profile": profile,
+                "file_mb": file_mb,
+                "compression_ratio": data_mb / file_mb,
+                "write_mb_per_s": data_mb / write_s,
+                "read_mb_per_s": data_mb / read_s,
+            }
+        )
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="writes a sample of converted recordings with each Parquet profile and reports size and speed"
+    )
+    parser.add_argument("converted_path", help="directory of a dataset converted to csv, parquet or npy")
+    parser.add_argument("--sample", type=int, default=20, help="number of recordings to sample")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--profiles", nargs="*", default=[DEFAULT_PROFILE, *PROFILES])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="file to write the JSON results to")
+    args = parser.parse_args()
+    if unknown_profiles := set(args.profiles) - {DEFAULT_PROFILE, *PROFILES}:
+        parser.error(f"unknown profiles {sorted(unknown_profiles)}, choose from {[DEFAULT_PROFILE, *PROFILES]}")
+
+    recording_files = _recording_files(args.converted_path)
+    if not recording_files:
+        parser.error(f"no converted recordings found in {args.converted_path}")
+    sample = random.Random(args.seed).sample(recording_files, min(args.sample, len(recording_files)))
+    tables = [pa.Table.from_pandas(_load_recording(file_path), preserve_index=False) for file_path in sample]
+
+    with tempfile.TemporaryDirectory() as tmp_path:
+        results = profile_report(tables, args.profiles, tmp_path, args.repeat)
+
+    print(f"{len(tables)} recordings, {sum(table.nbytes for table in tables) / 2**20:.1f} MiB in memory")
+    print(f"{'profile':<12} {'size MiB':>9} {'ratio':>6} {'write MiB/s':>12} {'read MiB/s':>11}")
+    for result in results:
+        print(
+            f"{result['profile']:<12} {result['file_mb']:>9.2f} {result['compression_ratio']:>6.2f}"
+            f" {result['write_mb_per_s']:>12.0f} {result['read_mb_per_s']:>11.0f}"
+        )
+    if args.output:
+        Path(args.output).write_text(json.dumps({"recordings": [str(path) for path in sample], "results": results}))
@@ -0,0 +1,109 @@
+import importlib
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(str(Path(__file__).parents[1]))
+from benchmarks.run_benchmarks import CONVERT_OPTIONS
+from benchmarks.synthetic_datasets import GENERATORS
+from conversion_helpers import JOINTS
+
+FORMATS = ["csv", "parquet"]
+
+
+def _convert(module, dataset_name, dataset_path, dtype):
+    recordings = module.convert(dataset_path, dtype=dtype, **CONVERT_OPTIONS.get(dataset_name, {}))
+    return [recording for recording, _metadata in recordings]
+
+
+def _output_bytes(module, dataset_name, dataset_path, output_path, format, dtype):
+    module.convert_and_store(
+        dataset_path, output_path, format=format, dtype=dtype, **CONVERT_OPTIONS.get(dataset_name, {})
+    )
+    return sum(path.stat().st_size for path in Path(output_path).rglob(f"*.{format}"))
+
+
+def _csv_differences(output_path, expected_output_path):
+    # the share of the values whose text in the CSV files differs, i.e. that round to other thousandths
+    num_values = num_differences = 0
+    for expected_file in sorted(Path(expected_output_path).rglob("*.csv")):
+        expected = pd.read_csv(expected_file, dtype=str, keep_default_na=False)
+        written = pd.read_csv(Path(output_path) / expected_file.relative_to(expected_output_path), dtype=str)
+        num_values += expected.size
+        num_differences += (written.fillna("").to_numpy() != expected.to_numpy()).sum()
+    return num_differences / num_values
+
+
+def _rotation_error(rotations, expected):
+    # the angle between two rotations, from the chord between their (sign-aligned) unit quaternions, which unlike
+    # arccos of their dot product is accurate for tiny angles
+    rotations = rotations / np.linalg.norm(rotations, axis=-1, keepdims=True)
+    expected = expected / np.linalg.norm(expected, axis=-1, keepdims=True)
+    signs = np.where((rotations * expected).sum(axis=-1, keepdims=True) < 0, -1, 1)
+    chord = np.linalg.norm(rotations * signs - expected, axis=-1)
+    return 4 * np.arcsin(np.clip(chord / 2, 0, 1))
+
+
+def compare(recordings, expected_recordings):
+    """Returns the largest deviation of `recordings` from `expected_recordings`: of the positions (in cm), the
+    rotations (in degrees), `delta_time_ms` (in ms) and all other float columns."""
+    errors = {"position_cm": 0.0, "rotation_deg": 0.0, "delta_time_ms": 0.0, "other": 0.0}
+    for recording, expected in zip(recordings, expected_recordings):
+        columns = [column for column in expected.columns if pd.api.types.is_float_dtype(expected[column])]
+        deviations = (recording[columns].astype(np.float64) - expected[columns]).abs().max()
+
+        position_columns = [column for column in columns if "_pos_" in column]
+        other_columns = [column for column in columns if not any(key in column for key in ["_pos_", "_rot_", "delta"])]
+        errors["position_cm"] = max(errors["position_cm"], np.max(deviations[position_columns].to_numpy(), initial=0))
+        errors["delta_time_ms"] = max(errors["delta_time_ms"], deviations.get("delta_time_ms", 0))
+        errors["other"] = max(errors["other"], np.max(deviations[other_columns].to_numpy(), initial=0))
+
+        for joint in JOINTS:
+            quaternion_columns = [f"{joint}_rot_{xyzw}" for xyzw in "xyzw"]
+            if all(column in expected for column in quaternion_columns):
+                angles = _rotation_error(
+                    recording[quaternion_columns].to_numpy(np.float64), expected[quaternion_columns].to_numpy()
+                )
+                errors["rotation_deg"] = max(errors["rotation_deg"], np.degrees(np.nanmax(angles, initial=0)))
+    return errors
+
+
+if __name__ == "__main__":
+    num_frames = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+
+    with tempfile.TemporaryDirectory() as tmp_path:
+        for dataset_name, generate in GENERATORS.items():
+            module = importlib.import_module(dataset_name)
+            dataset_path = Path(tmp_path) / "raw" / dataset_name
+            generate(dataset_path, num_frames=num_frames)
+
+            recordings = {
+                dtype: _convert(module, dataset_name, dataset_path, dtype) for dtype in ["float32", "float64"]
+            }
+            errors = compare(recordings["float32"], recordings["float64"])
+            memory = {
+                dtype: sum(recording.memory_usage(index=False).sum() for recording in recordings[dtype])
+                for dtype in recordings
+            }
+
+            print(f"{dataset_name}: {sum(len(recording) for recording in recordings['float64'])} frames")
+            print("  max deviation of float32 from float64:")
+            print(f"    positions:     {errors['position_cm']:.2e} cm")
+            print(f"    rotations:     {errors['rotation_deg']:.2e} deg")
+            print(f"    delta_time_ms: {errors['delta_time_ms']:.2e} ms")
+            print(f"    other columns: {errors['other']:.2e}")
+            print(f"  memory:          {memory['float32'] / memory['float64']:.2f}x of float64")
+            output_paths = {dtype: Path(tmp_path) / dtype / dataset_name for dtype in recordings}
+            for format in FORMATS:
+                output_bytes = {
+                    dtype: _output_bytes(
+                        module, dataset_name, dataset_path, output_paths[dtype] / format, format, dtype
+                    )
+                    for dtype in recordings
+                }
+                print(f"  {format + ':':<16} {output_bytes['float32'] / output_bytes['float64']:.2f}x of float64")
+            csv_differences = _csv_differences(output_paths["float32"] / "csv", output_paths["float64"] / "csv")
+            print(f"  csv values that differ: {csv_differences:.3%}")
@@ -0,0 +1,68 @@
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from scipy.spatial.transform import Rotation, Slerp
+
+sys.path.append(str(Path(__file__).parents[1]))
+from benchmarks.transform_plan import synthetic_recording
+from conversion_helpers import JOINTS
+from resampling import resample
+
+
+def _unit_quaternions(recording):
+    # a slow random walk, so that consecutive frames are close like in real recordings
+    rng = np.random.default_rng(1)
+    for joint in JOINTS:
+        rotations = Rotation.from_rotvec(np.cumsum(rng.normal(scale=0.05, size=(len(recording), 3)), axis=0))
+        recording[[f"{joint}_rot_{xyzw}" for xyzw in "xyzw"]] = rotations.as_quat()
+    return recording
+
+
+def scipy_resample(recording, rate_hz):
+    # per column `np.interp` and one `Slerp` per joint
+    times = recording["delta_time_ms"].to_numpy()
+    new_times = np.arange(times[0], times[-1] + 1e-9, 1000 / rate_hz)
+    resampled = {"delta_time_ms": new_times}
+    for column in recording.columns:
+        if "_pos_" in column:
+            resampled[column] = np.interp(new_times, times, recording[column].to_numpy())
+    for joint in JOINTS:
+        columns = [f"{joint}_rot_{xyzw}" for xyzw in "xyzw"]
+        rotations = Slerp(times, Rotation.from_quat(recording[columns].to_numpy()))(new_times)
+        resampled |= dict(zip(columns, rotations.as_quat().T))
+    return pd.DataFrame(resampled)[recording.columns]
+
+
+def _measure(fn, repeat=3):
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        durations.append(time.perf_counter() - start)
+    return min(durations), result
+
+
+if __name__ == "__main__":
+    num_frames = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+
+    recording = _unit_quaternions(synthetic_recording(num_frames, euler=False))
+    for rate_hz in [30, 60, 120]:
+        scipy_s, expected = _measure(lambda: scipy_resample(recording, rate_hz))
+        resample_s, resampled = _measure(lambda: resample(recording, rate_hz))
+
+        positions = [column for column in recording.columns if "_pos_" in column]
+        position_error = np.abs(resampled[positions] - expected[positions]).to_numpy().max()
+        rotation_error = 0
+        for joint in JOINTS:
+            columns = [f"{joint}_rot_{xyzw}" for xyzw in "xyzw"]
+            difference = Rotation.from_quat(resampled[columns]).inv() * Rotation.from_quat(expected[columns])
+            rotation_error = max(rotation_error, difference.magnitude().max())
+
+        print(f"{num_frames} frames at 90 Hz -> {len(resampled)} frames at {rate_hz} Hz")
+        print(f"  np.interp + Slerp: {scipy_s:.3f}s")
+        print(f"  resample:          {resample_s:.3f}s")
+        print(f"  speedup:           {scipy_s / resample_s:.1f}x")
+        print(f"  max deviation:     {position_error:.2e} (positions), {rotation_error:.2e} rad (rotations)")
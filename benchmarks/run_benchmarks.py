@@ -0,0 +1,157 @@
+import argparse
+import importlib
+import json
+import multiprocessing
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parents[1]))
+from benchmarks.synthetic_datasets import GENERATORS
+
+# options a module needs to convert all of the synthetic data
+CONVERT_OPTIONS = {"boxrr23": {"demo_mode": False}}
+
+
+def _peak_rss_mb():
+    # unlike ru_maxrss, which a spawned process inherits from the process that started it, VmHWM only covers the
+    # memory of the current process image
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _peak_worker_rss_mb():
+    # on Linux, ru_maxrss is in KiB
+    return resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+
+
+def _run_convert(dataset_name, dataset_path):
+    module = importlib.import_module(dataset_name)
+    start = time.perf_counter()
+    num_recordings = num_rows = 0
+    for recording, _metadata in module.convert(dataset_path, **CONVERT_OPTIONS.get(dataset_name, {})):
+        num_recordings += 1
+        num_rows += len(recording)
+    seconds = time.perf_counter() - start
+
+    return {"seconds": seconds, "recordings": num_recordings, "rows": num_rows, "peak_rss_mb": _peak_rss_mb()}
+
+
+def _run_convert_and_store(dataset_name, dataset_path, output_path, format, workers):
+    module = importlib.import_module(dataset_name)
+    start = time.perf_counter()
+    module.convert_and_store(
+        dataset_path,
+        output_path,
+        format=format,
+        workers=workers,
+        incremental=False,
+        **CONVERT_OPTIONS.get(dataset_name, {}),
+    )
+    seconds = time.perf_counter() - start
+
+    return {"seconds": seconds, "peak_rss_mb": _peak_rss_mb(), "peak_worker_rss_mb": _peak_worker_rss_mb()}
+
+
+def _reset_start_method():
+    # spawned processes inherit the start method "spawn", but worker pools should be started like in a regular run
+    multiprocessing.set_start_method(None, force=True)
+
+
+def _measure(fn, *args):
+    # every measurement runs in a fresh process, so that peak RSS and import caches do not carry over
+    with ProcessPoolExecutor(
+        max_workers=1, mp_context=multiprocessing.get_context("spawn"), initializer=_reset_start_method
+    ) as pool:
+        return pool.submit(fn, *args).result()
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=Path(__file__).parent, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(dataset_names, work_path, num_users, num_frames, format="csv", workers=1):
+    """Generates synthetic raw data for each dataset and times `convert` and `convert_and_store` on it."""
+    results = []
+    for dataset_name in dataset_names:
+        dataset_path = Path(work_path) / "raw" / dataset_name
+        if not dataset_path.exists():
+            GENERATORS[dataset_name](dataset_path, num_users=num_users, num_frames=num_frames)
+        source_files = [path for path in dataset_path.rglob("*") if path.is_file()]
+        source_mb = sum(path.stat().st_size for path in source_files) / 2**20
+
+        converted = _measure(_run_convert, dataset_name, dataset_path)
+        stored = _measure(
+            _run_convert_and_store,
+            dataset_name,
+            dataset_path,
+            Path(work_path) / "converted" / dataset_name,
+            format,
+            workers,
+        )
+
+        for stage, measurement in [("convert", converted), ("convert_and_store", stored)]:
+            results.append(
+                {
+                    "dataset": dataset_name,
+                    "stage": stage,
+                    "seconds": measurement["seconds"],
+                    "recordings": converted["recordings"],
+                    "rows": converted["rows"],
+                    "source_files": len(source_files),
+                    "source_mb": source_mb,
+                    "rows_per_s": converted["rows"] / measurement["seconds"],
+                    "files_per_s": len(source_files) / measurement["seconds"],
+                    "peak_rss_mb": measurement["peak_rss_mb"],
+                    "peak_worker_rss_mb": measurement.get("peak_worker_rss_mb"),
+                }
+            )
+        print(
+            f"{dataset_name}: convert {converted['seconds']:.2f}s, convert_and_store {stored['seconds']:.2f}s",
+            file=sys.stderr,
+        )
+
+    return {
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "parameters": {"num_users": num_users, "num_frames": num_frames, "format": format, "workers": workers},
+        "results": results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="times the converters on synthetic data and reports JSON results")
+    parser.add_argument("datasets", nargs="*", default=list(GENERATORS), help="default: all datasets")
+    parser.add_argument("--num-users", type=int, default=4)
+    parser.add_argument("--num-frames", type=int, default=5000)
+    parser.add_argument("--format", default="csv")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--work-path", help="where to put the synthetic data (reused if it exists) and the output")
+    parser.add_argument("--output", help="file to write the JSON results to, instead of stdout")
+    args = parser.parse_args()
+    if unknown_datasets := set(args.datasets) - set(GENERATORS):
+        parser.error(f"unknown datasets {sorted(unknown_datasets)}, choose from {list(GENERATORS)}")
+
+    with tempfile.TemporaryDirectory() as tmp_path:
+        report = run_benchmarks(
+            args.datasets, args.work_path or tmp_path, args.num_users, args.num_frames, args.format, args.workers
+        )
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+    else:
+        print(json.dumps(report, indent=2))
@@ -0,0 +1,227 @@
+import sys
+from pathlib import Path
+
+import bson
+import numpy as np
+import pandas as pd
+from scipy.spatial.transform import Rotation
+
+sys.path.append(str(Path(__file__).parents[1]))
+from benchmarks.vr_net_pose_parser import write_synthetic_pose_csv
+from liebers_beat_saber23.convert import dataset_file_name as beat_saber_file_name
+
+# synthetic raw data in the source layout of each dataset, just realistic enough for the converters to accept it
+
+
+def _positions(rng, num_frames):
+    return np.cumsum(rng.normal(0, 0.01, size=(num_frames, 3)), axis=0) + rng.uniform(-1, 1, size=3)
+
+
+def _rotations(rng, num_frames):
+    return Rotation.from_rotvec(np.cumsum(rng.normal(0, 0.05, size=(num_frames, 3)), axis=0))
+
+
+def _joint_columns(rng, num_frames, position_names, rotation_names, rotation="quat"):
+    positions = _positions(rng, num_frames)
+    rotations = _rotations(rng, num_frames)
+    rotations = rotations.as_quat() if rotation == "quat" else rotations.as_euler("xyz", degrees=True)
+
+    columns = dict(zip(position_names, positions.T))
+    columns.update(zip(rotation_names, rotations.T))
+    return columns
+
+
+def who_is_alyx(dataset_path, num_users=2, num_frames=1000, seed=0):
+    rng = np.random.default_rng(seed)
+    for user in range(1, num_users + 1):
+        for session in ["2022-01-01", "2022-01-02"]:
+            recording_path = Path(dataset_path) / "players" / str(user) / session
+            recording_path.mkdir(parents=True, exist_ok=True)
+
+            data = {"delta_time_ms": np.arange(num_frames) * (1000 / 90)}
+            for joint in ["hmd", "left_controller", "right_controller"]:
+                data.update(
+                    _joint_columns(
+                        rng,
+                        num_frames,
+                        [f"{joint}_pos_{xyz}" for xyz in "xyz"],
+                        [f"{joint}_rot_{xyz}" for xyz in "xyzw"],
+                    )
+                )
+            pd.DataFrame(data).to_csv(recording_path / "vr-controllers.csv", index=False)
+
+
+def moore_cross_domain23(dataset_path, num_users=2, num_frames=1000, seed=0):
+    rng = np.random.default_rng(seed)
+    data_path = Path(dataset_path) / "data"
+    data_path.mkdir(parents=True, exist_ok=True)
+    for user in range(num_users):
+        for build in ["B0", "B1"]:
+            data = {"Timestamp": np.arange(num_frames) / 90}
+            for joint in ["Head", "LeftHand", "RightHand"]:
+                data.update(
+                    _joint_columns(
+                        rng,
+                        num_frames,
+                        [f"{joint}_position_{xyz}" for xyz in "xyz"],
+                        [f"{joint}_quat_{xyz}" for xyz in "xyzw"],
+                    )
+                )
+            pd.DataFrame(data).to_csv(data_path / f"FAB{user:03d}A_{build}.csv", index=False)
+
+
+def liebers_hand22(dataset_path, num_users=2, num_frames=1000, num_hand_joints=24, seed=0):
+    rng = np.random.default_rng(seed)
+    Path(dataset_path).mkdir(parents=True, exist_ok=True)
+    for user in range(1, num_users + 1):
+        for session in [1, 2]:
+            for xr in ["AR", "VR"]:
+                data = {"Unity.realtimeSinceStartup": 10 + np.arange(num_frames) / 60}
+                for joint in ["HeadPosition", "L_Wrist", "R_Wrist"]:
+                    data.update(
+                        _joint_columns(
+                            rng,
+                            num_frames,
+                            [f"Unity.{joint}.position_{xyz}" for xyz in "xyz"],
+                            [f"Unity.{joint}.rotation.quaternion_{xyz}" for xyz in "xyzw"],
+                        )
+                    )
+                # the original recordings contain all hand joints, which the converter does not use
+                for joint in range(num_hand_joints):
+                    data.update(
+                        _joint_columns(
+                            rng,
+                            num_frames,
+                            [f"Unity.Joint{joint}.position_{xyz}" for xyz in "xyz"],
+                            [f"Unity.Joint{joint}.rotation.quaternion_{xyz}" for xyz in "xyzw"],
+                        )
+                    )
+                file_name = f"PID-{user}_SESSION-{session}_XR-{xr}_SCENE-Buttons.tsv"
+                pd.DataFrame(data).to_csv(Path(dataset_path) / file_name, sep="\t", index=False)
+
+
+def rmiller_ball22(dataset_path, num_users=2, num_frames=1000, num_repetitions=10, seed=0):
+    rng = np.random.default_rng(seed)
+    motions_path = Path(dataset_path) / "VR Motions"
+    motions_path.mkdir(parents=True, exist_ok=True)
+    frames_per_repetition = max(num_frames // num_repetitions, 2)
+    for system in ["Vive", "Quest"]:
+        for user in range(1, num_users + 1):
+            for session in [1, 2]:
+                for joint in ["Head", "Left", "Right"]:
+                    # one block of frames per repetition, separated by lines of asterisks
+                    blocks = []
+                    for _ in range(num_repetitions):
+                        block = pd.DataFrame(
+                            _joint_columns(rng, frames_per_repetition, ["x", "y", "z"], ["rx", "ry", "rz", "rw"])
+                        )[["x", "y", "z", "rw", "rx", "ry", "rz"]].assign(
+                            trigger=rng.integers(0, 2, frames_per_repetition)
+                        )
+                        blocks.append(block.to_csv(header=False, index=False, float_format="%.6f"))
+                    (motions_path / f"{system}_{user}_{session}_{joint}.csv").write_text(("*" * 20 + "\n").join(blocks))
+
+
+def vr_net(dataset_path, num_users=2, num_frames=1000, seed=0):
+    for game in ["Game0", "Game1"]:
+        for user in range(num_users):
+            recording_path = Path(dataset_path) / game / f"P{user:02d} 2023-01-01"
+            recording_path.mkdir(parents=True, exist_ok=True)
+            write_synthetic_pose_csv(recording_path / "pose.csv", num_frames, seed=seed + user)
+
+
+def liebers_beat_saber23(dataset_path, num_users=2, num_frames=1000, seed=0):
+    rng = np.random.default_rng(seed)
+    sessions = []
+    for user in range(num_users):
+        for session in range(2):
+            data = {
+                "session-uuid": f"{user:04d}-{session:04d}-{rng.integers(1e9)}",
+                "user-token": f"user-{user}",
+                "timestamp_ms": np.arange(num_frames) * 11,
+            }
+            for joint in ["head", "lcontroller", "rcontroller"]:
+                # the original data contains every rotation both as Euler angles and as quaternion
+                rotations = _rotations(rng, num_frames)
+                data.update(zip([f"frame-movements-pos-{xyz}-{joint}" for xyz in "xyz"], _positions(rng, num_frames).T))
+                data.update(
+                    zip(
+                        [f"frame-movements-euler-{xyz}-{joint}" for xyz in "xyz"],
+                        rotations.as_euler("xyz", degrees=True).T,
+                    )
+                )
+                data.update(zip([f"frame-movements-quat-{xyzw}-{joint}" for xyzw in "xyzw"], rotations.as_quat().T))
+            sessions.append(pd.DataFrame(data))
+
+    Path(dataset_path).mkdir(parents=True, exist_ok=True)
+    pd.concat(sessions).to_csv(Path(dataset_path) / beat_saber_file_name, index=False)
+
+
+def liebers_lab_study21(dataset_path, num_users=2, num_frames=1000, seed=0):
+    rng = np.random.default_rng(seed)
+    Path(dataset_path).mkdir(parents=True, exist_ok=True)
+    for scene in ["Bowling", "Archery"]:
+        for user in range(num_users):
+            for session in ["Session1", "Session2"]:
+                for repetition in range(2):
+                    data = {"timestamp_ms": np.arange(num_frames) * 11}
+                    for joint in ["CenterEyeAnchor", "LeftControllerAnchor", "RightControllerAnchor"]:
+                        data.update(
+                            _joint_columns(
+                                rng,
+                                num_frames,
+                                [f"{joint}_pos_{xyz}" for xyz in "XYZ"],
+                                [f"{joint}_euler_{xyz}" for xyz in "XYZ"],
+                                rotation="euler",
+                            )
+                        )
+                    file_name = f"{scene}_U{user:02d}_Normalized_{session}_{repetition}.csv"
+                    pd.DataFrame(data).to_csv(Path(dataset_path) / file_name, index=False)
+
+
+def boxrr23(dataset_path, num_users=2, num_frames=1000, seed=0):
+    # XROR files are BSON documents; the frames are stored as one raw little-endian float32 payload
+    rng = np.random.default_rng(seed)
+    for user in range(num_users):
+        user_path = Path(dataset_path) / f"user{user:04d}"
+        user_path.mkdir(parents=True, exist_ok=True)
+        for recording, app in enumerate(["Beat Saber", "Tilt Brush"]):
+            timestamps = 100 + np.arange(num_frames) / 72
+            if app == "Beat Saber":
+                joints = [np.concatenate([_positions(rng, num_frames), _rotations(rng, num_frames).as_quat()], axis=1)]
+                frames = np.concatenate([timestamps[:, None]] + joints * 3, axis=1)
+            else:
+                frames = np.column_stack(
+                    [
+                        timestamps,
+                        _positions(rng, num_frames) * 10,
+                        _rotations(rng, num_frames).as_quat(),
+                        rng.integers(0, 2, num_frames),
+                    ]
+                )
+            document = {
+                "info": {"user": {"id": f"user{user:04d}"}, "software": {"app": {"name": app}}},
+                "frames": frames.astype("<f4").tobytes(),
+            }
+            (user_path / f"{recording:04d}.xror").write_bytes(bson.encode(document))
+
+
+GENERATORS = {
+    "who_is_alyx": who_is_alyx,
+    "moore_cross_domain23": moore_cross_domain23,
+    "liebers_hand22": liebers_hand22,
+    "rmiller_ball22": rmiller_ball22,
+    "vr_net": vr_net,
+    "liebers_beat_saber23": liebers_beat_saber23,
+    "liebers_lab_study21": liebers_lab_study21,
+    "boxrr23": boxrr23,
+}
+
+
+if __name__ == "__main__":
+    output_path = Path(sys.argv[1])
+    num_users = int(sys.argv[2]) if len(sys.argv) > 2 else 2
+    num_frames = int(sys.argv[3]) if len(sys.argv) > 3 else 1000
+
+    for dataset_name, generate in GENERATORS.items():
+        generate(output_path / dataset_name, num_users=num_users, num_frames=num_frames)
+        print(f"generated {dataset_name}")
@@ -0,0 +1,69 @@
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(str(Path(__file__).parents[1]))
+from conversion_helpers import (
+    JOINTS,
+    RUB_TO_RUF,
+    TransformPlan,
+    _convert_coord_system_from_RUB_to_RUF,
+    _convert_m_to_cm,
+    _euler_to_quat,
+)
+
+
+def synthetic_recording(num_frames, euler, seed=0):
+    rng = np.random.default_rng(seed)
+    data = {"delta_time_ms": np.arange(num_frames) * (1000 / 90)}
+    for joint in JOINTS:
+        for xyz in "xyz":
+            data[f"{joint}_pos_{xyz}"] = rng.normal(size=num_frames)
+        for xyz in "xyz" if euler else "xyzw":
+            data[f"{joint}_rot_{xyz}"] = (
+                rng.uniform(-180, 180, size=num_frames) if euler else rng.normal(size=num_frames)
+            )
+    return pd.DataFrame(data)
+
+
+def _measure(fn, df, repeat=3):
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(df)
+        durations.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    result = fn(df)
+    _current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return min(durations), peak, result
+
+
+if __name__ == "__main__":
+    num_frames = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+
+    for euler in [False, True]:
+        df = synthetic_recording(num_frames, euler)
+        plan = TransformPlan(position_scale=100, flip_axes=RUB_TO_RUF, euler_to_quat=euler)
+
+        def chained_helpers(df):
+            if euler:
+                df = _euler_to_quat(df)
+            return df.pipe(_convert_m_to_cm).pipe(_convert_coord_system_from_RUB_to_RUF)
+
+        helpers_s, helpers_peak, expected = _measure(chained_helpers, df)
+        plan_s, plan_peak, actual = _measure(plan.apply, df)
+        pd.testing.assert_frame_equal(actual[expected.columns], expected, check_exact=True)
+
+        print(
+            f"{'euler' if euler else 'quaternion'} input, {num_frames} frames, {df.memory_usage().sum() / 2**20:.0f} MiB"
+        )
+        print(f"  helpers:        {helpers_s:.3f}s, peak {helpers_peak / 2**20:.0f} MiB")
+        print(f"  transform plan: {plan_s:.3f}s, peak {plan_peak / 2**20:.0f} MiB")
+        print(f"  speedup:        {helpers_s / plan_s:.1f}x")
@@ -0,0 +1,63 @@
+import importlib
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parents[1]))
+from benchmarks.run_benchmarks import CONVERT_OPTIONS
+from benchmarks.synthetic_datasets import GENERATORS
+from recording_validation import ValidationRules, validate
+
+
+def _best_of(fn, repeat):
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        durations.append(time.perf_counter() - start)
+    return min(durations), result
+
+
+def validation_overhead(module, dataset_name, dataset_path, repeat=3, rules=ValidationRules()):
+    """Returns the time to convert the dataset at `dataset_path` with `module` and the time to validate all its
+    recordings, in seconds, each the best of `repeat` runs."""
+    convert_s, recordings = _best_of(
+        lambda: [
+            recording for recording, _metadata in module.convert(dataset_path, **CONVERT_OPTIONS.get(dataset_name, {}))
+        ],
+        repeat,
+    )
+    validate_s, _reports = _best_of(lambda: [validate(recording, rules) for recording in recordings], repeat)
+    return {
+        "frames": sum(len(recording) for recording in recordings),
+        "convert_s": convert_s,
+        "validate_s": validate_s,
+        "overhead": validate_s / convert_s,
+    }
+
+
+if __name__ == "__main__":
+    num_frames = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+
+    skipped = {}
+    print(f"{'dataset':<24} {'frames':>9} {'convert s':>10} {'validate s':>11} {'overhead':>9}")
+    with tempfile.TemporaryDirectory() as tmp_path:
+        for dataset_name, generate in GENERATORS.items():
+            try:
+                module = importlib.import_module(dataset_name)
+            except ImportError as error:
+                # e.g. boxrr23 without `xror`
+                skipped[dataset_name] = error
+                continue
+            dataset_path = Path(tmp_path) / dataset_name
+            generate(dataset_path, num_frames=num_frames)
+
+            result = validation_overhead(module, dataset_name, dataset_path)
+            print(
+                f"{dataset_name:<24} {result['frames']:>9} {result['convert_s']:>10.3f} {result['validate_s']:>11.4f}"
+                f" {result['overhead']:>9.1%}"
+            )
+
+    for dataset_name, error in skipped.items():
+        print(f"skipped {dataset_name}, it cannot be imported: {error}")
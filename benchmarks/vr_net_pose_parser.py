@@ -0,0 +1,112 @@
+import sys
+import tempfile
+import time
+from datetime import datetime
+from functools import partial
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from scipy.spatial.transform import Rotation
+
+sys.path.append(str(Path(__file__).parents[1]))
+from conversion_helpers import _convert_m_to_cm
+from vr_net.convert import columns, load_and_convert_recording
+
+
+def _load_and_convert_recording_iterrows(file_path):
+    # the previous, row-by-row implementation of `vr_net.load_and_convert_recording`, kept as reference
+    df = pd.read_csv(file_path).sort_values(["timestamp", "device_id"])
+
+    origin = [0, 0, 0, 1]
+
+    frames_np = np.zeros((df["framecounter"].max() + 1, len(columns)))
+    frames_np[:] = np.nan
+    timestamps = np.zeros(len(frames_np), dtype=datetime)
+    timestamps[:] = np.nan
+
+    for _, row in df.iterrows():
+        if not row["timestamp"]:
+            continue
+        points = list(map(float, row["deviceToAbsoluteTracking"].split()))
+
+        t_mat = np.array(
+            [
+                [points[0], points[1], points[2], points[3]],
+                [points[4], points[5], points[6], points[7]],
+                [points[8], points[9], points[10], points[11]],
+                [0, 0, 0, 1],
+            ]
+        )
+        position = np.matmul(t_mat, origin)
+        rotation = Rotation.from_matrix(t_mat[0:3, 0:3]).as_quat()
+
+        device_id = row["device_id"]
+        frame_idx = row["framecounter"]
+        timestamps[frame_idx] = row["timestamp"] / 1000
+        frames_np[frame_idx, device_id * 7 : (device_id + 1) * 7] = np.concatenate([position[:3], rotation])
+
+    recording = (
+        pd.DataFrame(frames_np, columns=columns)
+        .assign(timestamp=pd.to_timedelta(timestamps - np.nanmin(timestamps), unit="s"))
+        .dropna(subset="timestamp")
+        .set_index("timestamp")
+        .interpolate(method="time")
+        .assign(delta_time_ms=lambda df: (df.index.total_seconds() * 1000).round().astype(int))
+        .pipe(_convert_m_to_cm)
+        .dropna()
+        .reset_index(drop=True)
+    )
+
+    return recording
+
+
+def write_synthetic_pose_csv(file_path, num_frames, seed=0):
+    rng = np.random.default_rng(seed)
+    rows = []
+    for device_id in range(3):
+        positions = np.cumsum(rng.normal(0, 0.01, size=(num_frames, 3)), axis=0)
+        rotations = Rotation.from_rotvec(np.cumsum(rng.normal(0, 0.05, size=(num_frames, 3)), axis=0)).as_matrix()
+        t_mats = np.concatenate([rotations, positions[:, :, None]], axis=2).reshape(num_frames, 12)
+        # drop some samples and add a few without timestamp, as they occur in the original data
+        for frame_idx in np.flatnonzero(rng.random(num_frames) > 0.05):
+            rows.append(
+                (
+                    0 if rng.random() < 0.01 else 1_600_000_000_000 + frame_idx * 11 + device_id,
+                    device_id,
+                    frame_idx,
+                    " ".join(f"{v:.6f}" for v in t_mats[frame_idx]),
+                )
+            )
+
+    pd.DataFrame(rows, columns=["timestamp", "device_id", "framecounter", "deviceToAbsoluteTracking"]).sample(
+        frac=1, random_state=seed
+    ).to_csv(file_path, index=False)
+
+
+def _time(fn, *args, repeat):
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args)
+        durations.append(time.perf_counter() - start)
+    return min(durations), result
+
+
+if __name__ == "__main__":
+    num_frames = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        pose_file = Path(tmp_dir) / "pose.csv"
+        write_synthetic_pose_csv(pose_file, num_frames)
+
+        iterrows_s, expected = _time(_load_and_convert_recording_iterrows, pose_file, repeat=1)
+        # the reference works in float64 throughout
+        vectorized_s, actual = _time(partial(load_and_convert_recording, dtype="float64"), pose_file, repeat=3)
+
+    pd.testing.assert_frame_equal(actual, expected, check_exact=True)
+
+    print(f"frames:     {num_frames}")
+    print(f"iterrows:   {iterrows_s:.3f}s")
+    print(f"vectorized: {vectorized_s:.3f}s")
+    print(f"speedup:    {iterrows_s / vectorized_s:.1f}x")
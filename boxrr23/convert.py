@@ -1,4 +1,7 @@
+import struct
 import sys
+from functools import partial
+import numpy as np
 import pandas as pd
 from xror import XROR
 from pathlib import Path
@@ -6,7 +9,15 @@ import bson
 from tqdm import tqdm
 
 sys.path.append(str(Path(__file__).parents[1]))
-from conversion_helpers import _convert_coord_system_from_RUB_to_RUF, _convert_m_to_cm, _convert_dm_to_cm
+from conversion_helpers import POSE_DTYPE, RUB_TO_RUF, TransformPlan
+from conversion_pipeline import RecordingHandle, convert_and_store_tasks, prefetch_tasks, shard_tasks, write_recording
+from instrumentation import stage
+from .xror_mmap import read_info, read_recording
+
+CONVERTER_VERSION = 2
+
+partition_columns = ["user"]
+metadata_fields = ["user", "session", "app"]
 
 beatsaber_column_names = [
     "delta_time_ms",
@@ -56,7 +67,7 @@ def load_recording(recording_file):
     return recording
 
 
-def convert(dataset_path, demo_mode=True):
+def _recording_files(dataset_path, demo_mode):
     if demo_mode:
         max_users = 5
         max_recs_per_user = 5
@@ -67,55 +78,128 @@ def convert(dataset_path, demo_mode=True):
     else:
         max_users = None
         max_recs_per_user = None
-    user_dirs = list(Path(dataset_path).glob("*"))[:max_users]
+    # sorted, so that the demo subset does not depend on the order in which the filesystem lists the files
+    user_dirs = sorted(Path(dataset_path).glob("*"))[:max_users]
+
+    return [
+        recording_file
+        for user_dir in user_dirs
+        for recording_file in sorted(user_dir.glob("*.xror"))[:max_recs_per_user]
+    ]
+
+
+def _app_settings(app):
+    # returns column names, time scaling and the transform plan of the app's frames
+    if app == "Beat Saber":
+        return beatsaber_column_names, 1000, TransformPlan(position_scale=100, flip_axes=RUB_TO_RUF)
+    elif app == "Tilt Brush":
+        return tilt_brush_column_names, 1, TransformPlan(position_scale=10, flip_axes=RUB_TO_RUF)
+    else:
+        raise Exception("Unknown App")
 
-    for user_dir in tqdm(user_dirs, desc="processing users"):
-        recording_files = list(user_dir.glob("*.xror"))[:max_recs_per_user]
-        for recording_file in recording_files:
-            recording = load_recording(recording_file)
 
-            user = recording.data["info"]["user"]["id"]
-            app = recording.data["info"]["software"]["app"]["name"]
+def _convert_frames(frames, app, dtype=POSE_DTYPE):
+    # converts the poses of the frame array in place, as `dtype`; the frames are recorded as float32, so with the
+    # default dtype, they are neither widened nor copied (and scaling a float32 by 10 or 100 in float32 rounds exactly
+    # like doing it in float64 and casting back); `delta_time_ms` is computed and kept as float64
+    column_names, time_scaling, transform_plan = _app_settings(app)
 
-            if app == "Beat Saber":
-                column_names = beatsaber_column_names
-                time_scaling = 1000
-                unit_converter = _convert_m_to_cm
-            elif app == "Tilt Brush":
-                column_names = tilt_brush_column_names
-                time_scaling = 1
-                unit_converter = _convert_dm_to_cm
-            else:
-                raise Exception("Unknown App")
+    timestamps = frames[:, 0].astype(np.float64)
+    poses = frames[:, 1:].astype(dtype, copy=False)
+    transform_plan.apply_array(poses, column_names[1:])
 
-            df = (
-                pd.DataFrame(recording.data["frames"], columns=column_names)
-                .pipe(unit_converter)
-                .pipe(_convert_coord_system_from_RUB_to_RUF)
-                .assign(delta_time_ms=lambda df: (df["delta_time_ms"] - df["delta_time_ms"].iloc[0]) * time_scaling)
-            )
+    df = pd.DataFrame(poses, columns=column_names[1:], copy=False)
+    df.insert(0, "delta_time_ms", (timestamps - timestamps[0]) * time_scaling)
+    return df
 
-            for col in df.select_dtypes(include=["float64"]).columns:
-                df[col] = df[col].astype("float32")
 
-            session = recording_file.stem
-            yield df, (user, session, app)
+def _convert_file(recording_file, dtype=POSE_DTYPE):
+    frame_widths = {"Beat Saber": len(beatsaber_column_names), "Tilt Brush": len(tilt_brush_column_names)}
+    try:
+        with stage("read", recording_file) as measurement:
+            info, frames = read_recording(recording_file, frame_widths)
+            measurement.rows = None if frames is None else len(frames)
+    except (bson.errors.InvalidBSON, ValueError, struct.error):
+        print(f"WARNING: error while trying to read {recording_file}, skipping...")
+        return
 
+    user = info["user"]["id"]
+    app = info["software"]["app"]["name"]
 
-def convert_and_store(dataset_path, output_path, format="csv", demo_mode=True):
-    output_path = Path(output_path)
+    if frames is not None:
+        with stage("transform"):
+            df = _convert_frames(frames, app, dtype)
+    else:
+        # the frames are not stored as a raw float32 payload, so let XROR decode them
+        with stage("parse"):
+            recording = load_recording(recording_file)
+        if recording is None:
+            return
+        with stage("transform"):
+            df = _convert_frames(np.asarray(recording.data["frames"], dtype=np.float64), app, dtype)
+
+    session = recording_file.stem
+    yield df, (user, session, app)
+
+
+def convert(dataset_path, demo_mode=True, prefetch=0, shard_index=0, num_shards=1, dtype=POSE_DTYPE):
+    recording_files = shard_tasks(_recording_files(dataset_path, demo_mode), shard_index, num_shards)
+    for recording_file in tqdm(
+        prefetch_tasks(recording_files, prefetch), total=len(recording_files), desc="processing recordings"
+    ):
+        yield from _convert_file(recording_file, dtype)
+
+
+def discover(dataset_path, demo_mode=True, dtype=POSE_DTYPE):
+    # only the `info` document of each file is decoded, the frames are skipped
+    convert_file = partial(_convert_file, dtype=dtype)
+    handles = []
+    for recording_file in _recording_files(dataset_path, demo_mode):
+        try:
+            info = read_info(recording_file)
+        except (bson.errors.InvalidBSON, KeyError, ValueError, struct.error):
+            print(f"WARNING: error while trying to read {recording_file}, skipping...")
+            continue
+        metadata = (info["user"]["id"], recording_file.stem, info["software"]["app"]["name"])
+        handles.append(RecordingHandle(recording_file, dict(zip(metadata_fields, metadata)), convert_file))
+    return handles
+
+
+def _store_recording(recording, metadata, output_path, format, **write_options):
+    user, session, app = metadata
+    output_file_path = output_path / user / session
+
+    with stage("metadata"):
+        recording = recording.assign(user=user, session=session, app=app)
 
-    output_path.mkdir(parents=True, exist_ok=True)
-    for recording, (user, session, app) in convert(dataset_path, demo_mode):
-        output_file_path = output_path / user / session
-        output_file_path.parents[0].mkdir(exist_ok=True, parents=True)
+    return write_recording(recording, output_file_path, format, **write_options)
 
-        recording = recording.assign(user=user, session=session, app=app)
 
-        match format.lower():
-            case "csv":
-                recording.round(3).to_csv(output_file_path.with_suffix(".csv"), index=False)
-            case "parquet":
-                recording.to_parquet(output_file_path.with_suffix(".parquet"))
-            case _:
-                raise Exception("unkown output format, aborting")
+def convert_and_store(
+    dataset_path,
+    output_path,
+    format="csv",
+    demo_mode=True,
+    handles=None,
+    shard_index=0,
+    num_shards=1,
+    dtype=POSE_DTYPE,
+    **pipeline_options,
+):
+    output_path = Path(output_path)
+
+    output_path.mkdir(parents=True, exist_ok=True)
+    tasks = _recording_files(dataset_path, demo_mode) if handles is None else [handle.task for handle in handles]
+    convert_and_store_tasks(
+        shard_tasks(tasks, shard_index, num_shards),
+        partial(_convert_file, dtype=dtype),
+        _store_recording,
+        output_path,
+        format,
+        converter_version=CONVERTER_VERSION,
+        partition_columns=partition_columns,
+        options={"dtype": dtype},
+        shard_index=shard_index,
+        num_shards=num_shards,
+        **pipeline_options,
+    )
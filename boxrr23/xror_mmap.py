@@ -0,0 +1,112 @@
+import mmap
+import struct
+
+import bson
+import numpy as np
+
+# sizes of the fixed-length BSON value types, see https://bsonspec.org/spec.html
+_FIXED_VALUE_SIZES = {
+    0x01: 8,  # double
+    0x06: 0,  # undefined
+    0x07: 12,  # ObjectId
+    0x08: 1,  # boolean
+    0x09: 8,  # UTC datetime
+    0x0A: 0,  # null
+    0x10: 4,  # int32
+    0x11: 8,  # timestamp
+    0x12: 8,  # int64
+    0x13: 16,  # decimal128
+    0x7F: 0,  # max key
+    0xFF: 0,  # min key
+}
+_BINARY = 0x05
+_DOCUMENT = 0x03
+
+
+def _value_size(buffer, element_type, offset):
+    if element_type in _FIXED_VALUE_SIZES:
+        return _FIXED_VALUE_SIZES[element_type]
+    match element_type:
+        case 0x02 | 0x0D | 0x0E:  # string, JavaScript code, symbol
+            return 4 + struct.unpack_from("<i", buffer, offset)[0]
+        case 0x03 | 0x04 | 0x0F:  # document, array, code with scope
+            return struct.unpack_from("<i", buffer, offset)[0]
+        case 0x05:  # binary
+            return 5 + struct.unpack_from("<i", buffer, offset)[0]
+        case 0x0B:  # regular expression
+            return buffer.find(b"\x00", buffer.find(b"\x00", offset) + 1) + 1 - offset
+        case 0x0C:  # DBPointer
+            return 4 + struct.unpack_from("<i", buffer, offset)[0] + 12
+    raise bson.errors.InvalidBSON(f"unknown element type {element_type:#x}")
+
+
+def _top_level_elements(buffer):
+    # maps the names of the top-level elements of a BSON document to their type and value offset,
+    # without decoding any of the values
+    if len(buffer) < 5:
+        raise bson.errors.InvalidBSON("document too short")
+    (size,) = struct.unpack_from("<i", buffer, 0)
+    if size != len(buffer):
+        raise bson.errors.InvalidBSON("document size does not match file size")
+
+    elements = {}
+    position = 4
+    while position < size - 1:
+        element_type = buffer[position]
+        name_end = buffer.find(b"\x00", position + 1)
+        if name_end < 0:
+            raise bson.errors.InvalidBSON("unterminated element name")
+        name = buffer[position + 1 : name_end].decode()
+        elements[name] = (element_type, name_end + 1)
+        position = name_end + 1 + _value_size(buffer, element_type, name_end + 1)
+
+    if position != size - 1:
+        raise bson.errors.InvalidBSON("elements exceed document size")
+    return elements
+
+
+def _decode_document(buffer, element):
+    element_type, offset = element
+    if element_type != _DOCUMENT:
+        raise bson.errors.InvalidBSON("expected an embedded document")
+    (size,) = struct.unpack_from("<i", buffer, offset)
+    return bson.decode(buffer[offset : offset + size])
+
+
+def read_info(recording_file):
+    """Returns the `info` document of an XROR file without decoding its frames."""
+    with open(recording_file, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+        return _decode_document(buffer, _top_level_elements(buffer)["info"])
+
+
+def read_recording(recording_file, frame_widths):
+    """Reads the `info` document and the frames of an XROR file.
+
+    The frame payload is copied from the memory-mapped file straight into a preallocated `(num_frames, width)`
+    float32 array, with `width = frame_widths[app name]`. Returns `(info, None)` if the frames are not stored as
+    a raw float32 payload of that width, so callers can fall back to `XROR.unpack`.
+    """
+    with open(recording_file, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+        elements = _top_level_elements(buffer)
+        info = _decode_document(buffer, elements["info"])
+
+        width = frame_widths.get(info["software"]["app"]["name"])
+        element_type, offset = elements.get("frames", (None, None))
+        if width is None or element_type != _BINARY:
+            return info, None
+
+        num_bytes, subtype = struct.unpack_from("<iB", buffer, offset)
+        num_frames = num_bytes // (4 * width)
+        if subtype != 0 or num_frames == 0 or num_bytes != num_frames * 4 * width:
+            return info, None
+
+        frames = np.empty((num_frames, width), dtype=np.float32)
+        np.copyto(frames.reshape(-1), np.frombuffer(buffer, dtype="<f4", count=num_frames * width, offset=offset + 5))
+
+    # the payload carries no shape information, so make sure it looks like frames before trusting it:
+    # the first column holds the timestamps, which have to be finite and must not decrease
+    timestamps = frames[:, 0]
+    if not np.isfinite(timestamps).all() or (np.diff(timestamps) < 0).any():
+        return info, None
+
+    return info, frames
@@ -1,4 +1,10 @@
-from scipy.spatial.transform import Rotation as R
+import re
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from quaternions import euler_to_quat, standardize
 
 JOINTS = ["head", "left_hand", "right_hand"]
 
@@ -35,8 +41,123 @@ def _convert_coord_system_from_RUB_to_RUF(df):
 
 def _euler_to_quat(df):
     df = df.copy()
-    for joint in JOINTS:
-        quat_columns = [f"{joint}_rot_{xyz}" for xyz in "xyzw"]
-        euler_columns = [f"{joint}_rot_{xyz}" for xyz in "xyz"]
-        df[quat_columns] = R.from_euler("xyz", df[euler_columns], degrees=True).as_quat(canonical=True)
+    euler_columns = [f"{joint}_rot_{xyz}" for joint in JOINTS for xyz in "xyz"]
+    quat_columns = [f"{joint}_rot_{xyzw}" for joint in JOINTS for xyzw in "xyzw"]
+    # one batched conversion for all joints, as (num_frames, num_joints, 3) Euler angles
+    eulers = df[euler_columns].to_numpy().reshape(len(df), len(JOINTS), 3)
+    df[quat_columns] = euler_to_quat(eulers).reshape(len(df), -1)
     return df
+
+
+# mirroring the z axis converts Unity's left-handed RUB coordinates into RUF; for quaternions this
+# corresponds to negating their z and w components
+RUB_TO_RUF = ("z", "w")
+
+_JOINT_COLUMN = re.compile(rf"^(?:{'|'.join(JOINTS)})_(?:pos|rot)_[xyzw]$")
+
+# the joint columns are converted as float32 by default, which resolves positions within 10 m to a micrometer, more
+# precisely than any tracking system; times stay float64, since float32 milliseconds are only exact to a quarter
+# millisecond after an hour of recording
+POSE_DTYPE = "float32"
+
+
+def source_column_types(column_mapping, dtype=POSE_DTYPE):
+    """Returns the dtypes to parse the source columns of `column_mapping` (source column -> standardized column) as:
+    joint columns as `dtype`, all other columns (like times) as float64."""
+    return {source: dtype if _JOINT_COLUMN.match(column) else "float64" for source, column in column_mapping.items()}
+
+
+def joint_frames(recording):
+    """Returns the joint columns of `recording` as one array of shape `(num_frames, num_joint_columns)` in their own
+    dtype, along with their names."""
+    columns = list(recording.columns)
+    joint_indices = [index for index, column in enumerate(columns) if _JOINT_COLUMN.match(column)]
+    # taken by position, which is much cheaper than selecting them by name; converting the whole recording instead
+    # would upcast the float32 joint columns to the float64 of `delta_time_ms`
+    return recording.take(joint_indices, axis=1).to_numpy(), [columns[index] for index in joint_indices]
+
+
+@dataclass(frozen=True)
+class TransformPlan:
+    """Declares how the joint columns of a recording are converted into the standardized format.
+
+    Applying a plan is equivalent to chaining `_euler_to_quat` (if `euler_to_quat` is set), a unit conversion that
+    multiplies all position columns by `position_scale` and negating all columns ending in one of `flip_axes`
+    (e.g. `RUB_TO_RUF`), but the joint columns are copied only once into a contiguous block of `dtype` (by default
+    the common dtype of the joint columns), which is then transformed in place in one vectorized pass.
+
+    With `normalize_quaternions`, the quaternions of all joints are then scaled to unit length, and with
+    `continuous_quaternions`, their signs are made consistent over time (see `quaternions.standardize`), which
+    matters for Euler angles in particular, as their canonical quaternions flip sign whenever w crosses 0.
+    """
+
+    position_scale: float = 1
+    flip_axes: tuple = ()
+    euler_to_quat: bool = False
+    dtype: object = None
+    normalize_quaternions: bool = False
+    continuous_quaternions: bool = False
+
+    def factors(self, columns, dtype=np.float64):
+        factors = np.ones(len(columns), dtype=dtype)
+        for i, c in enumerate(columns):
+            if "_pos_" in c:
+                factors[i] *= self.position_scale
+            if c[-1] in self.flip_axes:
+                factors[i] *= -1
+        return factors
+
+    def _standardize_quaternions(self, block, columns):
+        if not (self.normalize_quaternions or self.continuous_quaternions):
+            return
+        quat_columns = [
+            [columns.index(f"{joint}_rot_{xyzw}") for xyzw in "xyzw"]
+            for joint in JOINTS
+            if all(f"{joint}_rot_{xyzw}" in columns for xyzw in "xyzw")
+        ]
+        if not quat_columns:
+            return
+        # (num_frames, num_joints, 4), so that all joints are processed at once; the axes are flipped already
+        quat_idx = sum(quat_columns, [])
+        quats = block[:, quat_idx].reshape(len(block), -1, 4)
+        standardize(quats, normalize_length=self.normalize_quaternions, continuous=self.continuous_quaternions)
+        block[:, quat_idx] = quats.reshape(len(block), -1)
+
+    def apply_array(self, block, columns):
+        """Transforms `block`, an array of shape `(num_frames, len(columns))`, in place."""
+        assert not self.euler_to_quat, "Euler angles can only be converted by `apply`"
+        block *= self.factors(columns, block.dtype)
+        self._standardize_quaternions(block, columns)
+        return block
+
+    def apply(self, df):
+        """Returns a new DataFrame with the transformed joint columns first, followed by all other columns of `df`."""
+        columns = [c for c in df.columns if _JOINT_COLUMN.match(c)]
+        others = [c for c in df.columns if c not in set(columns)]
+        dtype = self.dtype if self.dtype is not None else np.result_type(*df[columns].dtypes)
+
+        if self.euler_to_quat:
+            euler_columns = [f"{joint}_rot_{xyz}" for joint in JOINTS for xyz in "xyz"]
+            quat_columns = [f"{joint}_rot_{xyzw}" for joint in JOINTS for xyzw in "xyzw"]
+            columns += [c for c in quat_columns if c not in columns]
+            dtype = np.result_type(dtype, np.float32)
+
+        # column-major, so that every column is contiguous and pandas can use the block without copying it
+        block = np.empty((len(df), len(columns)), dtype=dtype, order="F")
+        for i, c in enumerate(columns):
+            if c in df.columns:
+                block[:, i] = df[c].to_numpy()
+
+        if self.euler_to_quat:
+            euler_idx = [columns.index(c) for c in euler_columns]
+            quat_idx = [columns.index(c) for c in quat_columns]
+            eulers = block[:, euler_idx].reshape(len(df), -1, 3)
+            block[:, quat_idx] = euler_to_quat(eulers).reshape(len(df), -1)
+
+        block *= self.factors(columns, dtype)
+        self._standardize_quaternions(block, columns)
+
+        transformed = pd.DataFrame(block, columns=columns, index=df.index, copy=False)
+        if not others:
+            return transformed
+        return pd.concat([transformed, df[others]], axis=1)
@@ -0,0 +1,1095 @@
+import contextvars
+import dataclasses
+import hashlib
+import heapq
+import json
+import os
+import threading
+import urllib.parse
+from collections import Counter, defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+from pathlib import Path
+
+import pandas as pd
+from tqdm import tqdm
+
+import instrumentation
+
+# the leading underscore keeps Arrow, DuckDB and Spark from mistaking the manifest for a data file
+MANIFEST_FILE_NAME = "_manifest.jsonl"
+CATALOGUE_FILE_NAME = "_catalogue.json"
+STAGING_DIR_NAME = "_recordings"
+QA_REPORT_FILE_NAME = "_qa_report.jsonl"
+QUARANTINE_DIR_NAME = "_quarantine"
+# how many converted recordings may wait for the writer thread at once, see `_WriteBehind`
+MAX_PENDING_WRITES = 2
+# the most rows of the files a partition of a `parquet_dataset` is compacted into (recordings are not split, though),
+# which is one row group with Arrow's default row group size
+PARQUET_DATASET_FILE_ROWS = 1024 * 1024
+
+
+def _write_atomically(write, file_path):
+    # write into a temporary file next to the target first, so that an interrupted run
+    # never leaves a truncated file behind that looks like a complete recording
+    tmp_file_path = file_path.with_name(f".{file_path.name}.{os.getpid()}.tmp")
+    try:
+        write(tmp_file_path)
+        os.replace(tmp_file_path, file_path)
+    except BaseException:
+        tmp_file_path.unlink(missing_ok=True)
+        raise
+
+
+def _partition_file_path(recording, output_file_path, dataset_path, partition_columns):
+    # moves the output file into hive-style `column=value` directories below the staging directory of the dataset
+    partition_path = Path(dataset_path) / STAGING_DIR_NAME
+    for column in partition_columns:
+        values = recording[column].unique()
+        if len(values) != 1:
+            raise Exception(f"partition column {column} is not constant within a recording, aborting")
+        partition_path /= f"{column}={urllib.parse.quote(str(values[0]), safe='')}"
+
+    file_name = "_".join(output_file_path.relative_to(dataset_path).parts)
+    return (partition_path / file_name).with_suffix(".parquet")
+
+
+def _write_parquet_table(table, file_path, row_group_size, parquet_profile):
+    import pyarrow.parquet as pq
+
+    if parquet_profile is None:
+        pq.write_table(table, file_path, row_group_size=row_group_size)
+    else:
+        import parquet_profiles
+
+        parquet_profiles.write_table(table, file_path, parquet_profile, row_group_size)
+
+
+def _write_parquet_file(recording, file_path, row_group_size, parquet_profile):
+    if parquet_profile is None:
+        recording.to_parquet(file_path, row_group_size=row_group_size)
+    else:
+        import pyarrow as pa
+
+        _write_parquet_table(pa.Table.from_pandas(recording), file_path, row_group_size, parquet_profile)
+
+
+def _write_parquet_dataset_file(recording, file_path, partition_columns, row_group_size, parquet_profile):
+    import pyarrow as pa
+
+    recording = recording.drop(columns=list(partition_columns))
+    # the remaining metadata columns repeat one value per row, so store them dictionary-encoded
+    metadata_columns = [column for column in recording.columns if not pd.api.types.is_numeric_dtype(recording[column])]
+    recording = recording.astype({column: "category" for column in metadata_columns})
+
+    table = pa.Table.from_pandas(recording, preserve_index=False)
+    _write_parquet_table(table, file_path, row_group_size, parquet_profile)
+
+
+def write_recording(
+    recording,
+    output_file_path,
+    format,
+    dataset_path=None,
+    partition_columns=(),
+    row_group_size=None,
+    parquet_profile=None,
+    statistics=None,
+):
+    """Writes a single recording in the given format and returns the path of the written file.
+
+    With `format="npy"`, the motion columns are written as an array that can be memory-mapped, with the column names
+    and metadata in a JSON header next to it (see `npy_recordings`).
+
+    With `format="arrow_store"`, the recording is staged as an Arrow IPC file below `dataset_path`, to be
+    consolidated into one store per dataset by `write_recording_store` later on.
+
+    With `format="parquet_dataset"`, the recording is staged as a Parquet file in `column=value` directories for its
+    `partition_columns` below `dataset_path`, without these columns and with all other metadata columns
+    dictionary-encoded; `write_parquet_dataset` compacts the staged files into one hive-partitioned Parquet dataset
+    later on.
+
+    With `parquet_profile`, a `parquet_profiles.ParquetProfile` or the name of one (e.g. "balanced"), the Parquet
+    formats are written with the codec, encodings, row group size and statistics of that profile instead of Arrow's
+    defaults.
+
+    With `statistics`, a `recording_statistics.DatasetStatistics`, the recording (along with its metadata columns) is
+    added to these statistics before it is written.
+    """
+    if statistics is not None:
+        with instrumentation.stage("statistics") as measurement:
+            statistics.add(recording)
+            measurement.rows = len(recording)
+
+    match format.lower():
+        case "parquet_dataset":
+            # staged per recording, so the partitions can be compacted again without converting unchanged recordings
+            output_file_path = _partition_file_path(recording, output_file_path, dataset_path, partition_columns)
+        case "arrow_store":
+            # staged per recording, so the store can be rebuilt from unchanged recordings without converting them again
+            output_file_path = Path(dataset_path) / STAGING_DIR_NAME / output_file_path.relative_to(dataset_path)
+    output_file_path.parent.mkdir(parents=True, exist_ok=True)
+
+    with instrumentation.stage("write") as measurement:
+        output_file_path = _write_recording_file(
+            recording, output_file_path, format, partition_columns, row_group_size, parquet_profile
+        )
+        measurement.rows = len(recording)
+        measurement.file = output_file_path
+
+    return output_file_path
+
+
+def _write_recording_file(recording, output_file_path, format, partition_columns, row_group_size, parquet_profile):
+    match format.lower():
+        case "csv":
+            import csv_recordings
+
+            output_file_path = output_file_path.with_suffix(".csv")
+            _write_atomically(partial(csv_recordings.write_csv, recording), output_file_path)
+        case "parquet":
+            output_file_path = output_file_path.with_suffix(".parquet")
+            _write_atomically(
+                lambda path: _write_parquet_file(recording, path, row_group_size, parquet_profile), output_file_path
+            )
+        case "parquet_dataset":
+            _write_atomically(
+                lambda path: _write_parquet_dataset_file(
+                    recording, path, partition_columns, row_group_size, parquet_profile
+                ),
+                output_file_path,
+            )
+        case "npy":
+            import npy_recordings
+
+            output_file_path = output_file_path.with_suffix(".npy")
+            frames, header = npy_recordings.split_recording(recording)
+            # the header goes first, so that there never is an array without one
+            _write_atomically(
+                partial(npy_recordings.write_header, header), npy_recordings.header_path(output_file_path)
+            )
+            _write_atomically(partial(npy_recordings.write_frames, frames), output_file_path)
+        case "arrow_store":
+            import recording_store
+
+            output_file_path = output_file_path.with_suffix(".arrow")
+            _write_atomically(
+                lambda path: recording_store.write_arrow_file(recording_store.recording_table(recording), path),
+                output_file_path,
+            )
+        case _:
+            raise Exception("unkown output format, aborting")
+
+    return output_file_path
+
+
+def run_tasks(fn, tasks, workers=1, desc=None, total=None):
+    """Calls `fn` once per task and yields the results in task order.
+
+    With `workers > 1`, the tasks are distributed over a pool of processes, so `fn` and the tasks must be
+    picklable (i.e. `fn` should be a module level function or a `functools.partial` of one).
+    """
+    if total is None and hasattr(tasks, "__len__"):
+        total = len(tasks)
+
+    if workers <= 1:
+        for task in tqdm(tasks, desc=desc, total=total):
+            yield fn(task)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool, tqdm(desc=desc, total=total) as progress:
+        # only keep a few tasks per worker in flight, so that lazily generated tasks are not all materialized at once
+        pending = deque()
+        for task in tasks:
+            future = pool.submit(fn, task)
+            future.add_done_callback(lambda _: progress.update())
+            pending.append(future)
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+
+        while pending:
+            yield pending.popleft().result()
+
+
+class RecordingHandle:
+    """A recording that has been discovered, but not loaded yet.
+
+    `metadata` is a dict with what the paths, file names or headers of the source files tell about the recording
+    (user, session, ...), so that handles can be filtered and sampled without parsing any recording. `load()`
+    converts the recording on demand and returns its `(recording, metadata)` tuples, just like `convert` yields them;
+    where recordings can only be told apart after parsing (e.g. the repetitions of a session), a handle stands for
+    all of them. Passing a subset of handles to `convert_and_store` converts only that subset.
+    """
+
+    def __init__(self, task, metadata, convert_task):
+        self.task = task
+        self.metadata = metadata
+        self.convert_task = convert_task
+
+    def load(self):
+        return list(self.convert_task(self.task))
+
+    def __repr__(self):
+        return f"RecordingHandle({self.metadata})"
+
+
+def _sha256(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _fingerprint_source(source_path, fingerprint):
+    stat = Path(source_path).stat()
+    source = {"path": str(source_path), "size": stat.st_size}
+    match fingerprint:
+        case "stat":
+            source["mtime_ns"] = stat.st_mtime_ns
+        case "sha256":
+            source["sha256"] = _sha256(source_path)
+        case _:
+            raise Exception(f"unknown fingerprint method {fingerprint}, aborting")
+    return source
+
+
+def fingerprint_sources(source_paths, fingerprint="stat", cache=None):
+    """Describes the current state of the source files of a task, either by size and mtime or by content hash.
+
+    With `cache`, a dict that is passed to every call within a run, each source file is only fingerprinted once, even
+    if it is shared by many tasks (like the one CSV file of LiebersBeatSaber23, which would otherwise be hashed again
+    for every session).
+    """
+    if cache is None:
+        return [_fingerprint_source(source_path, fingerprint) for source_path in source_paths]
+
+    for source_path in source_paths:
+        if str(source_path) not in cache:
+            cache[str(source_path)] = _fingerprint_source(source_path, fingerprint)
+    return [dict(cache[str(source_path)]) for source_path in source_paths]
+
+
+class Manifest:
+    """Keeps track of which task produced which output files from which source files.
+
+    The manifest is an append-only JSON lines file in the output directory with one entry per converted task;
+    later entries replace earlier ones with the same task key. Entries are appended as soon as a task is done, so
+    an interrupted run can be resumed; a partially written last line from a killed run is ignored.
+    """
+
+    def __init__(self, output_path, file_name=MANIFEST_FILE_NAME):
+        self.output_path = Path(output_path)
+        self.path = self.output_path / file_name
+        self.entries = {}
+
+        if self.path.exists():
+            with open(self.path) as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    self.entries[entry["task"]] = entry
+
+    def is_up_to_date(self, task_key, sources, settings):
+        entry = self.entries.get(task_key)
+        if entry is None or entry["sources"] != sources or entry["settings"] != settings:
+            return False
+
+        for output in entry["outputs"]:
+            output_file_path = self.output_path / output["path"]
+            if not output_file_path.exists() or output_file_path.stat().st_size != output["size"]:
+                return False
+
+        return True
+
+    def record(self, task_key, sources, settings, output_file_paths, qa_reports=None, statistics=None):
+        previous_entry = self.entries.get(task_key)
+        entry = {
+            "task": task_key,
+            "sources": sources,
+            "settings": settings,
+            "outputs": [
+                {"path": str(path.relative_to(self.output_path)), "size": path.stat().st_size}
+                for path in output_file_paths
+            ],
+        }
+        if qa_reports is not None:
+            entry["qa"] = qa_reports
+        if statistics is not None:
+            entry["statistics"] = statistics
+
+        # outputs that a previous conversion of this task produced, but the current one did not, are stale now
+        if previous_entry is not None:
+            current_outputs = {output["path"] for output in entry["outputs"]}
+            for output in previous_entry["outputs"]:
+                if output["path"] not in current_outputs:
+                    (self.output_path / output["path"]).unlink(missing_ok=True)
+
+        self.entries[task_key] = entry
+        with open(self.path, "a") as file:
+            file.write(json.dumps(entry) + "\n")
+
+    def compact(self):
+        _write_atomically(
+            lambda path: path.write_text("".join(json.dumps(entry) + "\n" for entry in self.entries.values())),
+            self.path,
+        )
+
+
+def write_recording_store(output_path, manifest):
+    """Consolidates the staged recordings of all tasks in `manifest` into one store, see `recording_store`."""
+    import recording_store
+
+    output_path = Path(output_path)
+    recording_files = [
+        output_path / output["path"]
+        for task_key, entry in sorted(manifest.entries.items())
+        if entry["settings"]["format"] == "arrow_store"
+        for output in entry["outputs"]
+        if not _is_quarantined(output["path"])
+    ]
+    index, data_schema = recording_store.build_index(recording_files, output_path)
+
+    _write_atomically(
+        lambda path: recording_store.write_store(recording_files, data_schema, path),
+        output_path / recording_store.STORE_FILE_NAME,
+    )
+    _write_atomically(
+        lambda path: recording_store.write_arrow_file(index, path), output_path / recording_store.INDEX_FILE_NAME
+    )
+
+
+def _parquet_dataset_files(output_path):
+    # the compacted files of a `parquet_dataset`, i.e. all Parquet files outside of the directories (like the staging
+    # and quarantine directories) that Arrow skips as well
+    for file_path in Path(output_path).rglob("*.parquet"):
+        if not any(part.startswith(("_", ".")) for part in file_path.relative_to(output_path).parts):
+            yield file_path
+
+
+def _staged_parquet_table(file_path, schema):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    # read as a single file, without columns for the `column=value` directories it is in
+    table = pq.ParquetFile(file_path).read()
+    # the recordings of a partition share files, so the name of the staged file tells them apart
+    table = table.append_column("recording", pa.repeat(file_path.stem, table.num_rows).dictionary_encode())
+    return pa.table(
+        [
+            (
+                table.column(field.name).cast(field.type)
+                if field.name in table.column_names
+                else pa.nulls(len(table), field.type)
+            )
+            for field in schema
+        ],
+        schema=schema,
+    )
+
+
+def write_parquet_dataset(output_path, manifest):
+    """Compacts the staged recordings of all tasks in `manifest` into one hive-partitioned Parquet dataset, with the
+    settings (row group size and Parquet profile) they were converted with.
+
+    The recordings of every partition are concatenated into as few files as possible (`part-0.parquet`, ...), each
+    with at most about `PARQUET_DATASET_FILE_ROWS` rows, and a `recording` column with the name of their staged file
+    tells them apart. Recordings that lack columns of others get nulls there. Compacted files that are left over from
+    earlier runs are removed.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    output_path = Path(output_path)
+    staging_path = output_path / STAGING_DIR_NAME
+    partitions = defaultdict(list)
+    settings = None
+    for _task_key, entry in sorted(manifest.entries.items()):
+        if entry["settings"]["format"] != "parquet_dataset":
+            continue
+        settings = entry["settings"]
+        for output in entry["outputs"]:
+            if not _is_quarantined(output["path"]):
+                file_path = output_path / output["path"]
+                partitions[file_path.parent.relative_to(staging_path)].append(file_path)
+
+    parquet_profile = None
+    if settings is not None and "parquet_profile" in settings:
+        import parquet_profiles
+
+        parquet_profile = parquet_profiles.ParquetProfile(**settings["parquet_profile"])
+    row_group_size = None if settings is None else settings.get("row_group_size")
+
+    # one schema for all files, so that readers which take the schema of the first file see all columns
+    schema = pa.unify_schemas(
+        [pq.read_schema(file_path) for recording_files in partitions.values() for file_path in recording_files]
+        + [pa.schema([("recording", pa.dictionary(pa.int32(), pa.utf8()))])],
+        promote_options="permissive",
+    ).remove_metadata()
+
+    written = set()
+    for partition, recording_files in sorted(partitions.items()):
+        (output_path / partition).mkdir(parents=True, exist_ok=True)
+        tables, num_rows, num_files = [], 0, 0
+        for position, recording_file in enumerate(recording_files):
+            tables.append(_staged_parquet_table(recording_file, schema))
+            num_rows += tables[-1].num_rows
+            if num_rows < PARQUET_DATASET_FILE_ROWS and position < len(recording_files) - 1:
+                continue
+
+            file_path = output_path / partition / f"part-{num_files}.parquet"
+            table = pa.concat_tables(tables)
+            _write_atomically(
+                lambda path: _write_parquet_table(table, path, row_group_size, parquet_profile), file_path
+            )
+            written.add(file_path)
+            tables, num_rows, num_files = [], 0, num_files + 1
+
+    for file_path in list(_parquet_dataset_files(output_path)):
+        if file_path not in written:
+            file_path.unlink()
+
+
+def _describe_file_task(recording_file):
+    return str(recording_file), [recording_file]
+
+
+def _file_size(file_path):
+    try:
+        return Path(file_path).stat().st_size
+    except OSError:
+        return 0
+
+
+def _stable_hash(identity):
+    # unlike `hash`, this does not change between processes
+    return hashlib.sha256(identity.encode()).hexdigest()
+
+
+def assign_shards(sizes, num_shards):
+    """Assigns the items of `sizes`, a dict that maps a stable identity to a size, to `num_shards` shards and returns
+    a dict that maps each identity to its shard index.
+
+    The largest items are assigned first, each to the shard with the smallest total size so far, so that all shards
+    end up with about the same total size. Ties are broken by a hash of the identity rather than the order of
+    `sizes`, so every node computes the same assignment, no matter in which order its filesystem lists the files.
+    """
+    shard_sizes = [(0, shard_index) for shard_index in range(num_shards)]
+    shards = {}
+    for identity in sorted(sizes, key=lambda identity: (-sizes[identity], _stable_hash(identity))):
+        shard_size, shard_index = heapq.heappop(shard_sizes)
+        shards[identity] = shard_index
+        heapq.heappush(shard_sizes, (shard_size + sizes[identity], shard_index))
+    return shards
+
+
+def check_shard(shard_index, num_shards):
+    if not 0 <= shard_index < num_shards:
+        raise Exception(f"shard index {shard_index} is out of range for {num_shards} shards, aborting")
+
+
+def shard_tasks(tasks, shard_index, num_shards, describe_task=_describe_file_task):
+    """Returns the tasks of shard `shard_index` (counting from 0) out of `num_shards`, balanced by the size of their
+    source files (see `assign_shards`); files shared by several tasks are split evenly between them.
+
+    Tasks are identified by their key (see `describe_task`) relative to the directory all keys have in common, so
+    that nodes which mount the dataset at different paths agree on the assignment.
+    """
+    check_shard(shard_index, num_shards)
+    if num_shards == 1:
+        return tasks
+
+    descriptions = [describe_task(task) for task in tasks]
+    common_prefix = os.path.commonprefix([task_key for task_key, _source_paths in descriptions])
+    common_prefix = common_prefix[: common_prefix.rfind(os.sep) + 1]
+    num_tasks_per_source = Counter(str(path) for _task_key, source_paths in descriptions for path in source_paths)
+    sizes = {
+        task_key[len(common_prefix) :]: sum(
+            _file_size(source_path) / num_tasks_per_source[str(source_path)] for source_path in source_paths
+        )
+        for task_key, source_paths in descriptions
+    }
+    shards = assign_shards(sizes, num_shards)
+
+    return [
+        task
+        for task, (task_key, _source_paths) in zip(tasks, descriptions)
+        if shards[task_key[len(common_prefix) :]] == shard_index
+    ]
+
+
+def manifest_file_name(shard_index=0, num_shards=1):
+    # every shard keeps a manifest of its own, so that nodes never write to the same file
+    if num_shards == 1:
+        return MANIFEST_FILE_NAME
+    return f"_manifest-shard-{shard_index}-of-{num_shards}.jsonl"
+
+
+def _manifest_stats(entries):
+    entries = list(entries)
+    return {
+        "tasks": len(entries),
+        "outputs": sum(len(entry["outputs"]) for entry in entries),
+        "output_bytes": sum(output["size"] for entry in entries for output in entry["outputs"]),
+        # source files shared by several tasks (like the one CSV file of LiebersBeatSaber23) are counted once
+        "source_bytes": sum(
+            {source["path"]: source["size"] for entry in entries for source in entry["sources"]}.values()
+        ),
+    }
+
+
+def _is_quarantined(output_path):
+    return Path(output_path).parts[0] == QUARANTINE_DIR_NAME
+
+
+def write_qa_report(output_path, manifest):
+    """Writes the validation reports of all tasks in `manifest` into one JSON lines file (`_qa_report.jsonl`), one
+    line per recording with its task, output file, whether it was quarantined and what `recording_validation.validate`
+    found. Returns the number of recordings that failed validation."""
+    lines = [
+        {"task": task_key, **report}
+        for task_key, entry in sorted(manifest.entries.items())
+        for report in entry.get("qa", [])
+    ]
+    _write_atomically(
+        lambda path: path.write_text("".join(json.dumps(line) + "\n" for line in lines)),
+        Path(output_path) / QA_REPORT_FILE_NAME,
+    )
+    return sum(bool(line["failures"]) for line in lines)
+
+
+def write_catalogue(output_path, manifest, shard_stats=None):
+    """Writes a catalogue (`_catalogue.json`) of the tasks in `manifest`, with the number of tasks, output files,
+    output bytes and source bytes in total (and per shard, with `shard_stats`). If the statistics of the recordings
+    were collected while converting them, they are merged into the statistics of the whole dataset (see
+    `recording_statistics.DatasetStatistics`). Returns the catalogue."""
+    catalogue = {} if shard_stats is None else {"shards": shard_stats}
+    catalogue["total"] = _manifest_stats(manifest.entries.values())
+
+    task_statistics = [
+        entry["statistics"] for _task_key, entry in sorted(manifest.entries.items()) if "statistics" in entry
+    ]
+    if task_statistics:
+        import recording_statistics
+
+        statistics = recording_statistics.DatasetStatistics()
+        for entry_statistics in task_statistics:
+            statistics.merge(recording_statistics.DatasetStatistics.from_dict(entry_statistics))
+        catalogue["statistics"] = statistics.to_dict()
+
+    _write_atomically(
+        lambda path: path.write_text(json.dumps(catalogue, indent=2)), Path(output_path) / CATALOGUE_FILE_NAME
+    )
+    return catalogue
+
+
+def merge_shards(output_path, num_shards):
+    """Combines the manifests of all `num_shards` shards of a conversion into `output_path` into one manifest.
+
+    Along with it, a catalogue (`_catalogue.json`) is written with the number of tasks, output files, output bytes
+    and source bytes of every shard and in total, and the statistics of all shards if they were collected (see
+    `write_catalogue`). For `format="arrow_store"` and `format="parquet_dataset"`, the recording store or the Parquet
+    dataset is built from the staged recordings of all shards, and if the recordings were validated, the QA report
+    (`_qa_report.jsonl`) of all shards is written. Run this once all shards are done, on a node that sees the outputs
+    of all of them; the shard manifests are kept, so that shards can still be rerun incrementally. Returns the
+    catalogue.
+    """
+    output_path = Path(output_path)
+    manifest = Manifest(output_path)
+    shard_stats = {}
+    for shard_index in range(num_shards):
+        shard_manifest_path = output_path / manifest_file_name(shard_index, num_shards)
+        if not shard_manifest_path.exists():
+            raise Exception(f"the manifest of shard {shard_index} is missing, aborting")
+        shard_manifest = Manifest(output_path, shard_manifest_path.name)
+        manifest.entries.update(shard_manifest.entries)
+        shard_stats[str(shard_index)] = _manifest_stats(shard_manifest.entries.values())
+    manifest.compact()
+
+    catalogue = write_catalogue(output_path, manifest, shard_stats)
+
+    if any(entry["settings"]["format"] == "arrow_store" for entry in manifest.entries.values()):
+        write_recording_store(output_path, manifest)
+    if any(entry["settings"]["format"] == "parquet_dataset" for entry in manifest.entries.values()):
+        write_parquet_dataset(output_path, manifest)
+    if any("qa" in entry for entry in manifest.entries.values()):
+        write_qa_report(output_path, manifest)
+
+    return catalogue
+
+
+def _read_ahead(file_paths, block_size=1 << 20):
+    # reading a file once pulls it into the page cache, so that the converter does not have to wait for the disk
+    # (or the network, for datasets on network filesystems) when it opens the file
+    buffer = bytearray(block_size)
+    for file_path in file_paths:
+        try:
+            with open(file_path, "rb", buffering=0) as file:
+                while file.readinto(buffer):
+                    pass
+        except OSError:
+            # missing or unreadable files are reported by the converter
+            pass
+
+
+def prefetch_tasks(tasks, depth=4, max_mb=None, describe_task=_describe_file_task):
+    """Yields `tasks` in their original order, while a pool of `depth` threads reads the source files of the next
+    `depth` tasks into the page cache, so that reading the next tasks overlaps with converting the current one.
+
+    With `max_mb`, the source files read ahead of the current task are limited to that many MiB (the next task is
+    always read ahead, though). Source files shared by several tasks are read only once. `describe_task(task)`
+    returns a key and the source files of a task, like for `convert_and_store_tasks`. With `depth=0`, `tasks` is
+    returned as is.
+
+    The `convert` functions of the dataset modules read their recording files ahead with this, with their `prefetch`
+    option as `depth`.
+    """
+    if depth <= 0:
+        return tasks
+    return _prefetched_tasks(tasks, depth, None if max_mb is None else max_mb * 2**20, describe_task)
+
+
+def _prefetched_tasks(tasks, depth, max_bytes, describe_task):
+    read_paths = set()
+    pending = deque()
+    bytes_ahead = 0
+    pool = ThreadPoolExecutor(max_workers=depth, thread_name_prefix="prefetch")
+    try:
+        for task in tasks:
+            _task_key, source_paths = describe_task(task)
+            source_paths = [str(path) for path in source_paths if str(path) not in read_paths]
+            read_paths.update(source_paths)
+            num_bytes = sum(_file_size(path) for path in source_paths)
+
+            while pending and (
+                len(pending) >= depth or (max_bytes is not None and bytes_ahead + num_bytes > max_bytes)
+            ):
+                next_task, read, next_bytes = pending.popleft()
+                read.result()
+                bytes_ahead -= next_bytes
+                yield next_task
+
+            pending.append((task, pool.submit(_read_ahead, source_paths), num_bytes))
+            bytes_ahead += num_bytes
+
+        while pending:
+            next_task, read, _next_bytes = pending.popleft()
+            read.result()
+            yield next_task
+    finally:
+        pool.shutdown(cancel_futures=True)
+
+
+class _WriteBehind:
+    """Stores recordings in a background thread, so that writing a recording overlaps with converting the next ones.
+
+    Submitting blocks while `max_pending` recordings are already waiting to be written, which bounds the memory held
+    by converted recordings.
+    """
+
+    def __init__(self, max_pending=MAX_PENDING_WRITES):
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="writer")
+        self.slots = threading.BoundedSemaphore(max_pending)
+
+    def submit(self, store_recording, *args, **kwargs):
+        self.slots.acquire()
+        # run in a copy of the current context, so the instrumentation attributes the write to the current task
+        future = self.executor.submit(contextvars.copy_context().run, store_recording, *args, **kwargs)
+        future.add_done_callback(lambda _: self.slots.release())
+        return future
+
+    def shutdown(self):
+        self.executor.shutdown(cancel_futures=True)
+
+
+def _describe_outdated_task(outdated_task):
+    _task, task_key, sources = outdated_task
+    return task_key, [source["path"] for source in sources]
+
+
+def _output_files(output_file_path):
+    # .npy recordings come with a header file, which has to be tracked (and cleaned up) along with them
+    if output_file_path.suffix == ".npy":
+        return [output_file_path, output_file_path.with_suffix(".json")]
+    return [output_file_path]
+
+
+def _resample(recording, rate_hz):
+    import resampling
+
+    with instrumentation.stage("resample") as measurement:
+        recording = resampling.resample(recording, rate_hz)
+        measurement.rows = len(recording)
+    return recording
+
+
+def _validation_rules(validation):
+    import recording_validation
+
+    return recording_validation.get_rules(validation)
+
+
+def _validate(recording, rules):
+    import recording_validation
+
+    with instrumentation.stage("validate") as measurement:
+        report = recording_validation.validate(recording, rules)
+        measurement.rows = len(recording)
+    return report
+
+
+def _store_task_recordings(
+    task,
+    convert_task,
+    store_recording,
+    output_path,
+    format,
+    write_options,
+    resample_hz,
+    validation_rules=None,
+    quarantine=False,
+    statistics=False,
+    writer=None,
+):
+    # returns the paths of the stored recordings, or futures of them if they are stored by `writer`, their validation
+    # reports (None without `validation_rules`) and their statistics (None without `statistics`), which are complete
+    # once all recordings are written
+    stored, reports = [], None if validation_rules is None else []
+    task_statistics = None
+    if statistics:
+        import recording_statistics
+
+        task_statistics = recording_statistics.DatasetStatistics()
+        write_options = write_options | {"statistics": task_statistics}
+    for recording, metadata in convert_task(task):
+        recording_output_path, recording_write_options = output_path, write_options
+        quarantined = False
+        if validation_rules is not None:
+            # validated before resampling, which would interpolate over gaps and time reversals
+            report = _validate(recording, validation_rules)
+            report["quarantined"] = quarantined = quarantine and bool(report["failures"])
+            if quarantined:
+                recording_output_path = output_path / QUARANTINE_DIR_NAME
+                # quarantined recordings are not part of the dataset, so they are left out of its statistics
+                recording_write_options = write_options | {"dataset_path": recording_output_path, "statistics": None}
+            reports.append(report)
+        # quarantined recordings are stored as they were converted, so that their failures can be inspected (and
+        # recordings whose time goes backwards could not be resampled anyway)
+        if resample_hz is not None and not quarantined:
+            recording = _resample(recording, resample_hz)
+        args = (recording, metadata, recording_output_path, format)
+        if writer is None:
+            stored.append(store_recording(*args, **recording_write_options))
+        else:
+            stored.append(writer.submit(store_recording, *args, **recording_write_options))
+    return stored, reports, task_statistics
+
+
+def _convert_and_store_task(keyed_task, instrumented, **kwargs):
+    task_key, task = keyed_task
+    if not instrumented:
+        return *_store_task_recordings(task, **kwargs), []
+
+    # the hooks are registered in the main process, so the stage timings of the task are sent back along with its
+    # output files instead of being reported in the (possibly worker) process that converts it
+    with instrumentation.collect() as events, instrumentation.task(task_key):
+        stored, reports, statistics = _store_task_recordings(task, **kwargs)
+    return stored, reports, statistics, events
+
+
+class ConversionJob:
+    """The conversion of the tasks of one dataset into `output_path`, see `convert_and_store_tasks` for the arguments:
+    which tasks are outdated, how each of them is converted and stored, and how the results are recorded."""
+
+    def __init__(
+        self,
+        tasks,
+        convert_task,
+        store_recording,
+        output_path,
+        format,
+        incremental=True,
+        fingerprint="stat",
+        describe_task=_describe_file_task,
+        converter_version=None,
+        options=None,
+        partition_columns=(),
+        row_group_size=None,
+        parquet_profile=None,
+        resample_hz=None,
+        validation=None,
+        quarantine=False,
+        statistics=False,
+        shard_index=0,
+        num_shards=1,
+    ):
+        check_shard(shard_index, num_shards)
+        self.tasks = tasks
+        self.output_path = output_path
+        self.format = format
+        self.incremental = incremental
+        self.fingerprint = fingerprint
+        self.describe_task = describe_task
+        self.num_shards = num_shards
+        self.num_converted = 0
+        # source path -> fingerprint, so that source files shared by several tasks are fingerprinted once per run
+        self.fingerprints = {}
+
+        self.manifest = Manifest(output_path, manifest_file_name(shard_index, num_shards))
+        self.settings = {"converter_version": converter_version, "format": format.lower(), "options": options or {}}
+        if row_group_size is not None:
+            self.settings["row_group_size"] = row_group_size
+        if parquet_profile is not None:
+            import parquet_profiles
+
+            # the settings of the profile, so that changing a profile converts the recordings again
+            self.settings["parquet_profile"] = dataclasses.asdict(parquet_profiles.get_profile(parquet_profile))
+        if resample_hz is not None:
+            self.settings["resample_hz"] = resample_hz
+        if format.lower() == "parquet_dataset":
+            # recordings that were written straight into the partitions instead of being staged for
+            # `write_parquet_dataset` lack this, so they are converted (and staged) again
+            self.settings["staged"] = True
+        validation_rules = _validation_rules(validation)
+        self.validated = validation_rules is not None
+        if self.validated:
+            # the rules decide which recordings are quarantined, so changing them converts the recordings again
+            self.settings["validation"] = dataclasses.asdict(validation_rules)
+            self.settings["quarantine"] = quarantine
+        self.collects_statistics = statistics
+        if statistics:
+            # so that turning statistics on collects them for all tasks, not just for those converted from now on
+            self.settings["statistics"] = True
+
+        write_options = {
+            "dataset_path": output_path,
+            "partition_columns": partition_columns,
+            "row_group_size": row_group_size,
+            "parquet_profile": parquet_profile,
+        }
+        # to be called with `(task_key, task)`, returns the stored file paths (or futures of them), their validation
+        # reports, their statistics and the events
+        self.convert_and_store_task = partial(
+            _convert_and_store_task,
+            convert_task=convert_task,
+            store_recording=store_recording,
+            output_path=output_path,
+            format=format,
+            write_options=write_options,
+            resample_hz=resample_hz,
+            validation_rules=validation_rules,
+            quarantine=quarantine,
+            statistics=statistics,
+        )
+
+    def outdated_tasks(self):
+        """Yields `(task, task_key, sources)` for all tasks that have to be converted."""
+        for task in self.tasks:
+            task_key, source_paths = self.describe_task(task)
+            sources = fingerprint_sources(source_paths, self.fingerprint, self.fingerprints)
+            if self.incremental and self.manifest.is_up_to_date(task_key, sources, self.settings):
+                continue
+            yield task, task_key, sources
+
+    def record(self, task_key, sources, file_paths, reports, statistics, events):
+        output_file_paths = [output_file for file_path in file_paths for output_file in _output_files(file_path)]
+        qa_reports = None
+        if reports is not None:
+            qa_reports = [
+                {"output": str(file_path.relative_to(self.output_path)), **report}
+                for file_path, report in zip(file_paths, reports)
+            ]
+        self.manifest.record(
+            task_key,
+            sources,
+            self.settings,
+            output_file_paths,
+            qa_reports,
+            None if statistics is None else statistics.to_dict(),
+        )
+        self.num_converted += 1
+        for event in events:
+            instrumentation.emit(event)
+
+    def finish(self):
+        self.manifest.compact()
+
+        if self.format.lower() == "arrow_store" and self.num_shards == 1:
+            import recording_store
+
+            if self.num_converted or not (Path(self.output_path) / recording_store.INDEX_FILE_NAME).exists():
+                write_recording_store(self.output_path, self.manifest)
+
+        if self.format.lower() == "parquet_dataset" and self.num_shards == 1:
+            if self.num_converted or next(_parquet_dataset_files(self.output_path), None) is None:
+                write_parquet_dataset(self.output_path, self.manifest)
+
+        qa_report_path = Path(self.output_path) / QA_REPORT_FILE_NAME
+        if self.validated and self.num_shards == 1 and (self.num_converted or not qa_report_path.exists()):
+            num_failed = write_qa_report(self.output_path, self.manifest)
+            if num_failed:
+                action = "quarantined" if self.settings["quarantine"] else "stored"
+                print(f"{num_failed} recordings failed validation and were {action}, see {QA_REPORT_FILE_NAME}")
+
+        catalogue_path = Path(self.output_path) / CATALOGUE_FILE_NAME
+        if self.collects_statistics and self.num_shards == 1 and (self.num_converted or not catalogue_path.exists()):
+            write_catalogue(self.output_path, self.manifest)
+
+
+@contextmanager
+def report_timings(timings):
+    """Appends the per-stage timings of the enclosed block to the JSON lines file `timings` and prints a summary of
+    them at the end; does nothing if `timings` is None."""
+    if timings is None:
+        yield
+        return
+
+    sink, summary = instrumentation.JsonLinesSink(timings), instrumentation.Summary()
+    try:
+        with instrumentation.hooks(sink, summary):
+            yield
+    finally:
+        sink.close()
+    print(summary.format())
+
+
+def convert_and_store_tasks(
+    tasks,
+    convert_task,
+    store_recording,
+    output_path,
+    format,
+    workers=1,
+    incremental=True,
+    fingerprint="stat",
+    describe_task=_describe_file_task,
+    converter_version=None,
+    options=None,
+    partition_columns=(),
+    row_group_size=None,
+    parquet_profile=None,
+    resample_hz=None,
+    validation=None,
+    quarantine=False,
+    statistics=False,
+    prefetch=0,
+    prefetch_mb=None,
+    shard_index=0,
+    num_shards=1,
+    timings=None,
+    scheduler=None,
+):
+    """Converts and stores the recordings of all `tasks`.
+
+    `convert_task(task)` yields `(recording, metadata)` tuples, which are passed on to
+    `store_recording(recording, metadata, output_path, format, **write_options)`, which returns the path of the
+    written file. `write_options` are to be passed on to `write_recording`.
+
+    Options:
+        workers: number of worker processes; with `workers > 1` each task is converted and stored in a separate
+            process, so `convert_task`, `store_recording` and the tasks must be picklable.
+        incremental: skip tasks whose source files, converter version, format and options did not change since
+            they were last converted into `output_path` (as recorded in its manifest).
+        fingerprint: how source files are compared between runs, either "stat" (size and mtime) or "sha256".
+        row_group_size: maximum number of rows per Parquet row group (Arrow's default if None).
+        parquet_profile: the encoding of Parquet files, a `parquet_profiles.ParquetProfile` or the name of one of
+            `parquet_profiles.PROFILES` ("fast-write", "balanced" or "archive"); Arrow's defaults if None.
+        resample_hz: resample every recording to this many frames per second before storing it, interpolating
+            positions linearly and rotations with slerp (see `resampling.resample`).
+        validation: check every recording right after it is converted, before resampling, either against the default
+            `recording_validation.ValidationRules` (True) or the given ones; the report of every recording is kept in
+            the manifest and written to `_qa_report.jsonl` (by `merge_shards`, if the tasks are sharded).
+        quarantine: store the recordings that fail validation below `_quarantine` in `output_path` instead of along
+            with the others (and leave them out of the recording store and the Parquet dataset), without resampling
+            them.
+        statistics: accumulate the statistics of the recordings while they are written (durations, frame rates,
+            recordings per user and the mean, standard deviation, minimum and maximum of every joint column, see
+            `recording_statistics.DatasetStatistics`); the statistics of every task are kept in the manifest and
+            merged into `_catalogue.json` (by `merge_shards`, if the tasks are sharded).
+        prefetch: number of tasks whose source files are read ahead by a pool of threads while the current task is
+            converted (see `prefetch_tasks`); with `workers=1`, the recordings are also written by a background
+            thread, while the next ones are converted. 0 converts, writes and reads strictly one after the other.
+        prefetch_mb: maximum size of the source files read ahead, in MiB.
+        shard_index, num_shards: the tasks are expected to be those of shard `shard_index` out of `num_shards`
+            (see `shard_tasks`), which keeps a manifest of its own; use `merge_shards` to combine the manifests of
+            all shards once they are done.
+        timings: path of a JSON lines file to append the per-stage timings of all tasks to; a summary of them is
+            printed at the end of the run. Hooks registered with `instrumentation.add_hook` receive them as well.
+        scheduler: a `conversion_scheduler.ConversionScheduler`, to queue the conversion there instead of running
+            it right away; `workers`, `prefetch`, `prefetch_mb` and `timings` are then up to the scheduler.
+
+    `describe_task(task)` returns a unique key and the source files of a task; by default, tasks are
+    expected to be source file paths. `converter_version` and `options` are recorded in the manifest along with the
+    format, so modules bump their `CONVERTER_VERSION` whenever their converted output changes. With
+    `format="parquet_dataset"`, the recordings are partitioned by the module's `partition_columns` and compacted into a
+    few files per partition after all tasks are done; with `format="arrow_store"`, they are consolidated into one store
+    (both by `merge_shards`, if the tasks are sharded).
+    """
+    job = ConversionJob(
+        tasks,
+        convert_task,
+        store_recording,
+        output_path,
+        format,
+        incremental=incremental,
+        fingerprint=fingerprint,
+        describe_task=describe_task,
+        converter_version=converter_version,
+        options=options,
+        partition_columns=partition_columns,
+        row_group_size=row_group_size,
+        parquet_profile=parquet_profile,
+        resample_hz=resample_hz,
+        validation=validation,
+        quarantine=quarantine,
+        statistics=statistics,
+        shard_index=shard_index,
+        num_shards=num_shards,
+    )
+    if scheduler is not None:
+        scheduler.add(job)
+        return
+
+    outdated = job.outdated_tasks()
+    total = None
+    if isinstance(tasks, list):
+        outdated = list(outdated)
+        total = len(outdated)
+        if total < len(tasks):
+            print(f"skipping {len(tasks) - total} unchanged tasks, converting {total}")
+
+    # results come back in task order, so the keys and sources of the running tasks can simply be queued up
+    task_infos = deque()
+
+    def pending_tasks():
+        for task, task_key, sources in prefetch_tasks(outdated, prefetch, prefetch_mb, _describe_outdated_task):
+            task_infos.append((task_key, sources))
+            yield task_key, task
+
+    # worker processes already overlap reading, converting and writing
+    writer = _WriteBehind() if prefetch > 0 and workers <= 1 else None
+    # tasks whose recordings may still be waiting for the writer, in task order
+    unwritten = deque()
+
+    def record_task(task_key, sources, stored, reports, statistics, events):
+        file_paths = [future.result() for future in stored] if writer is not None else stored
+        job.record(task_key, sources, file_paths, reports, statistics, events)
+
+    with report_timings(timings):
+        fn = partial(job.convert_and_store_task, instrumented=instrumentation.is_enabled(), writer=writer)
+        try:
+            for stored, reports, statistics, events in run_tasks(fn, pending_tasks(), workers, total=total):
+                unwritten.append((*task_infos.popleft(), stored, reports, statistics, events))
+                while unwritten and (writer is None or all(future.done() for future in unwritten[0][2])):
+                    record_task(*unwritten.popleft())
+
+            while unwritten:
+                record_task(*unwritten.popleft())
+        finally:
+            if writer is not None:
+                writer.shutdown()
+
+    job.finish()
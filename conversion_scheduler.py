@@ -0,0 +1,110 @@
+import os
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from functools import partial
+from pathlib import Path
+
+from tqdm import tqdm
+
+import instrumentation
+from conversion_pipeline import report_timings
+
+
+def _task_costs(outdated_tasks):
+    # the cost of a task is estimated by the size of its source files; files shared by several tasks (like the one
+    # CSV file of LiebersBeatSaber23) are split evenly between them
+    num_tasks_per_source = Counter(source["path"] for _task, _task_key, sources in outdated_tasks for source in sources)
+    return [
+        sum(source["size"] / num_tasks_per_source[source["path"]] for source in sources)
+        for _task, _task_key, sources in outdated_tasks
+    ]
+
+
+class ConversionScheduler:
+    """Converts the datasets of several modules at once, in one shared pool of worker processes.
+
+    Pass the scheduler to `convert_and_store` of each module (`scheduler=scheduler`) to queue its dataset, then call
+    `run()`. The outdated tasks of all datasets are interleaved, the largest first (by the size of their source
+    files), so the datasets finish at about the same time and small datasets fill the gaps at the end instead of
+    waiting for the large ones. The progress and ETA of every dataset are shown while running.
+
+    At most `workers` tasks (by default, one per CPU) run at once. With `memory_budget_mb`, tasks are also held back
+    while the estimated memory of the running tasks, `memory_per_source_byte` times the size of their source files,
+    would exceed the budget (a single task is always run, though). With `timings`, the per-stage timings of all
+    tasks are written to that file, like for `convert_and_store`.
+    """
+
+    def __init__(self, workers=None, memory_budget_mb=None, memory_per_source_byte=4, timings=None):
+        self.workers = workers or os.cpu_count()
+        self.memory_budget = None if memory_budget_mb is None else memory_budget_mb * 2**20
+        self.memory_per_source_byte = memory_per_source_byte
+        self.timings = timings
+        self.jobs = []
+
+    def add(self, job):
+        """Queues a `conversion_pipeline.ConversionJob`."""
+        self.jobs.append(job)
+
+    def _queue(self):
+        # (cost, job index, task key, task, sources) of all outdated tasks, the most expensive first; ties keep the
+        # order of the jobs and tasks
+        queue = []
+        for job_index, job in enumerate(self.jobs):
+            outdated_tasks = list(job.outdated_tasks())
+            for (task, task_key, sources), cost in zip(outdated_tasks, _task_costs(outdated_tasks)):
+                queue.append((cost, job_index, task_key, task, sources))
+        queue.sort(key=lambda item: -item[0])
+        return queue
+
+    def run(self):
+        queue = self._queue()
+        remaining_tasks = Counter(job_index for _cost, job_index, *_ in queue)
+        progress_bars = []
+        for job_index, job in enumerate(self.jobs):
+            total_cost = sum(cost for cost, index, *_ in queue if index == job_index)
+            progress_bars.append(
+                tqdm(
+                    desc=Path(job.output_path).name,
+                    total=total_cost,
+                    unit="B",
+                    unit_scale=True,
+                    position=job_index,
+                    leave=True,
+                )
+            )
+            if not remaining_tasks[job_index]:
+                job.finish()
+                progress_bars[job_index].close()
+
+        start = time.perf_counter()
+        with report_timings(self.timings), ProcessPoolExecutor(max_workers=self.workers) as pool:
+            fns = [partial(job.convert_and_store_task, instrumented=instrumentation.is_enabled()) for job in self.jobs]
+            running = {}
+            memory_in_use = 0
+            next_index = 0
+
+            while next_index < len(queue) or running:
+                while next_index < len(queue) and len(running) < self.workers:
+                    cost, job_index, task_key, task, sources = queue[next_index]
+                    memory = cost * self.memory_per_source_byte
+                    if running and self.memory_budget is not None and memory_in_use + memory > self.memory_budget:
+                        break
+                    running[pool.submit(fns[job_index], (task_key, task))] = queue[next_index]
+                    memory_in_use += memory
+                    next_index += 1
+
+                done, _pending = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    cost, job_index, task_key, _task, sources = running.pop(future)
+                    memory_in_use -= cost * self.memory_per_source_byte
+                    file_paths, reports, statistics, events = future.result()
+                    self.jobs[job_index].record(task_key, sources, file_paths, reports, statistics, events)
+
+                    progress_bars[job_index].update(cost)
+                    remaining_tasks[job_index] -= 1
+                    if not remaining_tasks[job_index]:
+                        self.jobs[job_index].finish()
+                        progress_bars[job_index].close()
+
+        print(f"converted {len(queue)} tasks of {len(self.jobs)} datasets in {time.perf_counter() - start:.1f}s")
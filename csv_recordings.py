@@ -0,0 +1,184 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+# every row of a block is first laid out in fixed-width fields, padded with NUL bytes that are dropped afterwards,
+# so that all values can be written as digits with a few numpy operations per column instead of one format per value
+
+
+def _digit_table(format):
+    return np.frombuffer("".join(format(digits) for digits in range(1000)).encode(), np.uint8).reshape(1000, 3)
+
+
+_PAD = 0
+_DIGITS = _digit_table(lambda digits: f"{digits:03d}")
+_LEADING_DIGITS = _digit_table(lambda digits: f"{digits:3d}".replace(" ", "\0"))
+# decimals without trailing zeros, like repr prints them
+_DECIMALS = _digit_table(lambda digits: (f"{digits:03d}".rstrip("0") or "0").ljust(3, "\0"))
+_BOOLEANS = np.array([b"False", b"True"])
+
+# up to these magnitudes, the repr of a value rounded to 3 decimals is exactly its thousandths written out; below 2**14,
+# float32 values are less than 0.001 apart, so no shorter decimal can be the repr of a float32 value instead
+_MAX_EXACT = {np.dtype(np.float64): 1e9, np.dtype(np.float32): 2**14}
+
+_SPECIAL_CHARACTERS = [",", '"', "\r", "\n"]
+
+
+def _quote(value):
+    # quoting like the csv module does for to_csv, i.e. only where needed
+    if any(character in value for character in _SPECIAL_CHARACTERS):
+        return '"' + value.replace('"', '""') + '"'
+    return value
+
+
+def _is_supported(series):
+    if isinstance(series.dtype, np.dtype) and series.dtype.kind in "fiub":
+        return series.dtype.kind != "f" or series.dtype in _MAX_EXACT
+    if series.dtype == object or isinstance(series.dtype, pd.StringDtype):
+        return all(isinstance(value, str) and "\0" not in value for value in series.dropna().unique())
+    return False
+
+
+def _integer_fields(magnitude, negative):
+    num_groups = max(1, (len(str(magnitude.max(initial=0))) + 2) // 3)
+    fields = np.full((len(magnitude), 1 + 3 * num_groups), _PAD, np.uint8)
+    fields[negative, 0] = ord("-")
+    for group in range(num_groups):
+        digits = magnitude // 1000**group % 1000
+        columns = slice(3 * (num_groups - group) - 2, 3 * (num_groups - group) + 1)
+        # only the most significant group is written without leading zeros
+        if group + 1 < num_groups:
+            higher = (magnitude >= 1000 ** (group + 1))[:, None]
+            fields[:, columns] = np.where(higher, _DIGITS[digits], _LEADING_DIGITS[digits])
+        else:
+            fields[:, columns] = _LEADING_DIGITS[digits]
+        if group:
+            fields[magnitude < 1000**group, columns] = _PAD
+    return fields
+
+
+def _float_fields(values):
+    rounded = values.round(3)
+    thousandths = np.rint(rounded.astype(np.float64) * 1000)
+    missing = np.isnan(rounded)
+    exact = np.abs(rounded) < _MAX_EXACT[values.dtype]
+    exact[exact] = (thousandths[exact] / 1000).astype(values.dtype) == rounded[exact]
+    if not (exact | missing).all():
+        return None
+
+    magnitude = np.abs(np.where(exact, thousandths, 0)).astype(np.int64)
+    fields = np.concatenate(
+        [
+            _integer_fields(magnitude // 1000, np.signbit(rounded)),
+            np.full((len(values), 1), ord("."), np.uint8),
+            _DECIMALS[magnitude % 1000],
+        ],
+        axis=1,
+    )
+    # NaN is written as an empty field
+    fields[missing] = _PAD
+    return fields
+
+
+def _bytes_fields(values):
+    # numpy pads byte strings with NUL bytes up to the longest one
+    return values.view(np.uint8).reshape(len(values), values.dtype.itemsize)
+
+
+def _fields(series):
+    values = series.to_numpy()
+    if values.dtype in _MAX_EXACT:
+        return _float_fields(values)
+    if values.dtype.kind == "b":
+        return _bytes_fields(_BOOLEANS[values.astype(np.intp)])
+    if values.dtype.kind == "u":
+        return _integer_fields(values, np.zeros(len(values), bool))
+    if values.dtype.kind == "i":
+        # the magnitude of the smallest int64 only fits into an uint64
+        return _integer_fields(np.abs(values.astype(np.int64)).astype(np.uint64), values < 0)
+
+    codes, uniques = pd.factorize(series)
+    # missing values have the code -1, i.e. the empty string at the end
+    quoted = np.array([_quote(value).encode() for value in uniques] + [b""])
+    return _bytes_fields(quoted[codes])
+
+
+def _encode_block(block):
+    separator = np.full((len(block), 1), ord(","), np.uint8)
+    fields = []
+    for column in block.columns:
+        column_fields = _fields(block[column])
+        if column_fields is None:
+            # values like inf or 1e+16 that pandas prints in other notations
+            return block.round(3).to_csv(header=False, index=False).encode()
+        fields += [column_fields, separator]
+
+    line_separator = np.frombuffer(os.linesep.encode(), np.uint8)
+    fields[-1] = np.broadcast_to(line_separator, (len(block), len(line_separator)))
+    characters = np.concatenate(fields, axis=1).ravel()
+    return characters[characters != _PAD].tobytes()
+
+
+def write_csv(recording, file_path, block_size=100_000):
+    """Writes `recording` rounded to 3 decimals as CSV, byte for byte like `recording.round(3).to_csv(file_path,
+    index=False)` but without creating the rounded copy or formatting every float in Python.
+
+    The rows are written in blocks of `block_size`; recordings with columns that cannot be formatted this way are
+    written with pandas instead.
+    """
+    columns = recording.columns
+    if len(columns) < 2 or not all(_is_supported(recording[column]) for column in columns):
+        recording.round(3).to_csv(file_path, index=False)
+        return
+
+    with open(file_path, "wb") as file:
+        file.write((",".join(_quote(str(column)) for column in columns) + os.linesep).encode())
+        for start in range(0, len(recording), block_size):
+            file.write(_encode_block(recording.iloc[start : start + block_size]))
+
+
+def _read_csv_with_arrow(file_path, column_types, delimiter, columns):
+    import pyarrow as pa
+    from pyarrow import csv
+
+    table = csv.read_csv(
+        file_path,
+        parse_options=csv.ParseOptions(delimiter=delimiter),
+        convert_options=csv.ConvertOptions(
+            column_types={column: pa.from_numpy_dtype(np.dtype(dtype)) for column, dtype in column_types.items()},
+            include_columns=columns,
+        ),
+    )
+    return table.to_pandas()
+
+
+def read_csv(file_path, column_types, delimiter=",", columns=None):
+    """Reads a CSV file with the columns of `column_types` parsed as the given dtypes, e.g. `{"timestamp_ms":
+    "int64", "head_pos_x": "float64"}`; the types of all other columns are inferred.
+
+    With `columns`, only these columns are parsed (and returned in that order), so that the other columns of wide
+    files cost neither parse time nor memory.
+
+    The file is parsed with the multithreaded CSV reader of pyarrow if it is installed. Files it rejects, e.g. because
+    of rows with missing fields, are read with `pd.read_csv` instead, which then has to come up with numeric columns
+    where `column_types` asks for them. Either way, float64 columns hold the closest double to each value, and
+    float32 columns are parsed as float32 right away (or, by pandas, cast from float64 column by column).
+    """
+    try:
+        return _read_csv_with_arrow(file_path, column_types, delimiter, columns)
+    except (ImportError, ValueError):
+        # pyarrow is not installed or rejected the file (pyarrow.ArrowInvalid is a ValueError)
+        pass
+
+    recording = pd.read_csv(file_path, sep=delimiter, usecols=columns, low_memory=False, float_precision="round_trip")
+    if columns is not None:
+        recording = recording[columns]
+
+    numeric_columns = [column for column, dtype in column_types.items() if np.dtype(dtype).kind in "iuf"]
+    for column in numeric_columns:
+        if column in recording and not pd.api.types.is_numeric_dtype(recording[column]):
+            raise TypeError(f"column {column} of {file_path} is not numeric")
+        if column in recording and recording[column].dtype.kind == "f" and np.dtype(column_types[column]).kind == "f":
+            recording[column] = recording[column].astype(column_types[column], copy=False)
+    return recording
@@ -0,0 +1,187 @@
+import contextvars
+import json
+import os
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+
+_hooks = []
+_current_task = contextvars.ContextVar("instrumentation_task", default=None)
+_collected_events = contextvars.ContextVar("instrumentation_events", default=None)
+
+
+class _Stage:
+    def __init__(self, name, file):
+        self.name = name
+        self.file = file
+        self.rows = None
+        self.bytes = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        seconds = time.perf_counter() - self.start
+        if self.bytes is None and self.file is not None and exc_type is None:
+            self.bytes = Path(self.file).stat().st_size
+        emit(
+            {
+                "task": _current_task.get(),
+                "stage": self.name,
+                "seconds": seconds,
+                "rows": self.rows,
+                "bytes": self.bytes,
+                "file": None if self.file is None else str(self.file),
+                "pid": os.getpid(),
+                "failed": exc_type is not None,
+            }
+        )
+        return False
+
+
+class _NullStage:
+    # handed out while no hook is registered, so that instrumented code costs next to nothing
+    file = None
+    rows = None
+    bytes = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+def stage(name, file=None):
+    """Times the enclosed block as stage `name` of the current task and reports it to all registered hooks.
+
+    Set `rows` and `bytes` of the returned object to report them along with the timing; with `file` (which can also
+    be set on the returned object), the size of that file after the stage is reported as `bytes`.
+    """
+    if not is_enabled():
+        return _NULL_STAGE
+    return _Stage(name, file)
+
+
+def is_enabled():
+    return bool(_hooks) or _collected_events.get() is not None
+
+
+def emit(event):
+    events = _collected_events.get()
+    if events is not None:
+        events.append(event)
+        return
+    for hook in _hooks:
+        hook(event)
+
+
+def add_hook(hook):
+    """Registers `hook`, a callable that receives one event dict per instrumented stage."""
+    _hooks.append(hook)
+
+
+def remove_hook(hook):
+    _hooks.remove(hook)
+
+
+@contextmanager
+def hooks(*hooks_to_add):
+    for hook in hooks_to_add:
+        add_hook(hook)
+    try:
+        yield
+    finally:
+        for hook in hooks_to_add:
+            remove_hook(hook)
+
+
+@contextmanager
+def task(task_key):
+    """Attributes all stages within the block to `task_key`."""
+    token = _current_task.set(task_key)
+    try:
+        yield
+    finally:
+        _current_task.reset(token)
+
+
+@contextmanager
+def collect():
+    """Collects the events of the block into the yielded list instead of passing them to the registered hooks, e.g.
+    to send them from a worker process back to the main process.
+
+    Like `task`, this applies to the current context only, so other threads are not affected (unless they run in a
+    copy of the context, see `contextvars.copy_context`)."""
+    events = []
+    token = _collected_events.set(events)
+    try:
+        yield events
+    finally:
+        _collected_events.reset(token)
+
+
+class JsonLinesSink:
+    """Hook that appends every event as one JSON line to `file_path`."""
+
+    def __init__(self, file_path):
+        self.file = open(file_path, "a", buffering=1)
+
+    def __call__(self, event):
+        self.file.write(json.dumps(event) + "\n")
+
+    def close(self):
+        self.file.close()
+
+
+class Summary:
+    """Hook that aggregates the events into per-stage percentiles and the slowest tasks."""
+
+    def __init__(self):
+        self.seconds = defaultdict(list)
+        self.rows = defaultdict(int)
+        self.bytes = defaultdict(int)
+        self.task_seconds = defaultdict(float)
+
+    def __call__(self, event):
+        self.seconds[event["stage"]].append(event["seconds"])
+        self.rows[event["stage"]] += event["rows"] or 0
+        self.bytes[event["stage"]] += event["bytes"] or 0
+        if event["task"] is not None:
+            self.task_seconds[event["task"]] += event["seconds"]
+
+    def report(self, num_slowest=5):
+        stages = {}
+        for stage_name, seconds in self.seconds.items():
+            total = sum(seconds)
+            stages[stage_name] = {
+                "count": len(seconds),
+                "total_s": total,
+                "p50_s": float(np.percentile(seconds, 50)),
+                "p95_s": float(np.percentile(seconds, 95)),
+                "rows_per_s": self.rows[stage_name] / total if total else None,
+                "mb_per_s": self.bytes[stage_name] / 2**20 / total if total else None,
+            }
+        slowest = sorted(self.task_seconds.items(), key=lambda item: item[1], reverse=True)[:num_slowest]
+        return {"stages": stages, "slowest_tasks": [{"task": task, "seconds": seconds} for task, seconds in slowest]}
+
+    def format(self, num_slowest=5):
+        report = self.report(num_slowest)
+        lines = [f"{'stage':<12}{'count':>8}{'total s':>10}{'p50 ms':>10}{'p95 ms':>10}{'rows/s':>12}{'MB/s':>8}"]
+        for stage_name, stats in report["stages"].items():
+            rows_per_s = f"{stats['rows_per_s']:.0f}" if stats["rows_per_s"] else "-"
+            mb_per_s = f"{stats['mb_per_s']:.1f}" if stats["mb_per_s"] else "-"
+            lines.append(
+                f"{stage_name:<12}{stats['count']:>8}{stats['total_s']:>10.2f}{stats['p50_s'] * 1000:>10.1f}"
+                f"{stats['p95_s'] * 1000:>10.1f}{rows_per_s:>12}{mb_per_s:>8}"
+            )
+        lines.append("slowest tasks:")
+        lines += [f"  {slowest['seconds']:.2f}s {slowest['task']}" for slowest in report["slowest_tasks"]]
+        return "\n".join(lines)
@@ -1 +1 @@
-from .convert import convert, convert_and_store
+from .convert import convert, convert_and_store, discover
@@ -1,4 +1,9 @@
+import itertools
+import pickle
 import sys
+import tempfile
+from collections import Counter, defaultdict
+from functools import partial
 from pathlib import Path
 
 import numpy as np
@@ -6,9 +11,21 @@ import pandas as pd
 from tqdm import tqdm
 
 sys.path.append(str(Path(__file__).parents[1]))
-from conversion_helpers import _convert_coord_system_from_RUB_to_RUF, _convert_m_to_cm, _euler_to_quat
+from conversion_helpers import POSE_DTYPE, RUB_TO_RUF, TransformPlan, source_column_types
+from conversion_pipeline import RecordingHandle, assign_shards, check_shard, convert_and_store_tasks, write_recording
+from instrumentation import stage
+
+CONVERTER_VERSION = 2
+
+partition_columns = ["user"]
+metadata_fields = ["user", "session"]
+
+dataset_file_name = "Data_Set_for_Exploring_the_Stability_of_Behavioral_Biometrics_in_Virtual_Reality.csv"
 
 JOINTS = ["head", "left_hand", "right_hand"]
+transform_plan = TransformPlan(
+    position_scale=100, flip_axes=RUB_TO_RUF, euler_to_quat=True, continuous_quaternions=True
+)
 column_mapping = {
     "timestamp_ms": "delta_time_ms",
     "frame-movements-pos-x-head": "head_pos_x",
@@ -33,41 +50,294 @@ column_mapping = {
     "frame-movements-euler-z-rcontroller": "right_hand_rot_z",
     "frame-movements-quat-w-rcontroller": "right_hand_rot_w",
 }
+# the dataset holds every rotation both as Euler angles and as quaternion, but only these columns are parsed
+source_columns = list(column_mapping) + ["session-uuid", "user-token"]
 
 
-def convert(dataset_file_path, assumed_fps=90):
-    dataset = pd.read_csv(
-        Path(dataset_file_path) / "Data_Set_for_Exploring_the_Stability_of_Behavioral_Biometrics_in_Virtual_Reality.csv",
+def _read_dataset_csv(dataset_file, dtype, **options):
+    # the joint columns are parsed as `dtype` right away
+    return pd.read_csv(
+        dataset_file,
         index_col=False,
+        usecols=source_columns,
+        dtype=source_column_types(column_mapping, dtype),
+        **options,
     )
-    num_sessions = dataset["session-uuid"].unique().size
-
-    for session, df in tqdm(dataset.groupby("session-uuid"), total=num_sessions):
-        recording = (
-            df.rename(columns=column_mapping)
-            .pipe(_euler_to_quat)
-            .pipe(_convert_m_to_cm)
-            .pipe(_convert_coord_system_from_RUB_to_RUF)
-            .assign(delta_time_ms=lambda df: np.arange(len(df)) * (1000 / assumed_fps))[sorted(list(column_mapping.values()))]
-        )
-        user = df["user-token"].iloc[0]
 
-        yield recording, (user, session)
 
+def _load_dataset(dataset_file_path, sessions=None, chunksize=100_000, dtype=POSE_DTYPE):
+    dataset_file = Path(dataset_file_path) / dataset_file_name
+    with stage("read", dataset_file) as measurement:
+        if sessions is None:
+            df = _read_dataset_csv(dataset_file, dtype)
+        else:
+            # only the rows of the given sessions are kept, so memory scales with the subset instead of the dataset
+            df = pd.concat(
+                chunk[chunk["session-uuid"].isin(sessions)]
+                for chunk in _read_dataset_csv(dataset_file, dtype, chunksize=chunksize)
+            )
+        measurement.rows = len(df)
+    return df
 
-def convert_and_store(dataset_path, output_path, format="csv", **convert_kwargs):
-    output_path = Path(output_path)
 
-    output_path.mkdir(parents=True, exist_ok=True)
+def _spill(spill_file_path, dfs):
+    with open(spill_file_path, "ab") as spill_file:
+        for df in dfs:
+            pickle.dump(df, spill_file, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def _load_spilled(spill_file_path):
+    dfs = []
+    with open(spill_file_path, "rb") as spill_file:
+        while True:
+            try:
+                dfs.append(pickle.load(spill_file))
+            except EOFError:
+                break
+    spill_file_path.unlink()
+    return dfs
+
+
+class _SessionStream:
+    """Yields `(session, df)` tuples like `groupby("session-uuid")`, but reads the dataset in chunks.
+
+    A first pass over the session column counts the rows of each session, so a session can be yielded as soon as
+    all of its rows have been read. Whenever the rows of incomplete sessions exceed `memory_budget_mb`, the
+    largest ones are spilled to disk (into a temporary directory within `spill_path`) until they are complete.
+    Peak memory is therefore bounded by the budget, one chunk and the largest single session, independent of the
+    size of the file. Sessions are yielded in the order in which they are completed.
+    """
+
+    def __init__(
+        self, dataset_file_path, memory_budget_mb, chunksize=100_000, spill_path=None, sessions=None, dtype=POSE_DTYPE
+    ):
+        self.dataset_file = Path(dataset_file_path) / dataset_file_name
+        self.memory_budget = memory_budget_mb * 2**20
+        self.chunksize = chunksize
+        self.spill_path = spill_path
+        self.sessions = sessions
+        self.dtype = dtype
+
+        self.row_counts = Counter()
+        for chunk in pd.read_csv(self.dataset_file, usecols=["session-uuid"], chunksize=chunksize):
+            self.row_counts.update(self._selected(chunk)["session-uuid"].value_counts().to_dict())
+
+    def _selected(self, chunk):
+        if self.sessions is None:
+            return chunk
+        return chunk[chunk["session-uuid"].isin(self.sessions)]
+
+    def __len__(self):
+        return len(self.row_counts)
+
+    def __iter__(self):
+        remaining_rows = self.row_counts.copy()
+        buffers = defaultdict(list)
+        buffer_sizes = Counter()
+        spill_files = {}
+        # spilled sessions are popped from `spill_files` once they are complete, so their number cannot name new files
+        spill_file_ids = itertools.count()
+
+        with tempfile.TemporaryDirectory(prefix="liebers_beat_saber23-", dir=self.spill_path) as spill_dir:
+            for chunk in _read_dataset_csv(self.dataset_file, self.dtype, chunksize=self.chunksize):
+                for session, df in self._selected(chunk).groupby("session-uuid", sort=False):
+                    buffers[session].append(df)
+                    buffer_sizes[session] += df.memory_usage(deep=True).sum()
+                    remaining_rows[session] -= len(df)
+
+                    if remaining_rows[session] == 0:
+                        dfs = _load_spilled(spill_files.pop(session)) if session in spill_files else []
+                        dfs += buffers.pop(session)
+                        del buffer_sizes[session]
+                        yield session, pd.concat(dfs) if len(dfs) > 1 else dfs[0]
+
+                buffered = sum(buffer_sizes.values())
+                for session, size in buffer_sizes.most_common():
+                    if buffered <= self.memory_budget:
+                        break
+                    if session not in spill_files:
+                        spill_files[session] = Path(spill_dir) / f"{next(spill_file_ids)}.pkl"
+                    _spill(spill_files[session], buffers.pop(session))
+                    del buffer_sizes[session]
+                    buffered -= size
+
+
+def _session_groups(
+    dataset_file_path, memory_budget_mb=None, chunksize=100_000, spill_path=None, sessions=None, dtype=POSE_DTYPE
+):
+    # with `sessions`, only the rows of these sessions are kept
+    if memory_budget_mb is None:
+        return _load_dataset(dataset_file_path, sessions, chunksize, dtype).groupby("session-uuid")
+    return _SessionStream(dataset_file_path, memory_budget_mb, chunksize, spill_path, sessions, dtype)
+
+
+def _shard_sessions(dataset_file_path, sessions, shard_index, num_shards, chunksize=100_000):
+    # all sessions share the one dataset file, so they are balanced by their number of rows instead of file sizes
+    check_shard(shard_index, num_shards)
+    if num_shards == 1:
+        return sessions
+
+    row_counts = Counter()
+    for chunk in pd.read_csv(
+        Path(dataset_file_path) / dataset_file_name, usecols=["session-uuid"], chunksize=chunksize
+    ):
+        row_counts.update(chunk["session-uuid"].value_counts().to_dict())
+    if sessions is not None:
+        row_counts = {session: row_counts[session] for session in sessions if session in row_counts}
+
+    shards = assign_shards(dict(row_counts), num_shards)
+    return sorted(session for session, shard in shards.items() if shard == shard_index)
+
+
+def _session_rows(dataset_file_path, sessions=None, chunksize=100_000):
+    # `(session, rows)` tuples with the range of rows of the dataset file that holds each session, along with the
+    # rows of other sessions if they are interleaved; only the session column is read
+    first_rows, stop_rows = {}, {}
+    for chunk in pd.read_csv(
+        Path(dataset_file_path) / dataset_file_name, usecols=["session-uuid"], chunksize=chunksize
+    ):
+        # the index of the chunks continues from one chunk to the next
+        first = chunk["session-uuid"].drop_duplicates()
+        for session, row in zip(first, first.index):
+            first_rows.setdefault(session, row)
+        last = chunk["session-uuid"].drop_duplicates(keep="last")
+        stop_rows.update(zip(last, last.index + 1))
+
+    return [
+        (session, range(first_rows[session], stop_rows[session]))
+        for session in sorted(first_rows)
+        if sessions is None or session in sessions
+    ]
 
-    for recording, (user, session) in convert(dataset_path, **convert_kwargs):
+
+def _read_session_rows(dataset_file_path, session, rows, dtype=POSE_DTYPE):
+    dataset_file = Path(dataset_file_path) / dataset_file_name
+    with stage("read", dataset_file) as measurement:
+        header = pd.read_csv(dataset_file, nrows=0).columns
+        # the rows before `rows` (and the header line) are skipped without being parsed
+        df = _read_dataset_csv(dataset_file, dtype, header=None, names=header, skiprows=rows.start + 1, nrows=len(rows))
+        df = df[df["session-uuid"] == session]
+        measurement.rows = len(df)
+    return df
+
+
+def _convert_session_rows(session_rows, dataset_file_path, assumed_fps=90, dtype=POSE_DTYPE):
+    session, rows = session_rows
+    yield from _convert_session((session, _read_session_rows(dataset_file_path, session, rows, dtype)), assumed_fps)
+
+
+def _describe_session(session_group, dataset_file_path):
+    session, _df = session_group
+    return session, [Path(dataset_file_path) / dataset_file_name]
+
+
+def _convert_session(session_group, assumed_fps=90):
+    session, df = session_group
+    with stage("parse"):
+        recording = df.rename(columns=column_mapping)
+    with stage("transform"):
+        recording = recording.pipe(transform_plan.apply).assign(
+            delta_time_ms=lambda df: np.arange(len(df)) * (1000 / assumed_fps)
+        )[sorted(list(column_mapping.values()))]
+    user = df["user-token"].iloc[0]
+
+    yield recording, (user, session)
+
+
+def convert(dataset_file_path, assumed_fps=90, shard_index=0, num_shards=1, dtype=POSE_DTYPE, **reader_options):
+    # pass `memory_budget_mb` (and optionally `chunksize` and `spill_path`) to stream the dataset
+    # in chunks instead of loading it at once, see `_SessionStream`
+    sessions = _shard_sessions(
+        dataset_file_path, None, shard_index, num_shards, reader_options.get("chunksize", 100_000)
+    )
+    session_groups = _session_groups(dataset_file_path, sessions=sessions, dtype=dtype, **reader_options)
+
+    for session_group in tqdm(session_groups, total=len(session_groups)):
+        yield from _convert_session(session_group, assumed_fps)
+
+
+def _load_session(session, dataset_file_path, assumed_fps=90, **reader_options):
+    for session_group in _session_groups(dataset_file_path, sessions=[session], **reader_options):
+        yield from _convert_session(session_group, assumed_fps)
+
+
+def discover(dataset_file_path, assumed_fps=90, chunksize=100_000, dtype=POSE_DTYPE, **reader_options):
+    # the dataset is a single file, so only the session and user columns are read to find the sessions; loading a
+    # session reads the file once more, keeping only its rows (pass a subset of handles to `convert_and_store` to
+    # convert several sessions with one pass over the file)
+    users = {}
+    for chunk in pd.read_csv(
+        Path(dataset_file_path) / dataset_file_name, usecols=["session-uuid", "user-token"], chunksize=chunksize
+    ):
+        first_rows = chunk.drop_duplicates("session-uuid")
+        for session, user in zip(first_rows["session-uuid"], first_rows["user-token"]):
+            users.setdefault(session, user)
+
+    load_session = partial(
+        _load_session,
+        dataset_file_path=dataset_file_path,
+        assumed_fps=assumed_fps,
+        chunksize=chunksize,
+        dtype=dtype,
+        **reader_options,
+    )
+    return [
+        RecordingHandle(session, dict(zip(metadata_fields, (users[session], session))), load_session)
+        for session in sorted(users)
+    ]
+
+
+def _store_recording(recording, metadata, output_path, format, **write_options):
+    user, session = metadata
+    with stage("metadata"):
         recording["user"] = user
         recording["session"] = session
 
-        match format.lower():
-            case "csv":
-                recording.round(3).to_csv(output_path / f"{user}_{session}.csv", index=False)
-            case "parquet":
-                recording.to_parquet(output_path / f"{user}_{session}.parquet")
-            case _:
-                raise Exception("unkown output format, aborting")
+    return write_recording(recording, output_path / f"{user}_{session}", format, **write_options)
+
+
+def convert_and_store(
+    dataset_path,
+    output_path,
+    format="csv",
+    assumed_fps=90,
+    memory_budget_mb=None,
+    chunksize=100_000,
+    spill_path=None,
+    handles=None,
+    shard_index=0,
+    num_shards=1,
+    dtype=POSE_DTYPE,
+    **pipeline_options,
+):
+    output_path = Path(output_path)
+
+    output_path.mkdir(parents=True, exist_ok=True)
+
+    # the subset of `handles` is converted in a single pass over the dataset file
+    sessions = None if handles is None else [handle.task for handle in handles]
+    sessions = _shard_sessions(dataset_path, sessions, shard_index, num_shards, chunksize)
+    if pipeline_options.get("scheduler") is None:
+        tasks = _session_groups(dataset_path, memory_budget_mb, chunksize, spill_path, sessions, dtype)
+        convert_task = partial(_convert_session, assumed_fps=assumed_fps)
+    else:
+        # the tasks wait in the scheduler's queue until a worker converts them, so instead of the rows of the sessions
+        # they only hold where these are in the dataset file, and each worker reads the rows of its session itself
+        tasks = _session_rows(dataset_path, sessions, chunksize)
+        convert_task = partial(
+            _convert_session_rows, dataset_file_path=dataset_path, assumed_fps=assumed_fps, dtype=dtype
+        )
+    convert_and_store_tasks(
+        tasks,
+        convert_task,
+        _store_recording,
+        output_path,
+        format,
+        describe_task=partial(_describe_session, dataset_file_path=dataset_path),
+        converter_version=CONVERTER_VERSION,
+        partition_columns=partition_columns,
+        options={"assumed_fps": assumed_fps, "dtype": dtype},
+        shard_index=shard_index,
+        num_shards=num_shards,
+        **pipeline_options,
+    )
@@ -1,12 +1,22 @@
+from functools import partial
 from pathlib import Path
 import sys
 import pandas as pd
 from tqdm import tqdm
 
 sys.path.append(str(Path(__file__).parents[1]))
-from conversion_helpers import _convert_coord_system_from_RUB_to_RUF, _convert_m_to_cm
+from conversion_helpers import POSE_DTYPE, RUB_TO_RUF, TransformPlan, source_column_types
+from conversion_pipeline import RecordingHandle, convert_and_store_tasks, prefetch_tasks, shard_tasks, write_recording
+from csv_recordings import read_csv
+from instrumentation import stage
+
+CONVERTER_VERSION = 1
+
+partition_columns = ["user", "session"]
+metadata_fields = ["file_name", "user", "session", "xr", "scene"]
 
 JOINTS = ["left_hand", "right_hand"]
+transform_plan = TransformPlan(position_scale=100, flip_axes=RUB_TO_RUF)
 column_mapping = {
     "Unity.realtimeSinceStartup": "delta_time_s",
     "Unity.HeadPosition.position_x": "head_pos_x",
@@ -33,53 +43,98 @@ column_mapping = {
 }
 
 
-def convert(dataset_path):
-    dataset_path = Path(dataset_path)
+def _recording_files(dataset_path):
+    return list(Path(dataset_path).glob("*.tsv"))
+
+
+def _file_metadata(recording_file):
+    info = dict([attr.split("-") for attr in recording_file.stem.split("_")])
+    user = int(info["PID"])
+    session = int(info["SESSION"])
+    xr = info["XR"]
+    scene = info["SCENE"]
+    return recording_file.name, user, session, xr, scene
 
-    dataset_path.mkdir(parents=True, exist_ok=True)
 
-    for recording_file in tqdm(list(dataset_path.glob("*.tsv"))):
-        info = dict([attr.split("-") for attr in recording_file.stem.split("_")])
-        try:
+def _convert_file(recording_file, dtype=POSE_DTYPE):
+    metadata = _file_metadata(recording_file)
+    try:
+        with stage("read", recording_file) as measurement:
+            recording = read_csv(
+                recording_file, source_column_types(column_mapping, dtype), delimiter="\t", columns=list(column_mapping)
+            )
+            measurement.rows = len(recording)
+        with stage("parse"):
+            recording = recording.rename(columns=column_mapping)
+        with stage("transform"):
             recording = (
-                pd.read_csv(recording_file, sep="\t", low_memory=False)
-                .rename(columns=column_mapping)
-                .pipe(_convert_m_to_cm)
-                .pipe(_convert_coord_system_from_RUB_to_RUF)
+                recording.pipe(transform_plan.apply)
                 .assign(delta_time_ms=lambda df: df["delta_time_s"] * 1000)[
                     sorted(list(column_mapping.values()) + ["delta_time_ms"])
                 ]
                 .drop(columns=["delta_time_s"])
             )
-            assert (
-                recording.select_dtypes(include=[object]).shape[1] == 0
-            ), f"DataFrame contains non-numeric columns: {recording.select_dtypes(include=[object])}"
-        except (pd.errors.ParserError, AssertionError) as e:
-            print(f"WARNING: error parsing {recording_file}, skipping...")
-            continue
-        user = int(info["PID"])
-        session = int(info["SESSION"])
-        xr = info["XR"]
-        scene = info["SCENE"]
-        yield recording, (recording_file.name, user, session, xr, scene)
-
-
-def convert_and_store(dataset_path, output_path, format="csv"):
-    output_path = Path(output_path)
+    except (pd.errors.ParserError, TypeError) as e:
+        print(f"WARNING: error parsing {recording_file}, skipping...")
+        return
+    yield recording, metadata
 
-    output_path.mkdir(parents=True, exist_ok=True)
-    for recording, (recording_file_name, user, session, xr, scene) in convert(dataset_path):
+
+def convert(dataset_path, prefetch=0, shard_index=0, num_shards=1, dtype=POSE_DTYPE):
+    dataset_path = Path(dataset_path)
+
+    dataset_path.mkdir(parents=True, exist_ok=True)
+
+    recording_files = shard_tasks(_recording_files(dataset_path), shard_index, num_shards)
+    for recording_file in tqdm(prefetch_tasks(recording_files, prefetch), total=len(recording_files)):
+        yield from _convert_file(recording_file, dtype)
+
+
+def discover(dataset_path, dtype=POSE_DTYPE):
+    convert_file = partial(_convert_file, dtype=dtype)
+    return [
+        RecordingHandle(recording_file, dict(zip(metadata_fields, _file_metadata(recording_file))), convert_file)
+        for recording_file in _recording_files(dataset_path)
+    ]
+
+
+def _store_recording(recording, metadata, output_path, format, **write_options):
+    recording_file_name, user, session, xr, scene = metadata
+    with stage("metadata"):
         recording["user"] = str(user)
         recording["session"] = str(session)
         recording["xr"] = xr
         recording["scene"] = scene
 
-        output_file_path = output_path / recording_file_name
+    output_file_path = output_path / recording_file_name
 
-        match format.lower():
-            case "csv":
-                recording.round(3).to_csv(output_file_path.with_suffix(".csv"), index=False)
-            case "parquet":
-                recording.to_parquet(output_file_path.with_suffix(".parquet"))
-            case _:
-                raise Exception("unkown output format, aborting")
+    return write_recording(recording, output_file_path, format, **write_options)
+
+
+def convert_and_store(
+    dataset_path,
+    output_path,
+    format="csv",
+    handles=None,
+    shard_index=0,
+    num_shards=1,
+    dtype=POSE_DTYPE,
+    **pipeline_options,
+):
+    output_path = Path(output_path)
+
+    output_path.mkdir(parents=True, exist_ok=True)
+    tasks = _recording_files(dataset_path) if handles is None else [handle.task for handle in handles]
+    convert_and_store_tasks(
+        shard_tasks(tasks, shard_index, num_shards),
+        partial(_convert_file, dtype=dtype),
+        _store_recording,
+        output_path,
+        format,
+        converter_version=CONVERTER_VERSION,
+        partition_columns=partition_columns,
+        options={"dtype": dtype},
+        shard_index=shard_index,
+        num_shards=num_shards,
+        **pipeline_options,
+    )
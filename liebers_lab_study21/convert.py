@@ -1,12 +1,23 @@
+from functools import partial
 from pathlib import Path
 import sys
-import pandas as pd
 from tqdm import tqdm
 
 sys.path.append(str(Path(__file__).parents[1]))
-from conversion_helpers import _convert_coord_system_from_RUB_to_RUF, _convert_m_to_cm, _euler_to_quat
+from conversion_helpers import POSE_DTYPE, RUB_TO_RUF, TransformPlan, source_column_types
+from conversion_pipeline import RecordingHandle, convert_and_store_tasks, prefetch_tasks, shard_tasks, write_recording
+from csv_recordings import read_csv
+from instrumentation import stage
+
+CONVERTER_VERSION = 2
+
+partition_columns = ["user", "session"]
+metadata_fields = ["file_name", "scene", "user", "norm", "session", "repetition"]
 
 JOINTS = ["head", "left_hand", "right_hand"]
+transform_plan = TransformPlan(
+    position_scale=100, flip_axes=RUB_TO_RUF, euler_to_quat=True, continuous_quaternions=True
+)
 column_mapping = {
     "timestamp_ms": "delta_time_ms",
     "CenterEyeAnchor_pos_X": "head_pos_x",
@@ -30,38 +41,81 @@ column_mapping = {
 }
 
 
-def convert(dataset_path):
-    dataset_path = Path(dataset_path)
+def _recording_files(dataset_path):
+    return list(Path(dataset_path).glob("*.csv"))
 
-    for recording_file in tqdm(list(dataset_path.glob("*.csv"))):
-        recording = (
-            pd.read_csv(recording_file)
-            .rename(columns=column_mapping)
-            .pipe(_euler_to_quat)
-            .pipe(_convert_m_to_cm)
-            .pipe(_convert_coord_system_from_RUB_to_RUF)[sorted(list(column_mapping.values()) + [f"{j}_rot_w" for j in JOINTS])]
-        )
 
-        scene, user, norm, session, repetition = recording_file.stem.split("_")
+def _file_metadata(recording_file):
+    scene, user, norm, session, repetition = recording_file.stem.split("_")
 
-        session = session.endswith("2") + 1  # convert to 1 or 2
+    session = session.endswith("2") + 1  # convert to 1 or 2
 
-        yield recording, (recording_file.name, scene, user, norm, session, repetition)
+    return recording_file.name, scene, user, norm, session, repetition
 
 
-def convert_and_store(dataset_path, output_path, format="csv"):
-    output_path = Path(output_path)
+def _convert_file(recording_file, dtype=POSE_DTYPE):
+    column_types = source_column_types(column_mapping, dtype) | {"timestamp_ms": "int64"}
+    with stage("read", recording_file) as measurement:
+        recording = read_csv(recording_file, column_types, columns=list(column_mapping))
+        measurement.rows = len(recording)
+    with stage("parse"):
+        recording = recording.rename(columns=column_mapping)
+    with stage("transform"):
+        recording = recording.pipe(transform_plan.apply)[
+            sorted(list(column_mapping.values()) + [f"{j}_rot_w" for j in JOINTS])
+        ]
 
-    output_path.mkdir(parents=True, exist_ok=True)
-    for recording, (recording_file_name, scene, user, norm, session, repetition) in convert(dataset_path):
-        output_file_path = output_path / recording_file_name
+    yield recording, _file_metadata(recording_file)
+
+
+def convert(dataset_path, prefetch=0, shard_index=0, num_shards=1, dtype=POSE_DTYPE):
+    recording_files = shard_tasks(_recording_files(dataset_path), shard_index, num_shards)
+    for recording_file in tqdm(prefetch_tasks(recording_files, prefetch), total=len(recording_files)):
+        yield from _convert_file(recording_file, dtype)
+
+
+def discover(dataset_path, dtype=POSE_DTYPE):
+    convert_file = partial(_convert_file, dtype=dtype)
+    return [
+        RecordingHandle(recording_file, dict(zip(metadata_fields, _file_metadata(recording_file))), convert_file)
+        for recording_file in _recording_files(dataset_path)
+    ]
 
+
+def _store_recording(recording, metadata, output_path, format, **write_options):
+    recording_file_name, scene, user, norm, session, repetition = metadata
+    output_file_path = output_path / recording_file_name
+
+    with stage("metadata"):
         recording = recording.assign(scene=scene, user=user, norm=norm, session=session, repetition=repetition)
 
-        match format.lower():
-            case "csv":
-                recording.round(3).to_csv(output_file_path.with_suffix(".csv"), index=False)
-            case "parquet":
-                recording.to_parquet(output_file_path.with_suffix(".parquet"))
-            case _:
-                raise Exception("unkown output format, aborting")
+    return write_recording(recording, output_file_path, format, **write_options)
+
+
+def convert_and_store(
+    dataset_path,
+    output_path,
+    format="csv",
+    handles=None,
+    shard_index=0,
+    num_shards=1,
+    dtype=POSE_DTYPE,
+    **pipeline_options,
+):
+    output_path = Path(output_path)
+
+    output_path.mkdir(parents=True, exist_ok=True)
+    tasks = _recording_files(dataset_path) if handles is None else [handle.task for handle in handles]
+    convert_and_store_tasks(
+        shard_tasks(tasks, shard_index, num_shards),
+        partial(_convert_file, dtype=dtype),
+        _store_recording,
+        output_path,
+        format,
+        converter_version=CONVERTER_VERSION,
+        partition_columns=partition_columns,
+        options={"dtype": dtype},
+        shard_index=shard_index,
+        num_shards=num_shards,
+        **pipeline_options,
+    )
@@ -1,14 +1,24 @@
+from functools import partial
 from pathlib import Path
 import re
 import sys
-import pandas as pd
 from tqdm import tqdm
 
 sys.path.append(str(Path(__file__).parents[1]))
-from conversion_helpers import _convert_coord_system_from_RUB_to_RUF, _convert_m_to_cm
+from conversion_helpers import POSE_DTYPE, RUB_TO_RUF, TransformPlan, source_column_types
+from conversion_pipeline import RecordingHandle, convert_and_store_tasks, prefetch_tasks, shard_tasks, write_recording
+from csv_recordings import read_csv
+from instrumentation import stage
+
+CONVERTER_VERSION = 1
+
+partition_columns = ["user"]
+metadata_fields = ["file_name", "user", "build"]
 
 JOINTS = ["head", "left_hand", "right_hand"]
 
+transform_plan = TransformPlan(position_scale=100, flip_axes=RUB_TO_RUF)
+
 column_mapping = {
     "Timestamp": "delta_time_ms",
     "Head_position_x": "head_pos_x",
@@ -35,38 +45,81 @@ column_mapping = {
 }
 
 
-def convert(dataset_path):
+def _recording_files(dataset_path):
+    return list(Path(dataset_path).glob("data/*.csv"))
+
+
+def _file_metadata(recording_file):
+    token, build = recording_file.stem.split("_")
+    user = re.findall("FAB\d{3}.", token)[0]
+    return recording_file.name, user, build
+
+
+def _convert_file(recording_file, dtype=POSE_DTYPE):
+    with stage("read", recording_file) as measurement:
+        recording = read_csv(recording_file, source_column_types(column_mapping, dtype), columns=list(column_mapping))
+        measurement.rows = len(recording)
+    with stage("parse"):
+        recording = recording.rename(columns=column_mapping)
+    with stage("transform"):
+        recording = recording.pipe(transform_plan.apply).assign(delta_time_ms=lambda df: df["delta_time_ms"] * 1000)[
+            column_mapping.values()
+        ]
+
+    yield recording, _file_metadata(recording_file)
+
+
+def convert(dataset_path, prefetch=0, shard_index=0, num_shards=1, dtype=POSE_DTYPE):
     dataset_path = Path(dataset_path)
     dataset_path.mkdir(parents=True, exist_ok=True)
 
-    for recording_file in tqdm(list(dataset_path.glob("data/*.csv"))):
-        recording = (
-            pd.read_csv(recording_file)
-            .rename(columns=column_mapping)
-            .pipe(_convert_m_to_cm)
-            .pipe(_convert_coord_system_from_RUB_to_RUF)
-            .assign(delta_time_ms=lambda df: df["delta_time_ms"] * 1000)[column_mapping.values()]
-        )
+    recording_files = shard_tasks(_recording_files(dataset_path), shard_index, num_shards)
+    for recording_file in tqdm(prefetch_tasks(recording_files, prefetch), total=len(recording_files)):
+        yield from _convert_file(recording_file, dtype)
 
-        token, build = recording_file.stem.split("_")
-        user = re.findall("FAB\d{3}.", token)[0]
 
-        yield recording, (recording_file.name, user, build)
+def discover(dataset_path, dtype=POSE_DTYPE):
+    convert_file = partial(_convert_file, dtype=dtype)
+    return [
+        RecordingHandle(recording_file, dict(zip(metadata_fields, _file_metadata(recording_file))), convert_file)
+        for recording_file in _recording_files(dataset_path)
+    ]
 
 
-def convert_and_store(dataset_path, output_path, format="csv"):
-    output_path = Path(output_path)
-
-    output_path.mkdir(parents=True, exist_ok=True)
-    for recording, (recording_file_name, user, build) in convert(dataset_path):
-        output_file_path = output_path / recording_file_name
+def _store_recording(recording, metadata, output_path, format, **write_options):
+    recording_file_name, user, build = metadata
+    output_file_path = output_path / recording_file_name
 
+    with stage("metadata"):
         recording = recording.assign(user=user, build=build)
 
-        match format.lower():
-            case "csv":
-                recording.round(3).to_csv(output_file_path.with_suffix(".csv"), index=False)
-            case "parquet":
-                recording.to_parquet(output_file_path.with_suffix(".parquet"))
-            case _:
-                raise Exception("unkown output format, aborting")
+    return write_recording(recording, output_file_path, format, **write_options)
+
+
+def convert_and_store(
+    dataset_path,
+    output_path,
+    format="csv",
+    handles=None,
+    shard_index=0,
+    num_shards=1,
+    dtype=POSE_DTYPE,
+    **pipeline_options,
+):
+    output_path = Path(output_path)
+
+    output_path.mkdir(parents=True, exist_ok=True)
+    tasks = _recording_files(dataset_path) if handles is None else [handle.task for handle in handles]
+    convert_and_store_tasks(
+        shard_tasks(tasks, shard_index, num_shards),
+        partial(_convert_file, dtype=dtype),
+        _store_recording,
+        output_path,
+        format,
+        converter_version=CONVERTER_VERSION,
+        partition_columns=partition_columns,
+        options={"dtype": dtype},
+        shard_index=shard_index,
+        num_shards=num_shards,
+        **pipeline_options,
+    )
@@ -0,0 +1,68 @@
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+
+def header_path(file_path):
+    return Path(file_path).with_suffix(".json")
+
+
+def _is_metadata_column(series):
+    # metadata like user, session or repetition goes into the header instead of the frame array
+    return series.name != "delta_time_ms" and not pd.api.types.is_float_dtype(series)
+
+
+def _python_value(value):
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def split_recording(recording):
+    """Splits `recording` into a C-contiguous array of its motion columns and a header with their names, dtype and
+    shape and the metadata of the recording.
+
+    The array has the dtype of the joint columns (float32, or float64 for recordings converted with
+    `dtype="float64"`), which `delta_time_ms` is converted to as well."""
+    metadata_columns = [column for column in recording.columns if _is_metadata_column(recording[column])]
+    motion_columns = [column for column in recording.columns if column not in metadata_columns]
+    joint_dtypes = [recording[column].dtype for column in motion_columns if column != "delta_time_ms"]
+
+    frames = np.ascontiguousarray(
+        recording[motion_columns].to_numpy(dtype=np.result_type(*joint_dtypes) if joint_dtypes else np.float32)
+    )
+    header = {
+        "columns": motion_columns,
+        "dtype": frames.dtype.str,
+        "shape": list(frames.shape),
+        "metadata": {
+            column: _python_value(recording[column].iloc[0]) if len(recording) else None for column in metadata_columns
+        },
+    }
+    return frames, header
+
+
+def write_frames(frames, file_path):
+    with open(file_path, "wb") as file:
+        np.save(file, frames)
+
+
+def write_header(header, file_path):
+    Path(file_path).write_text(json.dumps(header))
+
+
+def load_npy_recording(file_path, as_frame=True):
+    """Memory-maps a recording written with `format="npy"` and returns it together with its metadata.
+
+    Nothing is read or copied up front: the returned DataFrame (or, with `as_frame=False`, the `(num_frames,
+    num_columns)` array) is a read-only view of the mapped file, so repeated reads are served from the page cache.
+    """
+    header = json.loads(header_path(file_path).read_text())
+    frames = np.load(file_path, mmap_mode="r")
+
+    if list(frames.shape) != header["shape"] or frames.dtype.str != header["dtype"]:
+        raise Exception(f"{file_path} does not match its header, aborting")
+
+    if not as_frame:
+        return frames, header["metadata"]
+    return pd.DataFrame(frames, columns=header["columns"], copy=False), header["metadata"]
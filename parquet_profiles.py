@@ -0,0 +1,84 @@
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True)
+class ParquetProfile:
+    """Declares how recordings are encoded in Parquet files.
+
+    Metadata columns (all non-numeric columns, like user or session) repeat one value per row and are always
+    dictionary-encoded. Float columns are written with `float_encoding` and integer columns with `integer_encoding`;
+    smooth motion streams compress far better with "BYTE_STREAM_SPLIT", which groups the bytes of the floats by
+    significance, and "DELTA_BINARY_PACKED", which stores the differences between consecutive integers. None leaves
+    them PLAIN. `row_group_size` is the maximum number of rows per row group (Arrow's default if None) and
+    `write_statistics` whether min/max statistics, which readers use to skip row groups, are written.
+    """
+
+    compression: str = "snappy"
+    compression_level: int = None
+    float_encoding: str = None
+    integer_encoding: str = None
+    row_group_size: int = None
+    write_statistics: bool = True
+
+    def write_options(self, table):
+        """Returns the keyword arguments of `pyarrow.parquet.write_table` to write `table` with this profile."""
+        import pyarrow as pa
+
+        dictionary_columns, column_encoding = [], {}
+        for field in table.schema:
+            if pa.types.is_floating(field.type) and self.float_encoding is not None:
+                column_encoding[field.name] = self.float_encoding
+            elif pa.types.is_integer(field.type) and self.integer_encoding is not None:
+                column_encoding[field.name] = self.integer_encoding
+            elif not (pa.types.is_floating(field.type) or pa.types.is_integer(field.type)):
+                dictionary_columns.append(field.name)
+
+        return {
+            "compression": self.compression,
+            "compression_level": self.compression_level,
+            "use_dictionary": dictionary_columns,
+            "column_encoding": column_encoding or None,
+            "row_group_size": self.row_group_size,
+            "write_statistics": self.write_statistics,
+        }
+
+
+PROFILES = {
+    # cheapest to write: LZ4 on PLAIN values, without statistics
+    "fast-write": ParquetProfile(compression="lz4", write_statistics=False),
+    "balanced": ParquetProfile(
+        compression="zstd",
+        compression_level=3,
+        float_encoding="BYTE_STREAM_SPLIT",
+        integer_encoding="DELTA_BINARY_PACKED",
+        row_group_size=128 * 1024,
+    ),
+    # smallest files, for data that is written once and read rarely
+    "archive": ParquetProfile(
+        compression="zstd",
+        compression_level=15,
+        float_encoding="BYTE_STREAM_SPLIT",
+        integer_encoding="DELTA_BINARY_PACKED",
+        row_group_size=1024 * 1024,
+    ),
+}
+
+
+def get_profile(profile):
+    """Returns the `ParquetProfile` of a name of `PROFILES`; profiles are returned as they are."""
+    if isinstance(profile, ParquetProfile):
+        return profile
+    if profile not in PROFILES:
+        raise Exception(f"unknown Parquet profile {profile}, choose from {list(PROFILES)}")
+    return PROFILES[profile]
+
+
+def write_table(table, file_path, profile, row_group_size=None):
+    """Writes the Arrow `table` as Parquet file with `profile` (a `ParquetProfile` or the name of one of `PROFILES`);
+    `row_group_size` overrides the one of the profile."""
+    import pyarrow.parquet as pq
+
+    write_options = get_profile(profile).write_options(table)
+    if row_group_size is not None:
+        write_options["row_group_size"] = row_group_size
+    pq.write_table(table, file_path, **write_options)
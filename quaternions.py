@@ -0,0 +1,80 @@
+import numpy as np
+from scipy.spatial.transform import Rotation as R
+
+# all functions work on arrays of shape `(num_frames, num_joints, 4)` (or any other shape ending in 4, with the frames
+# along the first axis) of quaternions in scalar-last (x, y, z, w) order, and on all joints at once
+_COMPONENTS = "xyzw"
+
+
+def euler_to_quat(eulers, degrees=True):
+    """Converts the extrinsic xyz Euler angles `eulers`, of shape `(..., 3)`, into canonical quaternions (w >= 0) of
+    shape `(..., 4)`, in a single batched call for all frames and joints."""
+    eulers = np.asarray(eulers)
+    quaternions = R.from_euler("xyz", eulers.reshape(-1, 3), degrees=degrees).as_quat(canonical=True)
+    return quaternions.reshape(*eulers.shape[:-1], 4)
+
+
+def _inverse_norms(quaternions):
+    # 1 for quaternions of length 0 (or NaN), which are left as they are
+    norms = np.sqrt((quaternions * quaternions).sum(axis=-1, keepdims=True))
+    return np.divide(1, norms, out=np.ones_like(norms), where=norms > 0)
+
+
+def _component_signs(flip_axes, dtype):
+    signs = np.ones(4, dtype=dtype)
+    for component in flip_axes:
+        signs[_COMPONENTS.index(component)] = -1
+    return signs
+
+
+def _continuity_signs(quaternions):
+    # the sign of every frame relative to the preceding valid frame, accumulated along the chain of valid frames;
+    # frames with NaNs keep their sign and are skipped, so the frame after a gap is compared with the one before it
+    valid = ~np.isnan(quaternions).any(axis=-1)
+    frame_indices = np.arange(len(quaternions)).reshape(-1, *[1] * (valid.ndim - 1))
+    last_valid = np.maximum.accumulate(np.where(valid, frame_indices, -1), axis=0)
+    previous = np.concatenate([np.full_like(last_valid[:1], -1), last_valid[:-1]])
+
+    previous_quaternions = np.take_along_axis(quaternions, np.maximum(previous, 0)[..., None], axis=0)
+    dots = (quaternions * previous_quaternions).sum(axis=-1)
+    flips = np.where(valid & (previous >= 0) & (dots < 0), -1, 1).astype(quaternions.dtype)
+    return np.cumprod(flips, axis=0)[..., None]
+
+
+def normalize(quaternions):
+    """Scales `quaternions` to unit length, in place; quaternions of length 0 (or NaN) are left as they are."""
+    quaternions *= _inverse_norms(quaternions)
+    return quaternions
+
+
+def flip_handedness(quaternions, flip_axes=("z", "w")):
+    """Negates the components `flip_axes` of `quaternions` in place, e.g. `conversion_helpers.RUB_TO_RUF`."""
+    quaternions *= _component_signs(flip_axes, quaternions.dtype)
+    return quaternions
+
+
+def make_continuous(quaternions):
+    """Flips the sign of quaternions in place wherever that brings them into the same hemisphere as the preceding
+    frame, so that `q` and `-q` (which describe the same rotation) do not alternate over time.
+
+    The first frame of every joint keeps its sign. Frames with NaNs are skipped, i.e. the frame after a gap is
+    compared with the last frame before it.
+    """
+    quaternions *= _continuity_signs(quaternions)
+    return quaternions
+
+
+def standardize(quaternions, flip_axes=(), normalize_length=True, continuous=True):
+    """Converts the handedness of `quaternions` (see `flip_handedness`), scales them to unit length and makes their
+    signs continuous over time (see `make_continuous`), in place and in a single multiplication.
+
+    Neither the length of two quaternions nor negating the same components of both changes whether they lie in the
+    same hemisphere, so the signs for continuity are taken from the quaternions as they are passed in.
+    """
+    factors = np.ones((*quaternions.shape[:-1], 1), dtype=quaternions.dtype)
+    if normalize_length:
+        factors *= _inverse_norms(quaternions)
+    if continuous:
+        factors *= _continuity_signs(quaternions)
+    quaternions *= factors * _component_signs(flip_axes, quaternions.dtype)
+    return quaternions
@@ -0,0 +1,157 @@
+import math
+from collections import Counter
+
+import numpy as np
+
+from conversion_helpers import joint_frames
+
+
+class RunningStatistics:
+    """The count, mean, variance, minimum and maximum of a stream of values, accumulated batch by batch.
+
+    Two accumulators are merged with the parallel algorithm of Chan et al., which combines their means and sums of
+    squared deviations exactly, so that the statistics of separate recordings, workers or shards can be merged
+    without going over their values again. NaN values are left out.
+    """
+
+    def __init__(self, count=0, mean=0.0, m2=0.0, minimum=math.nan, maximum=math.nan):
+        self.count = count
+        self.mean = mean
+        # the sum of squared deviations from the mean
+        self.m2 = m2
+        self.minimum = minimum
+        self.maximum = maximum
+
+    def add(self, value):
+        return self.merge(RunningStatistics(1, value, 0.0, value, value))
+
+    def merge(self, other):
+        """Adds the values accumulated by `other` to this accumulator, in place."""
+        if other.count == 0:
+            return self
+        if self.count == 0:
+            self.count, self.mean, self.m2 = other.count, other.mean, other.m2
+            self.minimum, self.maximum = other.minimum, other.maximum
+            return self
+
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+        self.minimum = min(self.minimum, other.minimum)
+        self.maximum = max(self.maximum, other.maximum)
+        return self
+
+    @property
+    def std(self):
+        # the population standard deviation, as used to standardize values
+        return math.sqrt(self.m2 / self.count) if self.count else None
+
+    def to_dict(self):
+        if not self.count:
+            return {"count": 0, "mean": None, "std": None, "min": None, "max": None}
+        return {"count": self.count, "mean": self.mean, "std": self.std, "min": self.minimum, "max": self.maximum}
+
+    @classmethod
+    def from_dict(cls, data):
+        if not data["count"]:
+            return cls()
+        return cls(data["count"], data["mean"], data["std"] ** 2 * data["count"], data["min"], data["max"])
+
+
+def _column_statistics(frames):
+    # the statistics of every column of `frames` at once, in float64; the columns are reduced as the rows of the
+    # transposed frames, which are copied into contiguous rows (the frames of some recordings are stored row by row)
+    if not len(frames):
+        return [RunningStatistics() for _ in range(frames.shape[1])]
+
+    columns = frames.T.astype(np.float64, order="C")
+    missing = np.isnan(columns)
+    counts = columns.shape[1] - missing.sum(axis=1)
+    # unlike nanmin and nanmax, these do not warn about columns that are NaN throughout
+    minimums, maximums = np.fmin.reduce(columns, axis=1), np.fmax.reduce(columns, axis=1)
+    has_missing = missing.any()
+    if has_missing:
+        columns[missing] = 0
+    means = np.divide(columns.sum(axis=1), counts, out=np.zeros(len(counts)), where=counts > 0)
+    deviations = np.subtract(columns, means[:, None], out=columns)
+    if has_missing:
+        deviations[missing] = 0
+    m2s = np.einsum("ij,ij->i", deviations, deviations)
+    return [
+        RunningStatistics(int(count), float(mean), float(m2), float(minimum), float(maximum))
+        for count, mean, m2, minimum, maximum in zip(counts, means, m2s, minimums, maximums)
+    ]
+
+
+class DatasetStatistics:
+    """Statistics of the recordings of a dataset, accumulated recording by recording while they are converted: the
+    number of recordings and frames, the duration and effective frame rate of the recordings, the number of
+    recordings per user and the statistics of every joint column (e.g. to normalize them).
+
+    Accumulators of parts of a dataset (tasks, workers, shards) are combined with `merge`, and stored with
+    `to_dict` and `from_dict`.
+    """
+
+    def __init__(self):
+        self.recordings = 0
+        self.frames = 0
+        self.duration_s = RunningStatistics()
+        self.frame_rate_hz = RunningStatistics()
+        self.users = Counter()
+        self.columns = {}
+
+    def add(self, recording):
+        """Adds a converted recording, with its metadata columns (like `user`), to the statistics."""
+        self.recordings += 1
+        self.frames += len(recording)
+
+        if "delta_time_ms" in recording and len(recording) > 1:
+            times = recording["delta_time_ms"].to_numpy()
+            duration_s = float(times[-1] - times[0]) / 1000
+            self.duration_s.add(duration_s)
+            if duration_s > 0:
+                self.frame_rate_hz.add((len(recording) - 1) / duration_s)
+        if "user" in recording and len(recording):
+            self.users[str(recording["user"].iloc[0])] += 1
+
+        frames, columns = joint_frames(recording)
+        for column, statistics in zip(columns, _column_statistics(frames)):
+            self.columns.setdefault(column, RunningStatistics()).merge(statistics)
+        return self
+
+    def merge(self, other):
+        """Adds the recordings accumulated by `other` to these statistics, in place."""
+        self.recordings += other.recordings
+        self.frames += other.frames
+        self.duration_s.merge(other.duration_s)
+        self.frame_rate_hz.merge(other.frame_rate_hz)
+        self.users.update(other.users)
+        for column, statistics in other.columns.items():
+            self.columns.setdefault(column, RunningStatistics()).merge(statistics)
+        return self
+
+    def to_dict(self):
+        return {
+            "recordings": self.recordings,
+            "frames": self.frames,
+            "duration_s": self.duration_s.to_dict(),
+            "frame_rate_hz": self.frame_rate_hz.to_dict(),
+            "recordings_per_user": dict(sorted(self.users.items())),
+            "columns": {column: statistics.to_dict() for column, statistics in self.columns.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        statistics = cls()
+        statistics.recordings = data["recordings"]
+        statistics.frames = data["frames"]
+        statistics.duration_s = RunningStatistics.from_dict(data["duration_s"])
+        statistics.frame_rate_hz = RunningStatistics.from_dict(data["frame_rate_hz"])
+        statistics.users = Counter(data["recordings_per_user"])
+        statistics.columns = {
+            column: RunningStatistics.from_dict(column_statistics)
+            for column, column_statistics in data["columns"].items()
+        }
+        return statistics
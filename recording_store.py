@@ -0,0 +1,122 @@
+from pathlib import Path
+
+import numpy as np
+import pyarrow as pa
+
+STORE_FILE_NAME = "recordings.arrow"
+INDEX_FILE_NAME = "recordings_index.arrow"
+
+
+def _read_table(file_path):
+    # memory-mapped, so the returned table references the file instead of copying it into memory
+    return pa.ipc.open_file(pa.memory_map(str(file_path))).read_all()
+
+
+def _is_metadata_field(field):
+    # metadata like user, session or repetition is stored once per recording in the index instead of once per row
+    return field.name != "delta_time_ms" and not pa.types.is_floating(field.type)
+
+
+def write_arrow_file(table, file_path):
+    with pa.OSFile(str(file_path), "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table, max_chunksize=None)
+
+
+def recording_table(recording):
+    # built column by column from numpy, so that NaNs stay NaNs instead of becoming nulls
+    return pa.table({column: pa.array(recording[column].to_numpy()) for column in recording.columns})
+
+
+def build_index(recording_files, root_path):
+    """Returns the index of a store of `recording_files` and the schema of its motion data.
+
+    The index has one row per recording with its metadata columns, its file path relative to `root_path` and the
+    offset and length of its rows in the store.
+    """
+    schemas, lengths, metadata = [], [], []
+    for file_path in recording_files:
+        table = _read_table(file_path)
+        schemas.append(table.schema)
+        lengths.append(table.num_rows)
+        metadata.append(
+            {
+                field.name: table.column(field.name)[0].as_py()
+                for field in table.schema
+                if _is_metadata_field(field) and table.num_rows
+            }
+        )
+
+    schema = pa.unify_schemas(schemas, promote_options="permissive")
+    data_schema = pa.schema([field for field in schema if not _is_metadata_field(field)])
+
+    index = {
+        field.name: pa.array([values.get(field.name) for values in metadata], field.type)
+        for field in schema
+        if _is_metadata_field(field)
+    }
+    index["recording"] = pa.array([str(Path(file_path).relative_to(root_path)) for file_path in recording_files])
+    index["offset"] = pa.array(np.concatenate([[0], np.cumsum(lengths)[:-1]]), pa.int64())
+    index["length"] = pa.array(lengths, pa.int64())
+
+    return pa.table(index), data_schema
+
+
+def write_store(recording_files, data_schema, file_path):
+    """Concatenates the motion data of `recording_files` into one Arrow IPC file, one record batch per recording.
+
+    Columns that a recording lacks are filled with NaN, so recordings with different joints can share a store.
+    """
+    with pa.OSFile(str(file_path), "wb") as sink, pa.ipc.new_file(sink, data_schema) as writer:
+        for recording_file in recording_files:
+            table = _read_table(recording_file)
+            columns = [
+                (
+                    table.column(field.name).cast(field.type)
+                    if field.name in table.column_names
+                    else pa.array(np.full(table.num_rows, np.nan), field.type)
+                )
+                for field in data_schema
+            ]
+            writer.write_table(pa.table(columns, schema=data_schema).combine_chunks(), max_chunksize=None)
+
+
+class RecordingStore:
+    """Random access to the recordings of a dataset converted with `format="arrow_store"`.
+
+    The store is memory-mapped; recordings are returned as read-only DataFrames that reference the mapped file
+    instead of copying it, so accessing a recording costs neither a file open nor a copy of its data.
+
+    ```python
+    store = RecordingStore("path/to/converted/dataset")
+    store.index  # DataFrame with the metadata, offset and length of every recording
+    recording = store[42]
+    recording = store.get(user=1, session="2022-01-01")
+    ```
+    """
+
+    def __init__(self, path):
+        path = Path(path)
+        self.table = _read_table(path / STORE_FILE_NAME)
+        self.index = _read_table(path / INDEX_FILE_NAME).to_pandas()
+
+    def __len__(self):
+        return len(self.index)
+
+    def __getitem__(self, position):
+        entry = self.index.iloc[position]
+        return self.table.slice(entry["offset"], entry["length"]).to_pandas(split_blocks=True)
+
+    def __iter__(self):
+        for position in range(len(self)):
+            yield self[position]
+
+    def get(self, **key):
+        """Returns the one recording whose metadata matches all of `key`."""
+        matches = np.ones(len(self.index), dtype=bool)
+        for column, value in key.items():
+            matches &= (self.index[column] == value).to_numpy()
+
+        positions = np.flatnonzero(matches)
+        if len(positions) != 1:
+            raise KeyError(f"{len(positions)} recordings match {key}, expected exactly one")
+        return self[positions[0]]
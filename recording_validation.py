@@ -0,0 +1,103 @@
+from dataclasses import dataclass
+
+import numpy as np
+
+from conversion_helpers import JOINTS, joint_frames
+
+
+@dataclass(frozen=True)
+class ValidationRules:
+    """Declares what a converted recording has to satisfy to pass validation; None disables a rule.
+
+    `min_frames` is the minimum number of frames. `max_nan_run` is the longest run of consecutive frames in which a
+    joint column may be NaN (e.g. while a controller lost tracking). `max_time_reversals` is the number of frames
+    whose `delta_time_ms` may be smaller than that of the preceding frame, and `max_gap_ms` the longest time between
+    two frames. `max_stuck_frames` is the longest run of frames in which the position of a joint may stay exactly the
+    same, which real trackers never do because of their noise, but frozen or disconnected ones do. `max_position_cm`
+    is the largest absolute value a position coordinate may take.
+    """
+
+    min_frames: int = 2
+    max_nan_run: int = 90
+    max_time_reversals: int = 0
+    max_gap_ms: float = 1000.0
+    max_stuck_frames: int = 300
+    max_position_cm: float = 1000.0
+
+
+def get_rules(validation):
+    """Returns the `ValidationRules` of the `validation` option: the default rules for True, None for None or False,
+    and rules as they are."""
+    if validation is None or validation is False:
+        return None
+    if validation is True:
+        return ValidationRules()
+    if isinstance(validation, ValidationRules):
+        return validation
+    raise Exception(f"validation must be True, False, None or ValidationRules, not {validation!r}, aborting")
+
+
+def _longest_run(mask, names):
+    # the longest run of consecutive True values in any column of `mask` and the name of that column: with a False
+    # before and after every column, the edges where runs start and end alternate along the flattened columns
+    num_frames, num_columns = mask.shape
+    # most recordings have no such runs at all, which is much cheaper to check than to find the runs
+    if not mask.any():
+        return 0, None
+    padded = np.zeros((num_columns, num_frames + 2), np.int8)
+    padded[:, 1:-1] = mask.T
+    edges = np.flatnonzero(np.diff(padded.ravel()))
+    if not len(edges):
+        return 0, None
+    lengths = edges[1::2] - edges[::2]
+    longest = lengths.argmax()
+    return int(lengths[longest]), names[edges[2 * longest] // (num_frames + 2)]
+
+
+def _exceeds(value, limit):
+    return limit is not None and value > limit
+
+
+def validate(recording, rules=ValidationRules()):
+    """Checks `recording` against `rules` and returns a report of what was found, e.g. `{"frames": 1000,
+    "longest_nan_run": 12, "nan_column": "left_hand_pos_x", ..., "failures": ["max_nan_run"]}`; `failures` lists
+    the rules the recording violates and is empty if it passes.
+
+    All checks are vectorized over the frames and joint columns of the recording, see
+    `benchmarks/validation_overhead.py` for what they cost compared to converting it.
+    """
+    frames, joint_columns = joint_frames(recording)
+    position_joints = [joint for joint in JOINTS if all(f"{joint}_pos_{xyz}" in joint_columns for xyz in "xyz")]
+    report = {"frames": len(recording)}
+
+    report["longest_nan_run"], report["nan_column"] = _longest_run(np.isnan(frames), joint_columns)
+
+    if "delta_time_ms" in recording and len(recording) > 1:
+        intervals = np.diff(recording["delta_time_ms"].to_numpy())
+        report["time_reversals"] = int((intervals < 0).sum())
+        report["largest_gap_ms"] = float(np.nanmax(intervals, initial=0))
+    else:
+        report["time_reversals"], report["largest_gap_ms"] = 0, 0.0
+
+    positions = frames[:, [joint_columns.index(f"{joint}_pos_{xyz}") for joint in position_joints for xyz in "xyz"]]
+    positions = positions.reshape(len(frames), len(position_joints), 3)
+    # a run of n frames with the same position has n - 1 unchanged steps
+    unchanged = (positions[1:] == positions[:-1]).all(axis=-1)
+    longest_unchanged, stuck_joint = _longest_run(unchanged, position_joints)
+    report["longest_stuck_run"] = longest_unchanged + 1 if longest_unchanged else 0
+    report["stuck_joint"] = stuck_joint
+
+    report["out_of_range_frames"] = None
+    if rules.max_position_cm is not None:
+        report["out_of_range_frames"] = int((np.abs(positions) > rules.max_position_cm).any(axis=(1, 2)).sum())
+
+    violations = {
+        "min_frames": rules.min_frames is not None and report["frames"] < rules.min_frames,
+        "max_nan_run": _exceeds(report["longest_nan_run"], rules.max_nan_run),
+        "max_time_reversals": _exceeds(report["time_reversals"], rules.max_time_reversals),
+        "max_gap_ms": _exceeds(report["largest_gap_ms"], rules.max_gap_ms),
+        "max_stuck_frames": _exceeds(report["longest_stuck_run"], rules.max_stuck_frames),
+        "max_position_cm": bool(report["out_of_range_frames"]),
+    }
+    report["failures"] = [rule for rule, violated in violations.items() if violated]
+    return report
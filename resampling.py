@@ -0,0 +1,85 @@
+import numpy as np
+import pandas as pd
+
+from conversion_helpers import JOINTS
+
+# below this angle between two quaternions, slerp is replaced by linear interpolation, which is numerically stable
+# there and deviates from slerp by far less than float32 resolution
+_MIN_SLERP_ANGLE = 1e-6
+
+
+def slerp(q0, q1, t):
+    """Spherically interpolates between the quaternions `q0` and `q1` (arrays of shape `(..., 4)`) at `t`, which is
+    broadcast against `q0[..., 0]`; all frames and joints are interpolated at once.
+
+    As `q` and `-q` describe the same rotation, the interpolation always follows the shorter arc.
+    """
+    dot = (q0 * q1).sum(axis=-1)
+    q1 = np.where((dot < 0)[..., None], -q1, q1)
+    theta = np.arccos(np.clip(np.abs(dot), 0, 1))
+    sin_theta = np.sin(theta)
+
+    small = theta < _MIN_SLERP_ANGLE
+    sin_theta[small] = 1
+    w0 = np.where(small, 1 - t, np.sin((1 - t) * theta) / sin_theta)
+    w1 = np.where(small, t, np.sin(t * theta) / sin_theta)
+    return w0[..., None] * q0 + w1[..., None] * q1
+
+
+def _position_columns(columns):
+    return [f"{joint}_pos_{xyz}" for joint in JOINTS for xyz in "xyz" if f"{joint}_pos_{xyz}" in columns]
+
+
+def _rotation_columns(columns):
+    return [[f"{joint}_rot_{xyzw}" for xyzw in "xyzw"] for joint in JOINTS if f"{joint}_rot_w" in columns]
+
+
+def resample(recording, rate_hz):
+    """Resamples `recording` to `rate_hz` frames per second, starting at its first frame.
+
+    The frame times are taken from `delta_time_ms`. The position columns of all joints are interpolated linearly and
+    their quaternions with slerp; all other columns (e.g. metadata, or flags like the `drawing` column of BOXRR-23)
+    take the value of the preceding frame. `delta_time_ms` then holds the new frame times as floats.
+    """
+    if len(recording) < 2:
+        return recording
+
+    times = recording["delta_time_ms"].to_numpy(np.float64)
+    if np.isnan(times).any() or (np.diff(times) < 0).any():
+        raise Exception("delta_time_ms has to be increasing to resample a recording, aborting")
+
+    period_ms = 1000 / rate_hz
+    num_frames = int(np.floor((times[-1] - times[0]) / period_ms + 1e-9)) + 1
+    new_times = times[0] + np.arange(num_frames) * period_ms
+
+    # every new frame lies between the original frames `previous` and `previous + 1`, at `alpha` of the way
+    previous = np.clip(np.searchsorted(times, new_times, side="right") - 1, 0, len(times) - 2)
+    durations = times[previous + 1] - times[previous]
+    alpha = np.divide(new_times - times[previous], durations, out=np.zeros(num_frames), where=durations > 0)
+
+    linear_columns = _position_columns(recording.columns)
+    rotation_columns = _rotation_columns(recording.columns)
+    interpolated = set(linear_columns) | set(sum(rotation_columns, [])) | {"delta_time_ms"}
+    held_columns = [column for column in recording.columns if column not in interpolated]
+
+    resampled = {"delta_time_ms": new_times}
+
+    if linear_columns:
+        # interpolated in the dtype of the columns, e.g. float32 positions are not widened to float64
+        values = recording[linear_columns].to_numpy()
+        weights = alpha.astype(values.dtype)[:, None]
+        block = values[previous] + weights * (values[previous + 1] - values[previous])
+        resampled |= {column: block[:, i].astype(recording[column].dtype) for i, column in enumerate(linear_columns)}
+
+    if rotation_columns:
+        # (num_frames, num_joints, 4), so that all joints are interpolated in one pass; in float64 even for float32
+        # quaternions, as float32 cannot resolve the small angles between consecutive frames for slerp
+        quaternions = recording[sum(rotation_columns, [])].to_numpy(np.float64).reshape(len(recording), -1, 4)
+        block = slerp(quaternions[previous], quaternions[previous + 1], alpha[:, None]).reshape(num_frames, -1)
+        for i, column in enumerate(sum(rotation_columns, [])):
+            resampled[column] = block[:, i].astype(recording[column].dtype)
+
+    for column in held_columns:
+        resampled[column] = recording[column].to_numpy()[previous + (alpha == 1)]
+
+    return pd.DataFrame({column: resampled[column] for column in recording.columns})
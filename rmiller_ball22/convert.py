@@ -1,4 +1,6 @@
-import warnings
+import io
+from collections import defaultdict
+from functools import partial
 from pathlib import Path
 import sys
 import pandas as pd
@@ -6,7 +8,16 @@ import numpy as np
 from tqdm import tqdm
 
 sys.path.append(str(Path(__file__).parents[1]))
-from conversion_helpers import _convert_coord_system_from_RUB_to_RUF, _convert_m_to_cm
+from conversion_helpers import POSE_DTYPE, RUB_TO_RUF, TransformPlan
+from conversion_pipeline import RecordingHandle, convert_and_store_tasks, prefetch_tasks, shard_tasks, write_recording
+from instrumentation import stage
+
+CONVERTER_VERSION = 1
+
+partition_columns = ["user", "session"]
+metadata_fields = ["system", "user", "session"]
+
+transform_plan = TransformPlan(position_scale=100, flip_axes=RUB_TO_RUF)
 
 column_mapping = {
     "Head_pos_x": "head_pos_x",
@@ -33,76 +44,177 @@ column_mapping = {
 }
 
 
-def load_recordings(dataset_path, system, user, session):
-    all_recordings_by_joint = []
+DEVICES = ["Head", "Left", "Right"]
+# the fields of each row of a recording file, of which the columns of `column_mapping` are taken in their order
+FIELDS = ["pos_x", "pos_y", "pos_z", "rot_w", "rot_x", "rot_y", "rot_z", "trigger"]
+_MAPPED_FIELDS = [FIELDS.index(field) for field in ["pos_x", "pos_y", "pos_z", "rot_x", "rot_y", "rot_z", "rot_w"]]
 
-    for joint in ["Head", "Left", "Right"]:
-        file_name = dataset_path / f"{system}_{user}_{session}_{joint}.csv"
-        column_names = [f"{joint}_pos_{xyz}" for xyz in "xyz"] + [f"{joint}_rot_{xyz}" for xyz in "wxyz"] + ["trigger"]
 
-        # for some files read_csv throws warnings
-        # as it has problems dealing with the seperator lines "****..."
-        with warnings.catch_warnings():
-            warnings.simplefilter("ignore")
-            raw_recording = pd.read_csv(
-                file_name,
-                names=column_names,
-                index_col=False,
-            )
+def _read_repetitions(file_path, dtype=np.float64):
+    """Parses a recording file in one pass over its bytes and returns its frames along with the repetitions in it.
+
+    The repetitions are separated by lines of asterisks; any other row that does not hold all fields separates them
+    as well. Each repetition is returned as its first row number, counted like `pd.read_csv` counts rows (blank
+    lines are skipped, separator lines are not), and the slice of its frames. The frames are parsed as `dtype`.
+    """
+    file_bytes = Path(file_path).read_bytes()
+    raw = np.frombuffer(file_bytes, np.uint8)
+    line_ends = np.flatnonzero(raw == ord("\n"))
+    if len(raw) and raw[-1] != ord("\n"):
+        line_ends = np.append(line_ends, len(raw))
+    line_starts = np.concatenate([[0], line_ends[:-1] + 1]).astype(np.int64)
+    content_ends = line_ends - ((line_ends > line_starts) & (raw[np.maximum(line_ends - 1, 0)] == ord("\r")))
+
+    rows = content_ends > line_starts
+    line_starts, line_ends, content_ends = line_starts[rows], line_ends[rows], content_ends[rows]
+
+    # a data row has all fields, i.e. the right number of commas, none of them at the start, end or next to another
+    commas = np.flatnonzero(raw == ord(","))
+    adjacent_commas = commas[np.flatnonzero(np.diff(commas) == 1)]
+    is_data = (
+        (np.searchsorted(commas, content_ends) - np.searchsorted(commas, line_starts) == len(FIELDS) - 1)
+        & (np.searchsorted(adjacent_commas, content_ends) == np.searchsorted(adjacent_commas, line_starts))
+        & (raw[line_starts] != ord(","))
+        & (raw[content_ends - 1] != ord(","))
+    )
+
+    # every row that is not a data row starts a new group, whose data rows form one repetition
+    groups = np.cumsum(~is_data)
+    data_rows = np.flatnonzero(is_data)
+    starts = np.flatnonzero(np.diff(groups[data_rows], prepend=-1))
+    stops = np.append(starts[1:], len(data_rows))
+
+    # the data rows of each repetition are contiguous in the file, so all of them are parsed at once
+    data = b"".join(
+        file_bytes[line_starts[data_rows[start]] : line_ends[data_rows[stop - 1]] + 1]
+        for start, stop in zip(starts, stops)
+    )
+    frames = (
+        np.loadtxt(io.BytesIO(data), delimiter=",", ndmin=2, dtype=dtype)
+        if data
+        else np.empty((0, len(FIELDS)), dtype=dtype)
+    )
+
+    # like before, a repetition needs two rows including its separator, so a first one without separator needs two frames
+    keep = stops - starts + (groups[data_rows[starts]] > 0) > 1
+    return frames, [(data_rows[start], slice(start, stop)) for start, stop in zip(starts[keep], stops[keep])]
+
+
+def _align_repetition(frames_by_device, repetition_by_device):
+    columns = list(column_mapping.values())
+    num_columns = len(_MAPPED_FIELDS)
+    first_rows = [first_row for first_row, _rows in repetition_by_device]
+    device_frames = [
+        frames[rows][:, _MAPPED_FIELDS] for frames, (_first_row, rows) in zip(frames_by_device, repetition_by_device)
+    ]
+
+    if len(set(first_rows)) > 1 or len({len(frames) for frames in device_frames}) > 1:
+        # the rows of the devices are matched by their row numbers, which only differ for malformed files
+        return pd.concat(
+            [
+                pd.DataFrame(
+                    frames,
+                    columns=columns[device * num_columns : (device + 1) * num_columns],
+                    index=pd.RangeIndex(first_row, first_row + len(frames)),
+                )
+                for device, (first_row, frames) in enumerate(zip(first_rows, device_frames))
+            ],
+            axis=1,
+        )
+
+    block = np.empty((len(device_frames[0]), len(columns)), dtype=device_frames[0].dtype)
+    for device, frames in enumerate(device_frames):
+        block[:, device * num_columns : (device + 1) * num_columns] = frames
+    index = pd.RangeIndex(first_rows[0], first_rows[0] + len(block))
+    return pd.DataFrame(block, columns=columns, index=index, copy=False)
 
-        joint_recordings = [
-            df.dropna() for _, df in raw_recording.groupby(raw_recording.isna().any(axis=1).cumsum()) if len(df) > 1
-        ]
 
-        all_recordings_by_joint.append(joint_recordings)
+def _load_recordings(recording_files, dtype=POSE_DTYPE):
+    frames_by_device, repetitions_by_device = [], []
+    for recording_file in recording_files:
+        with stage("read", recording_file) as measurement:
+            frames, repetitions = _read_repetitions(recording_file, dtype)
+            measurement.rows = len(frames)
+        frames_by_device.append(frames)
+        repetitions_by_device.append(repetitions)
+
+    with stage("parse"):
+        # repetitions without a counterpart for every device are dropped
+        return [
+            _align_repetition(frames_by_device, repetition_by_device)
+            for repetition_by_device in zip(*repetitions_by_device)
+        ]
 
-    all_recordings = []
-    for rs in zip(*all_recordings_by_joint):
-        all_recordings.append(pd.concat(rs, axis=1).rename(columns=column_mapping)[column_mapping.values()].astype("float"))
 
-    return all_recordings
+def load_recordings(dataset_path, system, user, session, dtype=POSE_DTYPE):
+    recording_files = [Path(dataset_path) / f"{system}_{user}_{session}_{device}.csv" for device in DEVICES]
+    return _load_recordings(recording_files, dtype)
 
 
 def convert_recording(recording):
     fps = len(recording) // 3
-    converted_recording = (
-        recording.pipe(_convert_m_to_cm)
-        .pipe(_convert_coord_system_from_RUB_to_RUF)
-        .assign(delta_time_ms=lambda df: np.arange(len(df)) * (1000 / fps))
+    converted_recording = recording.pipe(transform_plan.apply).assign(
+        delta_time_ms=lambda df: np.arange(len(df)) * (1000 / fps)
     )
 
     return converted_recording
 
 
-def convert(dataset_path: str):
-    dataset_path = Path(dataset_path) / "VR Motions"
+def _sessions(dataset_path):
+    # the file index is built once: the recording files of each (system, user, session), ordered like DEVICES
+    recording_files = defaultdict(dict)
+    for recording_file in dataset_path.glob("*.csv"):
+        system, user, session, device = recording_file.stem.split("_")
+        recording_files[system, user, session][device] = recording_file
 
-    data_overview = (
-        pd.DataFrame(
-            [f.stem.split("_") for f in dataset_path.glob("*.csv")],
-            columns=["system", "user", "session", "device"],
-        )[["system", "user", "session"]]
-        .drop_duplicates()
-        .sort_values(["user", "system", "session"])
-        .reset_index(drop=True)
-    )
+    sessions = []
+    for system, user, session in sorted(recording_files, key=lambda key: (key[1], key[0], key[2])):
+        files, stem = recording_files[system, user, session], f"{system}_{user}_{session}"
+        # a missing file only fails the conversion of its session
+        sessions.append(
+            (system, user, session, [files.get(device, dataset_path / f"{stem}_{device}.csv") for device in DEVICES])
+        )
+    return sessions
+
+
+def _describe_session(session_info):
+    system, user, session, recording_files = session_info
+    return f"{system}_{user}_{session}", recording_files
 
-    for _idx, row in tqdm(data_overview.iterrows(), total=len(data_overview)):
-        system, user, session = row
-        recordings = load_recordings(dataset_path, system, user, session)
+
+def _convert_session(session_info, dtype=POSE_DTYPE):
+    system, user, session, recording_files = session_info
+    recordings = _load_recordings(recording_files, dtype)
+    with stage("transform"):
         converted_recordings = [convert_recording(rec) for rec in recordings]
 
-        for repetition, recording in enumerate(converted_recordings):
-            yield recording, (system, user, session, repetition)
+    for repetition, recording in enumerate(converted_recordings):
+        yield recording, (system, user, session, repetition)
 
 
-def convert_and_store(dataset_path, output_path, format="csv"):
-    output_path = Path(output_path)
+def convert(dataset_path: str, prefetch=0, shard_index=0, num_shards=1, dtype=POSE_DTYPE):
+    dataset_path = Path(dataset_path) / "VR Motions"
+
+    # with `prefetch`, the files of the next sessions are read ahead while the current one is converted
+    sessions = shard_tasks(_sessions(dataset_path), shard_index, num_shards, describe_task=_describe_session)
+    for session_info in tqdm(prefetch_tasks(sessions, prefetch, describe_task=_describe_session), total=len(sessions)):
+        yield from _convert_session(session_info, dtype)
 
-    output_path.mkdir(parents=True, exist_ok=True)
-    for recording, (system, user, session, repetition) in convert(dataset_path):
-        output_file_path = output_path / f"{system}_{user}_{session}_{repetition}"
 
+def discover(dataset_path: str, dtype=POSE_DTYPE):
+    # the repetitions of a session are only known after parsing its files, so each handle stands for a whole session
+    convert_session = partial(_convert_session, dtype=dtype)
+    return [
+        RecordingHandle(session_info, dict(zip(metadata_fields, session_info[:3])), convert_session)
+        for session_info in _sessions(Path(dataset_path) / "VR Motions")
+    ]
+
+
+def _store_recording(recording, metadata, output_path, format, **write_options):
+    system, user, session, repetition = metadata
+    output_file_path = output_path / f"{system}_{user}_{session}_{repetition}"
+
+    with stage("metadata"):
         recording = recording.assign(
             system=system,
             user=user,
@@ -110,13 +222,38 @@ def convert_and_store(dataset_path, output_path, format="csv"):
             repetition=repetition,
         )
 
-        match format.lower():
-            case "csv":
-                recording.round(3).to_csv(output_file_path.with_suffix(".csv"), index=False)
-            case "parquet":
-                recording.to_parquet(output_file_path.with_suffix(".parquet"))
-            case _:
-                raise Exception("unkown output format, aborting")
+    return write_recording(recording, output_file_path, format, **write_options)
+
+
+def convert_and_store(
+    dataset_path,
+    output_path,
+    format="csv",
+    handles=None,
+    shard_index=0,
+    num_shards=1,
+    dtype=POSE_DTYPE,
+    **pipeline_options,
+):
+    dataset_path = Path(dataset_path) / "VR Motions"
+    output_path = Path(output_path)
+
+    output_path.mkdir(parents=True, exist_ok=True)
+    tasks = _sessions(dataset_path) if handles is None else [handle.task for handle in handles]
+    convert_and_store_tasks(
+        shard_tasks(tasks, shard_index, num_shards, describe_task=_describe_session),
+        partial(_convert_session, dtype=dtype),
+        _store_recording,
+        output_path,
+        format,
+        describe_task=_describe_session,
+        converter_version=CONVERTER_VERSION,
+        partition_columns=partition_columns,
+        options={"dtype": dtype},
+        shard_index=shard_index,
+        num_shards=num_shards,
+        **pipeline_options,
+    )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,109 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow.dataset as ds
+
+sys.path.append(str(Path(__file__).parents[1]))
+import conversion_pipeline
+from conversion_pipeline import QUARANTINE_DIR_NAME, convert_and_store_tasks, write_recording
+
+
+def _write_sources(source_path, names):
+    # one source file per recording, whose name is the user and session of the recording
+    source_path.mkdir(parents=True, exist_ok=True)
+    for name in names:
+        (source_path / f"{name}.txt").write_text(name)
+    return sorted(source_path.glob("*.txt"))
+
+
+def _convert_source(source_file, num_frames=50):
+    user, session = source_file.stem.split("_")
+    recording = pd.DataFrame(
+        {
+            "delta_time_ms": np.arange(num_frames) * 10.0,
+            "head_pos_x": np.full(num_frames, float(len(session)), np.float32),
+        }
+    )
+    if session == "reversed":
+        # one frame goes back in time
+        recording.loc[25, "delta_time_ms"] = 0.0
+    yield recording, (user, session)
+
+
+def _store_recording(recording, metadata, output_path, format, **write_options):
+    user, session = metadata
+    recording = recording.assign(user=user, session=session)
+    return write_recording(recording, output_path / f"{user}_{session}", format, **write_options)
+
+
+def _convert_to_parquet_dataset(source_files, output_path, **pipeline_options):
+    convert_and_store_tasks(
+        source_files,
+        _convert_source,
+        _store_recording,
+        output_path,
+        "parquet_dataset",
+        partition_columns=["user"],
+        **pipeline_options,
+    )
+
+
+def _parquet_dataset(output_path):
+    return ds.dataset(output_path, format="parquet", partitioning="hive")
+
+
+def test_parquet_dataset_compacts_partitions(tmp_path, monkeypatch):
+    source_files = _write_sources(tmp_path / "source", ["a_1", "a_22", "a_333", "b_1"])
+    # two recordings per file at most
+    monkeypatch.setattr(conversion_pipeline, "PARQUET_DATASET_FILE_ROWS", 100)
+
+    _convert_to_parquet_dataset(source_files, tmp_path / "output")
+
+    dataset = _parquet_dataset(tmp_path / "output")
+    assert sorted(Path(file).relative_to(tmp_path / "output").as_posix() for file in dataset.files) == [
+        "user=a/part-0.parquet",
+        "user=a/part-1.parquet",
+        "user=b/part-0.parquet",
+    ]
+    table = dataset.to_table().to_pandas()
+    assert len(table) == 4 * 50
+    recordings = table.groupby("recording", observed=True)
+    assert sorted(recordings.groups) == ["a_1", "a_22", "a_333", "b_1"]
+    for recording_name, recording in recordings:
+        user, session = recording_name.split("_")
+        assert (recording["user"] == user).all() and (recording["session"] == session).all()
+        assert (recording["head_pos_x"] == len(session)).all()
+
+    # with larger files, the partition of user a fits into one file, and the second one is removed
+    monkeypatch.setattr(conversion_pipeline, "PARQUET_DATASET_FILE_ROWS", 1000)
+    _convert_to_parquet_dataset(source_files, tmp_path / "output", incremental=False)
+
+    dataset = _parquet_dataset(tmp_path / "output")
+    assert sorted(Path(file).relative_to(tmp_path / "output").as_posix() for file in dataset.files) == [
+        "user=a/part-0.parquet",
+        "user=b/part-0.parquet",
+    ]
+    assert dataset.count_rows() == 4 * 50
+
+
+def test_quarantined_recordings_are_stored_without_resampling(tmp_path):
+    source_files = _write_sources(tmp_path / "source", ["a_1", "a_reversed"])
+
+    convert_and_store_tasks(
+        source_files,
+        _convert_source,
+        _store_recording,
+        tmp_path / "output",
+        "csv",
+        validation=True,
+        quarantine=True,
+        resample_hz=50,
+    )
+
+    # 50 frames at 100 Hz, i.e. 490 ms, resampled to 50 Hz
+    assert len(pd.read_csv(tmp_path / "output" / "a_1.csv")) == 25
+    quarantined = pd.read_csv(tmp_path / "output" / QUARANTINE_DIR_NAME / "a_reversed.csv")
+    assert len(quarantined) == 50 and quarantined["delta_time_ms"][25] == 0
+    assert not (tmp_path / "output" / "a_reversed.csv").exists()
@@ -0,0 +1,52 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(str(Path(__file__).parents[1]))
+from liebers_beat_saber23.convert import (
+    _convert_session,
+    _convert_session_rows,
+    _load_dataset,
+    _session_rows,
+    _SessionStream,
+    column_mapping,
+    dataset_file_name,
+)
+
+
+def _write_dataset(dataset_path, session_order):
+    # one row per entry of `session_order`, with the row number in every value column to tell the rows apart
+    rows = np.arange(len(session_order), dtype=np.float64)
+    data = {column: rows for column in column_mapping}
+    data["session-uuid"] = session_order
+    data["user-token"] = [f"user-{session}" for session in session_order]
+    pd.DataFrame(data).to_csv(Path(dataset_path) / dataset_file_name, index=False)
+
+
+def test_session_stream_keeps_spilled_sessions_apart(tmp_path):
+    # with a budget of 0, every incomplete session is spilled after each chunk of 3 rows: A, B and C are spilled
+    # after the first chunk, A completes in the second one, and D is spilled while B and C still are
+    _write_dataset(tmp_path, ["A", "B", "C", "A", "D", "B", "C", "D", "B"])
+
+    streamed = dict(iter(_SessionStream(tmp_path, memory_budget_mb=0, chunksize=3, spill_path=tmp_path)))
+
+    expected = dict(iter(_load_dataset(tmp_path).groupby("session-uuid")))
+    assert sorted(streamed) == sorted(expected)
+    for session, df in expected.items():
+        pd.testing.assert_frame_equal(streamed[session], df)
+
+
+def test_session_rows_convert_like_session_groups(tmp_path):
+    # the sessions interleave, so the rows of a session also hold rows of others
+    _write_dataset(tmp_path, ["A", "B", "A", "C", "C", "B", "D"])
+
+    session_rows = _session_rows(tmp_path, chunksize=3)
+
+    assert session_rows == [("A", range(0, 3)), ("B", range(1, 6)), ("C", range(3, 5)), ("D", range(6, 7))]
+    for session_group, rows in zip(_load_dataset(tmp_path).groupby("session-uuid"), session_rows):
+        ((expected, expected_metadata),) = _convert_session(session_group)
+        ((recording, metadata),) = _convert_session_rows(rows, tmp_path)
+        assert metadata == expected_metadata
+        pd.testing.assert_frame_equal(recording.reset_index(drop=True), expected.reset_index(drop=True))
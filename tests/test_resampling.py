@@ -0,0 +1,32 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(str(Path(__file__).parents[1]))
+from resampling import resample
+
+
+def test_resample_holds_columns_other_than_positions_and_rotations():
+    # like a Tilt Brush recording of BOXRR-23, with a 0/1 `drawing` flag, at 10 Hz
+    recording = pd.DataFrame(
+        {
+            "delta_time_ms": np.arange(5) * 100.0,
+            "right_hand_pos_x": np.arange(5, dtype=np.float32),
+            "right_hand_rot_x": np.zeros(5),
+            "right_hand_rot_y": np.zeros(5),
+            "right_hand_rot_z": np.zeros(5),
+            "right_hand_rot_w": np.ones(5),
+            "drawing": np.array([0, 1, 1, 0, 1], dtype=np.float32),
+            "user": "a",
+        }
+    )
+
+    resampled = resample(recording, 40)
+
+    np.testing.assert_array_equal(resampled["delta_time_ms"], np.arange(17) * 25.0)
+    np.testing.assert_array_equal(resampled["right_hand_pos_x"], np.arange(17, dtype=np.float32) / 4)
+    np.testing.assert_array_equal(resampled["drawing"], np.repeat(recording["drawing"], [4, 4, 4, 4, 1]))
+    assert resampled["drawing"].dtype == np.float32
+    assert (resampled["user"] == "a").all()
@@ -1,14 +1,24 @@
+import dataclasses
+from functools import partial
 from pathlib import Path
 import sys
 import pandas as pd
 from tqdm import tqdm
 import numpy as np
-import pandas as pd
 from scipy.spatial.transform import Rotation
-from datetime import datetime
 
 sys.path.append(str(Path(__file__).parents[1]))
-from conversion_helpers import _convert_m_to_cm
+from conversion_helpers import POSE_DTYPE, TransformPlan
+from conversion_pipeline import RecordingHandle, convert_and_store_tasks, prefetch_tasks, shard_tasks, write_recording
+from csv_recordings import read_csv
+from instrumentation import stage
+
+CONVERTER_VERSION = 1
+
+partition_columns = ["user", "session"]
+metadata_fields = ["game", "recording_name"]
+
+transform_plan = TransformPlan(position_scale=100)
 
 columns = [
     "head_pos_x",
@@ -40,83 +50,138 @@ joints = [
     "right_hand",
 ]
 
+column_types = {
+    "timestamp": "int64",
+    "device_id": "int64",
+    "framecounter": "int64",
+    "deviceToAbsoluteTracking": "str",
+}
+
+
+def _parse_tracking_matrices(tracking):
+    # each entry holds the upper 3x4 block of a row-major 4x4 transformation matrix as 12 space-separated floats
+    values = np.array(" ".join(tracking).split(), dtype=np.float64)
+    assert values.size == len(tracking) * 12, "unexpected number of values in deviceToAbsoluteTracking"
+    return values.reshape(len(tracking), 3, 4)
+
 
-def load_and_convert_recording(file_path):
-    df = pd.read_csv(file_path).sort_values(["timestamp", "device_id"])
+def load_and_convert_recording(file_path, dtype=POSE_DTYPE):
+    with stage("read", file_path) as measurement:
+        df = read_csv(file_path, column_types, columns=list(column_types))
+        measurement.rows = len(df)
 
-    origin = [0, 0, 0, 1]
+    with stage("parse"):
+        df = df.sort_values(["timestamp", "device_id"])
 
-    frames_np = np.zeros((df["framecounter"].max() + 1, len(columns)))
-    frames_np[:] = np.nan
-    timestamps = np.zeros(len(frames_np), dtype=datetime)
-    timestamps[:] = np.nan
+        num_frames = df["framecounter"].max() + 1
+        df = df[df["timestamp"].astype(bool)]
+        assert df["device_id"].between(0, len(joints) - 1).all(), f"unexpected device_id in {file_path}"
 
-    for _, row in df.iterrows():
-        if not row["timestamp"]:
-            continue
-        points = list(map(float, row["deviceToAbsoluteTracking"].split()))
+        # when a frame (or a frame/device pair) occurs more than once, the last sample in timestamp order wins
+        samples = df[~df.duplicated(["framecounter", "device_id"], keep="last")]
+        frame_times = df[~df.duplicated("framecounter", keep="last")]
 
-        t_mat = np.array(
-            [
-                [points[0], points[1], points[2], points[3]],
-                [points[4], points[5], points[6], points[7]],
-                [points[8], points[9], points[10], points[11]],
-                [0, 0, 0, 1],
-            ]
+        t_mats = _parse_tracking_matrices(samples["deviceToAbsoluteTracking"].to_numpy())
+        positions = t_mats[:, :, 3]
+        rotations = Rotation.from_matrix(t_mats[:, :, :3]).as_quat()
+
+        frames_np = np.full((num_frames, len(joints), 7), np.nan)
+        frames_np[samples["framecounter"].to_numpy(), samples["device_id"].to_numpy()] = np.concatenate(
+            [positions, rotations], axis=1
+        )
+        frames_np = frames_np.reshape(num_frames, len(columns))
+
+        timestamps = np.full(num_frames, np.nan)
+        timestamps[frame_times["framecounter"].to_numpy()] = frame_times["timestamp"].to_numpy() / 1000
+
+        recording = (
+            pd.DataFrame(frames_np, columns=columns)
+            .assign(timestamp=pd.to_timedelta(timestamps - np.nanmin(timestamps), unit="s"))
+            .dropna(subset="timestamp")
+            .set_index("timestamp")
+            .interpolate(method="time")
+            .assign(delta_time_ms=lambda df: (df.index.total_seconds() * 1000).round().astype(int))
         )
-        position = np.matmul(t_mat, origin)
-        rotation = Rotation.from_matrix(t_mat[0:3, 0:3]).as_quat()
-
-        device_id = row["device_id"]
-        frame_idx = row["framecounter"]
-        timestamps[frame_idx] = row["timestamp"] / 1000
-        frames_np[frame_idx, device_id * 7 : (device_id + 1) * 7] = np.concatenate([position[:3], rotation])
-
-    recording = (
-        pd.DataFrame(frames_np, columns=columns)
-        .assign(timestamp=pd.to_timedelta(timestamps - np.nanmin(timestamps), unit="s"))
-        .dropna(subset="timestamp")
-        .set_index("timestamp")
-        .interpolate(method="time")
-        .assign(delta_time_ms=lambda df: (df.index.total_seconds() * 1000).round().astype(int))
-        .pipe(_convert_m_to_cm)
-        .dropna()
-        .reset_index(drop=True)
-    )
+
+    with stage("transform"):
+        # the poses are parsed and interpolated as float64 and only narrowed to `dtype` by the transform
+        plan = dataclasses.replace(transform_plan, dtype=dtype)
+        recording = recording.pipe(plan.apply).dropna().reset_index(drop=True)
 
     assert len(recording) > 10, "replay is too short"
 
     return recording
 
 
-def convert(dataset_path):
-    for recording_file in tqdm(list(dataset_path.glob("*/*/pose.csv"))):
-        recording = load_and_convert_recording(recording_file)
-        game, recording_name = recording_file.parts[-3:-1]
+def _recording_files(dataset_path):
+    return list(Path(dataset_path).glob("*/*/pose.csv"))
+
+
+def _file_metadata(recording_file):
+    game, recording_name = recording_file.parts[-3:-1]
+    return game, recording_name
+
+
+def _convert_file(recording_file, dtype=POSE_DTYPE):
+    recording = load_and_convert_recording(recording_file, dtype)
+    game, recording_name = _file_metadata(recording_file)
+    with stage("metadata"):
         recording["session"] = game
         recording["user"] = recording_name.split(" ")[0]
 
-        yield recording, (game, recording_name)
+    yield recording, (game, recording_name)
+
+
+def convert(dataset_path, prefetch=0, shard_index=0, num_shards=1, dtype=POSE_DTYPE):
+    recording_files = shard_tasks(_recording_files(dataset_path), shard_index, num_shards)
+    for recording_file in tqdm(prefetch_tasks(recording_files, prefetch), total=len(recording_files)):
+        yield from _convert_file(recording_file, dtype)
+
+
+def discover(dataset_path, dtype=POSE_DTYPE):
+    convert_file = partial(_convert_file, dtype=dtype)
+    return [
+        RecordingHandle(recording_file, dict(zip(metadata_fields, _file_metadata(recording_file))), convert_file)
+        for recording_file in _recording_files(dataset_path)
+    ]
 
 
-def convert_and_store(dataset_path, output_path, format="csv"):
+def _store_recording(recording, metadata, output_path, format, **write_options):
+    game, recording_name = metadata
+    output_file_path = output_path / f"{game}_{recording_name}"
+
+    return write_recording(recording, output_file_path, format, **write_options)
+
+
+def convert_and_store(
+    dataset_path,
+    output_path,
+    format="csv",
+    handles=None,
+    shard_index=0,
+    num_shards=1,
+    dtype=POSE_DTYPE,
+    **pipeline_options,
+):
     dataset_path = Path(dataset_path)
     output_path = Path(output_path)
 
     output_path.mkdir(parents=True, exist_ok=True)
 
-    for recording, (game, recording_name) in convert(dataset_path):
-        output_file_path = output_path / f"{game}_{recording_name}"
-
-        output_file_path.parents[0].mkdir(exist_ok=True, parents=True)
-
-        match format.lower():
-            case "csv":
-                recording.round(3).to_csv(output_file_path.with_suffix(".csv"), index=False)
-            case "parquet":
-                recording.to_parquet(output_file_path.with_suffix(".parquet"))
-            case _:
-                raise Exception("unkown output format, aborting")
+    tasks = _recording_files(dataset_path) if handles is None else [handle.task for handle in handles]
+    convert_and_store_tasks(
+        shard_tasks(tasks, shard_index, num_shards),
+        partial(_convert_file, dtype=dtype),
+        _store_recording,
+        output_path,
+        format,
+        converter_version=CONVERTER_VERSION,
+        partition_columns=partition_columns,
+        options={"dtype": dtype},
+        shard_index=shard_index,
+        num_shards=num_shards,
+        **pipeline_options,
+    )
 
 
 if __name__ == "__main__":
@@ -1,9 +1,18 @@
+from functools import partial
 from pathlib import Path
 import sys
-import pandas as pd
 from tqdm import tqdm
 
 sys.path.append(str(Path(__file__).parents[1]))
+from conversion_helpers import POSE_DTYPE, source_column_types
+from conversion_pipeline import RecordingHandle, convert_and_store_tasks, prefetch_tasks, shard_tasks, write_recording
+from csv_recordings import read_csv
+from instrumentation import stage
+
+CONVERTER_VERSION = 1
+
+partition_columns = ["user", "session"]
+metadata_fields = ["player_id", "session"]
 
 JOINTS = ["head", "left_hand", "right_hand"]
 
@@ -33,35 +42,81 @@ column_mapping = {
 }
 
 
-def convert(dataset_path):
-    dataset_path = Path(dataset_path)
+def _recording_files(dataset_path):
+    return [
+        recording_file
+        for recording_file in Path(dataset_path).glob("players/*/*/vr-controllers*.csv")
+        # skipping this, as there is just one case where there is more than one recording per session
+        if recording_file.stem[-1] != "2"
+    ]
 
-    for recording_file in tqdm(list(dataset_path.glob("players/*/*/vr-controllers*.csv"))):
-        player_id, session = recording_file.parts[-3:-1]
-        if recording_file.stem[-1] == "2":
-            continue  # skipping this, as there is just one case where there is more than one recording per session
 
-        recording = pd.read_csv(recording_file).rename(columns=column_mapping)[column_mapping.values()]
-        assert recording.select_dtypes(include=[object]).shape[1] == 0, "DataFrame contains non-numeric columns"
+def _file_metadata(recording_file):
+    player_id, session = recording_file.parts[-3:-1]
+    return player_id, session
 
-        yield recording, (player_id, session)
 
+def _convert_file(recording_file, dtype=POSE_DTYPE):
+    player_id, session = _file_metadata(recording_file)
 
-def convert_and_store(dataset_path, output_path, format="csv"):
-    output_path = Path(output_path)
+    with stage("read", recording_file) as measurement:
+        recording = read_csv(recording_file, source_column_types(column_mapping, dtype), columns=list(column_mapping))
+        measurement.rows = len(recording)
+    with stage("parse"):
+        recording = recording.rename(columns=column_mapping)[column_mapping.values()]
 
-    output_path.mkdir(parents=True, exist_ok=True)
+    yield recording, (player_id, session)
+
+
+def convert(dataset_path, prefetch=0, shard_index=0, num_shards=1, dtype=POSE_DTYPE):
+    recording_files = shard_tasks(_recording_files(dataset_path), shard_index, num_shards)
+    for recording_file in tqdm(prefetch_tasks(recording_files, prefetch), total=len(recording_files)):
+        yield from _convert_file(recording_file, dtype)
+
+
+def discover(dataset_path, dtype=POSE_DTYPE):
+    convert_file = partial(_convert_file, dtype=dtype)
+    return [
+        RecordingHandle(recording_file, dict(zip(metadata_fields, _file_metadata(recording_file))), convert_file)
+        for recording_file in _recording_files(dataset_path)
+    ]
 
-    for recording, (player_id, session) in convert(dataset_path):
+
+def _store_recording(recording, metadata, output_path, format, **write_options):
+    player_id, session = metadata
+    with stage("metadata"):
         recording["user"] = int(player_id)
         recording["session"] = session
-        output_file_path = output_path / f"player_{int(player_id):02d}/{session}"
-
-        output_file_path.parents[0].mkdir(exist_ok=True, parents=True)
-        match format.lower():
-            case "csv":
-                recording.round(3).to_csv(output_file_path.with_suffix(".csv"), index=False)
-            case "parquet":
-                recording.to_parquet(output_file_path.with_suffix(".parquet"))
-            case _:
-                raise Exception("unkown output format, aborting")
+    output_file_path = output_path / f"player_{int(player_id):02d}/{session}"
+
+    return write_recording(recording, output_file_path, format, **write_options)
+
+
+def convert_and_store(
+    dataset_path,
+    output_path,
+    format="csv",
+    handles=None,
+    shard_index=0,
+    num_shards=1,
+    dtype=POSE_DTYPE,
+    **pipeline_options,
+):
+    output_path = Path(output_path)
+
+    output_path.mkdir(parents=True, exist_ok=True)
+
+    tasks = _recording_files(dataset_path) if handles is None else [handle.task for handle in handles]
+    convert_and_store_tasks(
+        shard_tasks(tasks, shard_index, num_shards),
+        partial(_convert_file, dtype=dtype),
+        _store_recording,
+        output_path,
+        format,
+        converter_version=CONVERTER_VERSION,
+        partition_columns=partition_columns,
+        options={"dtype": dtype},
+        shard_index=shard_index,
+        num_shards=num_shards,
+        **pipeline_options,
+    )
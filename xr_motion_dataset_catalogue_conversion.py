@@ -1,17 +1,60 @@
-import boxrr23, liebers_beat_saber23, liebers_hand22, liebers_lab_study21, moore_cross_domain23, rmiller_ball22, vr_net, who_is_alyx
+import argparse
+import importlib
 
-for dset in [
-    liebers_beat_saber23,
-    boxrr23,
-    liebers_hand22,
-    liebers_lab_study21,
-    moore_cross_domain23,
-    rmiller_ball22,
-    vr_net,
-    who_is_alyx,
-]:
-    dset_name = dset.__name__
-    print(f"starting conversion of {dset_name}")
+from conversion_pipeline import merge_shards
+from conversion_scheduler import ConversionScheduler
+
+DATASETS = [
+    "liebers_beat_saber23",
+    "boxrr23",
+    "liebers_hand22",
+    "liebers_lab_study21",
+    "moore_cross_domain23",
+    "rmiller_ball22",
+    "vr_net",
+    "who_is_alyx",
+]
+
+# to spread the conversion over several nodes, run this script on every node with `--num-shards N` and its own
+# `--shard-index` (0 to N - 1), and once all of them are done, run it once more with `--num-shards N --merge`
+parser = argparse.ArgumentParser()
+parser.add_argument("--shard-index", type=int, default=0)
+parser.add_argument("--num-shards", type=int, default=1)
+parser.add_argument("--merge", action="store_true", help="combine the manifests of all shards")
+parser.add_argument("--workers", type=int, default=None, help="number of worker processes (default: one per CPU)")
+parser.add_argument("--memory-budget-mb", type=float, default=None, help="estimated memory of all running tasks")
+parser.add_argument("--dtype", default="float32", choices=["float32", "float64"], help="dtype of the joint columns")
+parser.add_argument("--parquet-profile", help="encoding profile of the Parquet files, see `parquet_profiles.PROFILES`")
+parser.add_argument("--validate", action="store_true", help="check every recording and write a _qa_report.jsonl")
+parser.add_argument("--quarantine", action="store_true", help="store recordings that fail validation in _quarantine")
+args = parser.parse_args()
+
+# all datasets are converted at once in a shared pool of workers, see `ConversionScheduler`
+scheduler = ConversionScheduler(workers=args.workers, memory_budget_mb=args.memory_budget_mb)
+
+for dset_name in DATASETS:
+    if args.merge:
+        print(f"merging the shards of {dset_name}")
+        merge_shards(f"converted_datasets/{dset_name}", args.num_shards)
+        continue
+
+    print(f"collecting the recordings of {dset_name}")
+    # imported only when needed, so that merging does not load the converters and their dependencies
+    dset = importlib.import_module(dset_name)
     dset.convert_and_store(
-        dataset_path=f"original_datasets/{dset_name}", output_path=f"converted_datasets/{dset_name}", format="parquet"
+        dataset_path=f"original_datasets/{dset_name}",
+        output_path=f"converted_datasets/{dset_name}",
+        format="parquet",
+        shard_index=args.shard_index,
+        num_shards=args.num_shards,
+        dtype=args.dtype,
+        parquet_profile=args.parquet_profile,
+        validation=args.validate or args.quarantine,
+        quarantine=args.quarantine,
+        # the normalization statistics, durations, frame rates and users of the catalogue, see `recording_statistics`
+        statistics=True,
+        scheduler=scheduler,
     )
+
+if not args.merge:
+    scheduler.run()